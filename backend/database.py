@@ -2,9 +2,128 @@ import sqlite3
 from pathlib import Path
 from contextlib import contextmanager
 import os
+import threading
+import weakref
 
 DB_PATH = Path(os.environ.get("DB_PATH", "/data/plex-dedup.db"))
 
+# Columns added to existing tables after their first release. init_db() adds any
+# that are missing so databases created by older versions keep working.
+MIGRATIONS = {
+    "tracks": {
+        "mtime_ns": "INTEGER",
+        "inode": "INTEGER",
+        "norm_artist": "TEXT",
+        "norm_title": "TEXT",
+        "norm_album": "TEXT",
+        "quality_score": "INTEGER",
+        # Tag-independent audio hash (see tag_reader); "" if the format has none,
+        # NULL for rows scanned before it was stored
+        "audio_hash": "TEXT",
+    },
+    "dupe_groups": {
+        "group_key": "TEXT",
+    },
+}
+
+# Normalized tags duplicates are grouped on (see dedup.grouping_key); a metadata
+# group's key is these values joined by GROUP_KEY_SEP
+NORM_COLUMNS = ("norm_artist", "norm_title", "norm_album")
+GROUP_KEY_SEP = "\x1f"
+# tracks columns the API returns: the fingerprint BLOB can't be sent as JSON,
+# and the scan and grouping bookkeeping columns mean nothing to a client
+API_TRACK_COLUMNS = (
+    "id", "file_path", "file_size", "format", "bitrate", "bit_depth", "sample_rate", "duration",
+    "artist", "album_artist", "album", "title", "track_number", "disc_number", "quality_score",
+    "scanned_at", "status",
+)
+# Keys that can identify a recording: a title plus an artist or album (see dedup.usable_key)
+USABLE_KEY_SQL = "{row}.norm_title != '' AND ({row}.norm_artist != '' OR {row}.norm_album != '')"
+
+# Indexes and triggers on migrated columns, created once those columns exist.
+# The triggers queue every change that can alter a duplicate group (a track
+# entering or leaving the active set, a new grouping key, or a field used to
+# rank members) so analysis only revisits what changed, whoever wrote it.
+# fingerprint_postings is the persistent inverted index of fingerprint keys
+# (see dedup.fingerprint_keys; a NULL key marks a track too short to index),
+# refreshed by the analysis for the tracks it claims.
+_TRACKED_FIELDS = (
+    "norm_artist", "norm_title", "norm_album", "format", "bitrate", "bit_depth",
+    "sample_rate", "duration", "fingerprint", "audio_hash",
+)
+_GROUP_KEY_EXPR = (
+    "IFNULL({row}.norm_artist, '') || char(31) || IFNULL({row}.norm_title, '')"
+    " || char(31) || IFNULL({row}.norm_album, '')"
+)
+DUPE_TRACKING_SQL = f"""
+    CREATE INDEX IF NOT EXISTS idx_tracks_norm_key ON tracks(norm_artist, norm_title, norm_album);
+    CREATE INDEX IF NOT EXISTS idx_tracks_quality ON tracks(quality_score);
+    CREATE INDEX IF NOT EXISTS idx_tracks_audio_hash ON tracks(audio_hash);
+    CREATE INDEX IF NOT EXISTS idx_dupe_groups_key ON dupe_groups(group_key);
+    CREATE INDEX IF NOT EXISTS idx_dupe_group_members_track ON dupe_group_members(track_id);
+
+    CREATE TABLE IF NOT EXISTS dupe_dirty_keys (group_key TEXT PRIMARY KEY NOT NULL);
+    CREATE TABLE IF NOT EXISTS dupe_dirty_tracks (track_id INTEGER PRIMARY KEY);
+
+    CREATE TABLE IF NOT EXISTS fingerprint_postings (key INTEGER, track_id INTEGER NOT NULL, pos INTEGER NOT NULL);
+    CREATE INDEX IF NOT EXISTS idx_fingerprint_postings_key ON fingerprint_postings(key);
+    CREATE INDEX IF NOT EXISTS idx_fingerprint_postings_track ON fingerprint_postings(track_id);
+    CREATE INDEX IF NOT EXISTS idx_tracks_fingerprinted ON tracks(id) WHERE length(fingerprint) > 0;
+
+    CREATE TRIGGER IF NOT EXISTS tracks_dupe_insert AFTER INSERT ON tracks
+    WHEN NEW.status IS 'active'
+    BEGIN
+        INSERT OR IGNORE INTO dupe_dirty_keys VALUES ({_GROUP_KEY_EXPR.format(row="NEW")});
+        INSERT OR IGNORE INTO dupe_dirty_tracks VALUES (NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS tracks_dupe_update AFTER UPDATE ON tracks
+    WHEN (OLD.status IS 'active') IS NOT (NEW.status IS 'active')
+        OR {" OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in _TRACKED_FIELDS)}
+    BEGIN
+        INSERT OR IGNORE INTO dupe_dirty_keys VALUES ({_GROUP_KEY_EXPR.format(row="OLD")});
+        INSERT OR IGNORE INTO dupe_dirty_keys VALUES ({_GROUP_KEY_EXPR.format(row="NEW")});
+        INSERT OR IGNORE INTO dupe_dirty_tracks VALUES (NEW.id);
+    END;
+"""
+
+# What is in the trash, kept current by file_manager and reconciled against the
+# disk (see trash_ledger). The triggers maintain a single totals row, so the
+# trash size is one row read however many files it holds.
+TRASH_LEDGER_SQL = """
+    CREATE TABLE IF NOT EXISTS trash_items (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        folder TEXT NOT NULL,
+        trashed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_trash_items_folder ON trash_items(folder);
+    CREATE INDEX IF NOT EXISTS idx_trash_items_trashed_at ON trash_items(trashed_at);
+    CREATE INDEX IF NOT EXISTS idx_file_actions_dest ON file_actions(dest_path);
+
+    CREATE TABLE IF NOT EXISTS trash_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        files INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO trash_totals VALUES (1, 0, 0);
+
+    CREATE TRIGGER IF NOT EXISTS trash_items_insert AFTER INSERT ON trash_items
+    BEGIN
+        UPDATE trash_totals SET files = files + 1, bytes = bytes + NEW.size;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trash_items_delete AFTER DELETE ON trash_items
+    BEGIN
+        UPDATE trash_totals SET files = files - 1, bytes = bytes - OLD.size;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trash_items_resize AFTER UPDATE OF size ON trash_items
+    BEGIN
+        UPDATE trash_totals SET bytes = bytes - OLD.size + NEW.size;
+    END;
+"""
+
 def init_db():
     with get_db() as db:
         db.execute("PRAGMA journal_mode=WAL")
@@ -24,7 +143,9 @@ def init_db():
                 title TEXT,
                 track_number INTEGER,
                 disc_number INTEGER,
-                fingerprint TEXT,
+                fingerprint BLOB,
+                mtime_ns INTEGER,
+                inode INTEGER,
                 scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 status TEXT DEFAULT 'active'
             );
@@ -73,17 +194,168 @@ def init_db():
             CREATE INDEX IF NOT EXISTS idx_tracks_format ON tracks(format);
             CREATE INDEX IF NOT EXISTS idx_upgrade_queue_status ON upgrade_queue(status);
         """)
+        for table, columns in MIGRATIONS.items():
+            _add_missing_columns(db, table, columns)
+        db.executescript(DUPE_TRACKING_SQL)
+        db.executescript(TRASH_LEDGER_SQL)
+        _migrate_text_fingerprints(db)
+        _backfill_grouping_keys(db)
+        _backfill_quality_scores(db)
 
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(str(DB_PATH))
+def _add_missing_columns(db, table: str, columns: dict[str, str]):
+    """ALTER TABLE ADD COLUMN for each column the table doesn't have yet."""
+    existing = {row["name"] for row in db.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def _migrate_text_fingerprints(db):
+    """Convert fingerprints stored as fpcalc's compressed text to raw uint32 BLOBs."""
+    from fingerprint import decode_fingerprint, pack_fingerprint
+
+    rows = db.execute(
+        "SELECT id, fingerprint FROM tracks WHERE typeof(fingerprint) = 'text'"
+    ).fetchall()
+    updates = []
+    for row in rows:
+        try:
+            blob = pack_fingerprint(decode_fingerprint(row["fingerprint"])) or None
+        except ValueError:
+            blob = None
+        updates.append((blob, row["id"]))
+    db.executemany("UPDATE tracks SET fingerprint = ? WHERE id = ?", updates)
+
+def _backfill_grouping_keys(db):
+    """Normalize artist/title/album for rows written before the keys were stored.
+
+    Rows missing an artist or title are rekeyed too, so they pick up keys
+    guessed from their paths. The update trigger queues every changed row, so
+    the next duplicate analysis after an upgrade regroups them once. Existing
+    unresolved metadata groups are given their key so they keep their IDs,
+    and groups on keys that are unusable or too large to group are queued so
+    the next analysis removes them.
+    """
+    from dedup import METADATA_MAX_GROUP, grouping_key, usable_key
+
+    rows = db.execute(
+        "SELECT id, file_path, artist, title, album, norm_artist, norm_title, norm_album FROM tracks"
+        " WHERE norm_artist IS NULL OR norm_artist = '' OR norm_title = ''"
+    ).fetchall()
+    updates = []
+    for r in rows:
+        key = grouping_key(dict(r))
+        if key != (r["norm_artist"], r["norm_title"], r["norm_album"]):
+            updates.append((*key, r["id"]))
+    db.executemany(
+        "UPDATE tracks SET norm_artist = ?, norm_title = ?, norm_album = ? WHERE id = ?", updates
+    )
+    db.execute(f"""
+        UPDATE dupe_groups SET group_key = (
+            SELECT {_GROUP_KEY_EXPR.format(row="t")} FROM dupe_group_members m
+            JOIN tracks t ON t.id = m.track_id
+            WHERE m.group_id = dupe_groups.id LIMIT 1
+        )
+        WHERE group_key IS NULL AND resolved = 0 AND match_type = 'metadata'
+    """)
+    groups = db.execute("""
+        SELECT g.group_key, COUNT(*) AS size FROM dupe_groups g
+        JOIN dupe_group_members m ON m.group_id = g.id
+        WHERE g.resolved = 0 AND g.match_type = 'metadata' AND g.group_key IS NOT NULL
+        GROUP BY g.id
+    """).fetchall()
+    db.executemany("INSERT OR IGNORE INTO dupe_dirty_keys VALUES (?)", [
+        (g["group_key"],) for g in groups
+        if g["size"] > METADATA_MAX_GROUP or not usable_key(tuple(g["group_key"].split(GROUP_KEY_SEP)))
+    ])
+
+def _backfill_quality_scores(db):
+    """Store scanner.quality_score for rows written before the column existed, scored as arrays."""
+    from scanner import quality_scores
+    from track_store import TrackStore
+
+    store = TrackStore.from_cursor(db.execute(
+        "SELECT id, format, bitrate, bit_depth, sample_rate FROM tracks WHERE quality_score IS NULL"
+    ))
+    db.executemany(
+        "UPDATE tracks SET quality_score = ? WHERE id = ?",
+        zip(quality_scores(store).tolist(), store.column("id").tolist())
+    )
+
+# Connections are reused per thread instead of opened per call. Every thread
+# keeps a few idle connections for each mode; a nested get_db() on the same
+# thread gets a connection of its own, so an inner commit or rollback never
+# touches the outer transaction. POOL_MAX_IDLE caps idle connections across
+# all threads, so a large request threadpool can't pin a page cache per
+# thread; past it a released connection is closed instead of kept.
+POOL_IDLE_PER_THREAD = 2
+POOL_MAX_IDLE = 16
+_CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA synchronous=NORMAL",  # durable at checkpoints in WAL mode, no fsync per commit
+    "PRAGMA cache_size=-16384",  # 16 MiB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+)
+_local = threading.local()
+# Every idle connection of every thread; one drops out when its thread exits
+_pooled = weakref.WeakSet()
+_pooled_lock = threading.Lock()
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection, but weakly referenceable so _pooled can track it."""
+
+def _idle_connections(readonly: bool) -> list:
+    """This thread's idle connections to the current DB_PATH, dropping any to an old path or process."""
+    key = (str(DB_PATH), os.getpid())
+    old = getattr(_local, "key", None)
+    if old != key:
+        if old is not None and old[1] == key[1]:
+            for conns in _local.idle.values():
+                for conn in conns:
+                    conn.close()
+        _local.key = key
+        _local.idle = {False: [], True: []}
+    return _local.idle[readonly]
+
+def _connect(readonly: bool) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True, factory=_Connection)
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(str(DB_PATH), factory=_Connection)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys=ON")
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def get_db(readonly: bool = False):
+    """A pooled connection, committed on success and rolled back on error.
+
+    ``readonly`` connections are for API handlers that only read: in WAL mode
+    they read the last committed state without waiting on a writer.
+    """
+    idle = _idle_connections(readonly)
+    if idle:
+        conn = idle.pop()
+        with _pooled_lock:
+            _pooled.discard(conn)
+    else:
+        conn = _connect(readonly)
     try:
         yield conn
         conn.commit()
-    except Exception:
+    except BaseException:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        keep = not conn.in_transaction and len(idle) < POOL_IDLE_PER_THREAD
+        if keep:
+            with _pooled_lock:
+                keep = len(_pooled) < POOL_MAX_IDLE
+                if keep:
+                    _pooled.add(conn)
+        if keep:
+            idle.append(conn)
+        else:
+            conn.close()
@@ -1,34 +1,473 @@
 import re
 import unicodedata
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from typing import Iterable, Sequence
 
+import numpy as np
+
+from fingerprint import similarities
 from scanner import quality_score
+from track_store import TrackStore
+
+
+# Distinct tag values remembered by the normalizer. A library repeats the same
+# artist and album strings on every track, so most lookups are cache hits.
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+_NON_WORD = re.compile(r"[^\w\s]")
+# The same deletion for ASCII text, as bytes for bytes.translate
+_ASCII_NON_WORD = bytes(i for i in range(128) if _NON_WORD.match(chr(i)))
 
 
 def normalize_text(text: str) -> str:
     """Normalize text for comparison."""
     if not text:
         return ""
-    text = unicodedata.normalize("NFKD", text)
-    text = text.lower().strip()
-    text = re.sub(r"[^\w\s]", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    return _normalize(text)
+
+
+def normalize_many(texts: Iterable[str]) -> list[str]:
+    """Normalize a batch of tag values, in order. Same results as normalize_text."""
+    normalize = _normalize
+    return [normalize(text) if text else "" for text in texts]
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize(text: str) -> str:
+    # NFKD leaves ASCII unchanged, so skip it for the common case
+    if text.isascii():
+        text = text.lower().encode("ascii").translate(None, _ASCII_NON_WORD).decode("ascii")
+    else:
+        text = _NON_WORD.sub("", unicodedata.normalize("NFKD", text).lower())
+    # str.split() and re's \s agree on what whitespace is
+    text = " ".join(text.split())
     if text.startswith("the "):
         text = text[4:]
     return text
 
 
+# Larger sets of tracks sharing one key are almost always a generic key
+# ("Unknown Artist" / "Track 01") rather than real copies, and are not grouped
+METADATA_MAX_GROUP = 16
+
+# A leading track number in a file name: "01 - ", "1. ", "03_"
+_TRACK_PREFIX = re.compile(r"^\s*\d{1,3}(?:\s*[-._]\s*|\s+)(?=\S)")
+
+
+def path_tags(file_path: str) -> dict:
+    """Guess artist, album and title from an Artist/Album/NN - Title.ext layout.
+
+    A file named "Artist - Title" names its own artist; otherwise the artist
+    and album are the grandparent and parent folder names.
+    """
+    path = Path(file_path)
+    stem = _TRACK_PREFIX.sub("", path.stem, count=1)
+    album = path.parent.name
+    artist = path.parent.parent.name
+    named_artist, sep, title = stem.partition(" - ")
+    if sep and title.strip():
+        artist = named_artist
+    else:
+        title = stem
+    return {"artist": artist.strip(), "album": album.strip(), "title": title.strip()}
+
+
+def grouping_key(track: dict) -> tuple[str, str, str]:
+    """Normalized (artist, title, album) that metadata duplicates share.
+
+    When the artist or title tag is missing, the missing fields are filled
+    from the file's path (see path_tags).
+    """
+    artist, title, album = normalize_many(
+        (track.get("artist", ""), track.get("title", ""), track.get("album", ""))
+    )
+    if not (artist and title) and track.get("file_path"):
+        guessed = path_tags(track["file_path"])
+        path_artist, path_title, path_album = normalize_many(
+            (guessed["artist"], guessed["title"], guessed["album"])
+        )
+        artist, title, album = artist or path_artist, title or path_title, album or path_album
+    return artist, title, album
+
+
+def usable_key(key: tuple[str, str, str]) -> bool:
+    """Whether a grouping key identifies a recording: a title plus an artist or album.
+
+    Keys without one (untagged files with uninformative paths) would lump
+    unrelated tracks together, so they are never grouped. Mirrors
+    database.USABLE_KEY_SQL.
+    """
+    artist, title, album = key
+    return bool(title and (artist or album))
+
+
 def group_by_metadata(tracks: list[dict]) -> list[list[dict]]:
-    """Group tracks by normalized (artist, title, album). Returns groups with 2+ members."""
+    """Group tracks by normalized (artist, title, album). Returns groups with 2+ members.
+
+    Tracks whose key isn't usable_key are left out, and so are keys shared by
+    more than METADATA_MAX_GROUP tracks.
+    """
     groups: dict[tuple[str, str, str], list[dict]] = defaultdict(list)
     for track in tracks:
-        key = (
-            normalize_text(track.get("artist", "")),
-            normalize_text(track.get("title", "")),
-            normalize_text(track.get("album", "")),
+        key = grouping_key(track)
+        if usable_key(key):
+            groups[key].append(track)
+    return [members for members in groups.values() if 2 <= len(members) <= METADATA_MAX_GROUP]
+
+
+def group_rows_by_metadata(store: TrackStore) -> list[np.ndarray]:
+    """group_by_metadata over a TrackStore, returning row indexes per group of 2+.
+
+    Each distinct (artist, title, album) code triple is normalized once; rows
+    are then grouped by sorting on the resulting key codes. Rows missing an
+    artist or title are keyed one by one from their file_path, if the store
+    has one.
+    """
+    triples = np.stack([store.column(c) for c in ("artist", "title", "album")], axis=1)
+    distinct, triple_of_row = np.unique(triples, axis=0, return_inverse=True)
+    triple_of_row = triple_of_row.ravel()
+    pool = store.pool
+    key_codes: dict[tuple[str, str, str], int] = {}
+    skip = -1
+
+    def code_of(key: tuple[str, str, str]) -> int:
+        return key_codes.setdefault(key, len(key_codes)) if usable_key(key) else skip
+
+    def key_code(triple: list[int]) -> int:
+        artist, title, album = (pool[c] for c in triple)
+        return code_of(grouping_key({"artist": artist, "title": title, "album": album}))
+
+    key_of_triple = np.fromiter(map(key_code, distinct.tolist()), dtype=np.int64, count=len(distinct))
+    key_of_row = key_of_triple[triple_of_row]
+
+    if "file_path" in store:
+        untagged = np.flatnonzero((distinct[:, 0] == 0) | (distinct[:, 1] == 0))
+        for row in np.flatnonzero(np.isin(triple_of_row, untagged)).tolist():
+            track = {c: store.text(c, row) for c in ("artist", "title", "album", "file_path")}
+            key_of_row[row] = code_of(grouping_key(track))
+
+    order = np.argsort(key_of_row, kind="stable")
+    bounds = np.flatnonzero(np.diff(key_of_row[order])) + 1
+    return [
+        rows for rows in np.split(order, bounds)
+        if 2 <= len(rows) <= METADATA_MAX_GROUP and key_of_row[rows[0]] != skip
+    ]
+
+
+# Fuzzy metadata matching. Tag text is compared as sets of character trigrams.
+FUZZY_NUM_HASHES = 24            # MinHash signature length
+FUZZY_BAND_ROWS = 3              # signature rows per LSH band, so 8 bands
+FUZZY_MAX_BUCKET = 50            # band buckets (and identical texts) shared by more tracks are ignored
+FUZZY_MAX_DURATION_DIFF = 0.05   # relative duration difference allowed within a match
+FUZZY_MAX_CONFIDENCE = 0.9       # kept below the default auto-resolve threshold
+FUZZY_SIGNATURE_CHUNK = 4096     # texts hashed per vectorized MinHash step
+FUZZY_ESTIMATE_SLACK = 0.25      # MinHash estimate margin below threshold before exact scoring
+
+_FEATURING = re.compile(r"\s*[(\[]?\s*\b(?:feat\.?|ft\.|featuring)\s.*$", re.IGNORECASE)
+_EDITION_WORDS = (
+    r"remaster(?:ed)?|deluxe|expanded|anniversary|edition|version|mono|stereo"
+    r"|bonus|explicit|clean|single|radio edit"
+)
+# Bracketed groups, or a " - ..." suffix, that mention an edition word
+_EDITION = re.compile(
+    rf"\s*(?:[(\[][^)\]]*\b(?:{_EDITION_WORDS})\b[^)\]]*[)\]]|\s-\s.*\b(?:{_EDITION_WORDS})\b.*$)",
+    re.IGNORECASE,
+)
+# Different recordings rather than different releases of one
+_DISTINCT_TAKE = re.compile(r"\b(?:live|acoustic|demo|remix|instrumental|karaoke)\b", re.IGNORECASE)
+
+_MINHASH_PRIME = (1 << 31) - 1
+_CODE_POINTS = 0x110000
+_rng = np.random.default_rng(20111)
+_HASH_A = _rng.integers(1, _MINHASH_PRIME, FUZZY_NUM_HASHES, dtype=np.int64)[:, None]
+_HASH_B = _rng.integers(0, _MINHASH_PRIME, FUZZY_NUM_HASHES, dtype=np.int64)[:, None]
+del _rng
+
+
+def strip_edition(title: str) -> str:
+    """Remove release decorations such as "(Remastered 2011)", " - Mono" or "feat. X"."""
+    def drop(match: re.Match) -> str:
+        return match.group(0) if _DISTINCT_TAKE.search(match.group(0)) else ""
+
+    return _FEATURING.sub("", _EDITION.sub(drop, title or ""))
+
+
+def fuzzy_text(track: dict) -> str:
+    """Normalized "artist title" string that fuzzy matching compares."""
+    artist, title = normalize_many(
+        (_FEATURING.sub("", track.get("artist") or ""), strip_edition(track.get("title") or ""))
+    )
+    return f"{artist} {title}".strip()
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of two strings' character trigram sets."""
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def minhash_signatures(texts: Sequence[str]) -> np.ndarray:
+    """MinHash signatures of each text's trigram set, shape (len(texts), FUZZY_NUM_HASHES).
+
+    Texts are hashed a chunk at a time: their code points are laid end to end,
+    every trigram becomes one integer, and np.minimum.reduceat takes each
+    text's minimum under every hash function in a single call.
+    """
+    signatures = np.empty((len(texts), FUZZY_NUM_HASHES), dtype=np.int64)
+    for start in range(0, len(texts), FUZZY_SIGNATURE_CHUNK):
+        chunk = [f"  {t} " for t in texts[start:start + FUZZY_SIGNATURE_CHUNK]]
+        codes = np.frombuffer("".join(chunk).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        grams = (codes[:-2] * _CODE_POINTS + codes[1:-1]) * _CODE_POINTS + codes[2:]
+        lengths = np.fromiter((len(t) for t in chunk), dtype=np.int64, count=len(chunk))
+        ends = np.cumsum(lengths)
+        # Drop the two trigrams that straddle each boundary between texts
+        grams = np.delete(grams, np.concatenate((ends[:-1] - 2, ends[:-1] - 1)))
+        offsets = np.concatenate(([0], np.cumsum(lengths - 2)[:-1]))
+        hashed = (_HASH_A * (grams % _MINHASH_PRIME) + _HASH_B) % _MINHASH_PRIME
+        signatures[start:start + len(chunk)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return signatures
+
+
+def _band_candidates(signatures: np.ndarray) -> set[tuple[int, int]]:
+    """Index pairs that agree on every row of at least one signature band."""
+    n = len(signatures)
+    pairs: set[tuple[int, int]] = set()
+    for start in range(0, FUZZY_NUM_HASHES, FUZZY_BAND_ROWS):
+        band = np.ascontiguousarray(signatures[:, start:start + FUZZY_BAND_ROWS])
+        keys = band.view(np.dtype((np.void, band.dtype.itemsize * band.shape[1]))).ravel()
+        order = np.argsort(keys, kind="stable")
+        ordered = keys[order]
+        bounds = np.flatnonzero(ordered[1:] != ordered[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        sizes = np.diff(np.concatenate((starts, [n])))
+        for lo, size in zip(starts.tolist(), sizes.tolist()):
+            if 2 <= size <= FUZZY_MAX_BUCKET:
+                # A stable sort leaves each bucket in ascending index order
+                pairs.update(combinations(order[lo:lo + size].tolist(), 2))
+    return pairs
+
+
+def _close_durations(a, b) -> bool:
+    if not a or not b:
+        return True
+    return abs(a - b) / max(a, b) <= FUZZY_MAX_DURATION_DIFF
+
+
+def group_by_fuzzy_metadata(
+    tracks: "TrackStore | Iterable[dict]", threshold: float
+) -> list[tuple[list[int], float]]:
+    """Group track ids whose artist and title nearly match once edition decorations are removed.
+
+    Takes a TrackStore (or dicts) with id, artist, title and duration. Tracks
+    with identical fuzzy text are linked directly; distinct texts are blocked
+    by MinHash banding (LSH) over character trigrams, so each text is only
+    scored against the few texts sharing a band, and a candidate pair links
+    when its trigram Jaccard similarity reaches threshold. Linked tracks must
+    also agree on duration, which keeps live and edited takes apart. Returns
+    (track_ids, similarity) per group of 2+, where similarity is the weakest link.
+    """
+    if not isinstance(tracks, TrackStore):
+        tracks = TrackStore.from_records(tracks, ("id", "artist", "title", "duration"))
+    ids = tracks.column("id")
+    durations = tracks.column("duration")
+
+    # Fuzzy text is computed once per distinct (artist, title) pair of codes
+    tag_pairs = (tracks.column("artist").astype(np.int64) << 32) | tracks.column("title")
+    distinct, pair_of_row = np.unique(tag_pairs, return_inverse=True)
+    pool = tracks.pool
+    text_codes: dict[str, int] = {}
+
+    def text_code(pair: int) -> int:
+        text = fuzzy_text({"artist": pool[pair >> 32], "title": pool[pair & 0xFFFFFFFF]})
+        return text_codes.setdefault(text, len(text_codes))
+
+    text_of_pair = np.fromiter(map(text_code, distinct.tolist()), dtype=np.int64, count=len(distinct))
+    text_of_row = text_of_pair[pair_of_row]
+    all_texts = list(text_codes)
+
+    order = np.argsort(text_of_row, kind="stable")
+    bounds = np.flatnonzero(np.diff(text_of_row[order])) + 1
+    by_text: dict[str, list[int]] = {}
+    for rows in np.split(order, bounds):
+        text = all_texts[text_of_row[rows[0]]] if len(rows) else ""
+        if text:
+            by_text[text] = rows.tolist()
+
+    linked = _LinkedGroups()
+
+    def link(members_a, members_b, score):
+        for a in members_a:
+            for b in members_b:
+                if a != b and _close_durations(durations[a], durations[b]):
+                    linked.join(a, b, score)
+
+    texts = [text for text, members in by_text.items() if len(members) <= FUZZY_MAX_BUCKET]
+    for text in texts:
+        members = by_text[text]
+        link(members, members, 1.0)
+
+    signatures = minhash_signatures(texts)
+    pairs = np.array(list(_band_candidates(signatures)), dtype=np.int64).reshape(-1, 2)
+    # The share of agreeing signature rows estimates the Jaccard similarity;
+    # only pairs that could plausibly reach threshold are scored exactly
+    estimates = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    for a, b in pairs[estimates >= threshold - FUZZY_ESTIMATE_SLACK].tolist():
+        score = trigram_similarity(texts[a], texts[b])
+        if score >= threshold:
+            link(by_text[texts[a]], by_text[texts[b]], score)
+    return linked.groups(ids.tolist())
+
+
+# Fingerprint matching. Sub-fingerprints are 32-bit values, ~8 per second of audio.
+FP_COMPARE_LENGTH = 256  # compare the first ~30 s of each track
+FP_MIN_OVERLAP = 64      # aligned items needed before a similarity counts
+FP_KEY_SHIFT = 8         # index keys are the top 24 bits of a sub-fingerprint
+FP_WINNOW = 16           # one index key per window of this many items
+FP_MAX_POSTINGS = 50     # keys shared by more tracks (silence, tones) are ignored
+FP_MIN_VOTES = 2         # shared keys at one alignment needed to become a candidate
+FP_MISMATCH_CONFIDENCE = 0.3  # as compute_confidence scores durations more than 20% apart
+
+
+def fingerprint_keys(values: Sequence[int]) -> list[tuple[int, int]]:
+    """Pick (key, position) index entries from a fingerprint by winnowing.
+
+    The smallest key in each sliding window is chosen. Because the choice depends
+    only on content, two copies of the same audio pick the same keys even
+    when one is shifted by a few items.
+    """
+    keys = (np.asarray(values, dtype=np.uint32) >> FP_KEY_SHIFT).tolist()
+    if len(keys) < FP_WINNOW:
+        return [(min(keys), keys.index(min(keys)))] if keys else []
+    picked = {}
+    window: deque[int] = deque()  # positions in the current window, keys ascending
+    for pos, key in enumerate(keys):
+        while window and keys[window[-1]] > key:
+            window.pop()
+        window.append(pos)
+        if window[0] <= pos - FP_WINNOW:
+            window.popleft()
+        if pos >= FP_WINNOW - 1:
+            picked[window[0]] = keys[window[0]]
+    return [(key, pos) for pos, key in picked.items()]
+
+
+def fingerprint_similarity(a: Sequence[int], b: Sequence[int], offset: int = 0) -> float:
+    """Fraction of matching bits between a and b, with b[i] aligned to a[i + offset]."""
+    a = np.asarray(a, dtype=np.uint32)
+    b = np.asarray(b, dtype=np.uint32)
+    return float(similarities(a, [b], [offset], min_overlap=FP_MIN_OVERLAP)[0])
+
+
+def group_by_fingerprint(
+    fingerprints: Iterable[tuple[int, Sequence[int]]], threshold: float
+) -> list[tuple[list[int], float]]:
+    """Group track ids whose audio fingerprints are near-identical.
+
+    Takes (track_id, sub-fingerprints) pairs. Candidates are blocked through an
+    inverted index of winnowed fingerprint keys, so only tracks sharing keys at
+    a consistent alignment are compared; each track's candidates are then
+    scored in one vectorized bit-similarity call at those alignments. Returns (track_ids, confidence) per group of 2+, where
+    confidence is the weakest link that joined the group.
+    """
+    ids: list[int] = []
+    prints: list[np.ndarray] = []
+    index: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for track_id, values in fingerprints:
+        # Copy the prefix so the full fingerprint it came from can be freed
+        values = np.array(values[:FP_COMPARE_LENGTH], dtype=np.uint32)
+        if len(values) < FP_MIN_OVERLAP:
+            continue
+        n = len(ids)
+        ids.append(track_id)
+        prints.append(values)
+        for key, pos in fingerprint_keys(values):
+            index[key].append((n, pos))
+
+    votes: Counter = Counter()
+    for postings in index.values():
+        if len(postings) < 2 or len(postings) > FP_MAX_POSTINGS:
+            continue
+        for (a, pos_a), (b, pos_b) in combinations(postings, 2):
+            if a != b:
+                votes[(a, b, pos_a - pos_b) if a < b else (b, a, pos_b - pos_a)] += 1
+
+    # Keep the best-supported alignment per pair
+    best: dict[tuple[int, int], tuple[int, int]] = {}
+    for (a, b, offset), count in votes.items():
+        if count >= FP_MIN_VOTES and count > best.get((a, b), (0, 0))[0]:
+            best[(a, b)] = (count, offset)
+
+    candidates: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for (a, b), (_, offset) in best.items():
+        candidates[a].append((b, offset))
+
+    linked = _LinkedGroups()
+    for a, pairs in candidates.items():
+        scores = similarities(
+            prints[a], [prints[b] for b, _ in pairs], [offset for _, offset in pairs],
+            min_overlap=FP_MIN_OVERLAP,
         )
-        groups[key].append(track)
-    return [members for members in groups.values() if len(members) >= 2]
+        for (b, _), sim in zip(pairs, scores.tolist()):
+            if sim >= threshold:
+                linked.join(a, b, sim)
+    return linked.groups(ids)
+
+
+def confirm_with_fingerprints(confidence: float, fingerprints: list[Sequence[int]], threshold: float) -> float:
+    """Adjust a metadata group's confidence with every member's fingerprint.
+
+    If the fingerprints all link up at threshold, the group is at least as
+    likely as their weakest link; if they don't, it is capped at
+    FP_MISMATCH_CONFIDENCE.
+    """
+    groups = group_by_fingerprint(enumerate(fingerprints), threshold)
+    if len(groups) == 1 and len(groups[0][0]) == len(fingerprints):
+        return max(confidence, groups[0][1])
+    return min(confidence, FP_MISMATCH_CONFIDENCE)
+
+
+class _LinkedGroups:
+    """Union-find over item indexes that remembers the weakest link joining each set.
+
+    Only joined items are stored, so the cost follows the number of links
+    rather than the number of items.
+    """
+
+    def __init__(self):
+        self.parent: dict[int, int] = {}
+        self.weakest: dict[int, float] = {}
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    def join(self, a: int, b: int, score: float):
+        ra, rb = self.find(a), self.find(b)
+        link = min(score, self.weakest.get(ra, 1.0), self.weakest.get(rb, 1.0))
+        self.parent.setdefault(ra, ra)
+        self.parent[rb] = ra
+        self.weakest[ra] = link
+
+    def groups(self, ids: list[int]) -> list[tuple[list[int], float]]:
+        """(ids, weakest link) for every set of 2+ items."""
+        members: dict[int, list[int]] = defaultdict(list)
+        for n in sorted(self.parent):
+            members[self.find(n)].append(ids[n])
+        return [
+            (group, round(self.weakest[root], 4))
+            for root, group in members.items() if len(group) >= 2
+        ]
 
 
 def compute_confidence(group: list[dict]) -> float:
@@ -59,14 +498,44 @@ def compute_confidence(group: list[dict]) -> float:
         return 0.30
 
 
+def compute_confidences(store: TrackStore, groups: list[np.ndarray]) -> np.ndarray:
+    """compute_confidence for many groups of store rows at once."""
+    if not groups:
+        return np.empty(0)
+    sizes = np.fromiter((len(g) for g in groups), dtype=np.int64, count=len(groups))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    durations = store.column("duration")[np.concatenate(groups)]
+    known = durations > 0
+    counts = np.add.reduceat(known.astype(np.int64), starts)
+    averages = np.add.reduceat(np.where(known, durations, 0.0), starts) / np.maximum(counts, 1)
+    row_average = np.repeat(averages, sizes)
+    deviations = np.where(known, np.abs(durations - row_average) / np.where(row_average > 0, row_average, 1), 0.0)
+    max_deviation = np.maximum.reduceat(deviations, starts)
+    confidence = np.select(
+        [max_deviation < 0.02, max_deviation < 0.05, max_deviation < 0.10, max_deviation < 0.20],
+        [0.95, 0.85, 0.70, 0.50], default=0.30,
+    )
+    return np.where((counts < 2) | (averages == 0), 0.5, confidence)
+
+
+def _stored_quality(track: dict) -> int:
+    score = track.get("quality_score")
+    return quality_score(track) if score is None else score
+
+
 def find_duplicates(group: list[dict]) -> dict:
-    """Given a group of duplicate tracks, pick the best and mark the rest for trash."""
-    ranked = sorted(group, key=lambda t: quality_score(t), reverse=True)
+    """Given a group of duplicate tracks, pick the best and mark the rest for trash.
+
+    Uses each track's stored quality_score when present. Rows read in
+    ORDER BY quality_score DESC are already ranked, so the sort is one pass.
+    """
+    scores = [_stored_quality(t) for t in group]
+    ranked = sorted(range(len(group)), key=scores.__getitem__, reverse=True)
     best = ranked[0]
     rest = ranked[1:]
     return {
-        "keep_id": best["id"],
-        "trash_ids": [t["id"] for t in rest],
-        "quality_gap": quality_score(best) - quality_score(rest[0]) if rest else 0,
+        "keep_id": group[best]["id"],
+        "trash_ids": [group[n]["id"] for n in rest],
+        "quality_gap": scores[best] - scores[rest[0]] if rest else 0,
         "confidence": compute_confidence(group),
     }
@@ -1,9 +1,31 @@
+import errno
+import hashlib
+import os
+import re
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterable
 
+from database import get_db
+from trash_ledger import record_removed, record_trashed
 
-def trash_file(file_path: Path, trash_dir: Path, music_root: Path = None) -> str:
-    """Move a file to the trash directory, preserving relative path structure."""
+COPY_BUFFER = 8 << 20   # bytes per read when a move has to copy across filesystems
+MOVE_WORKERS = 8        # concurrent moves in move_many
+PARTIAL_MAX_AGE = 3600  # seconds before a leftover cross-device copy counts as abandoned
+
+# The temporary name _copy_verified writes to: .<name>.<pid>.<thread id>.part
+_PARTIAL_COPY = re.compile(r"\..+\.\d+\.\d+\.part")
+
+
+def trash_destination(file_path: Path, trash_dir: Path, music_root: Path = None, reserved: set = None) -> Path:
+    """Pick a free path in the trash for file_path, preserving relative path structure.
+
+    Paths in ``reserved`` count as taken; the chosen path is added to it, so a
+    batch can plan many moves before any of them run.
+    """
     file_path = Path(file_path)
     trash_dir = Path(trash_dir)
 
@@ -13,46 +35,202 @@ def trash_file(file_path: Path, trash_dir: Path, music_root: Path = None) -> str
         rel_path = Path(file_path.name)
 
     dest = trash_dir / rel_path
-    dest.parent.mkdir(parents=True, exist_ok=True)
+    taken = reserved if reserved is not None else set()
 
-    if dest.exists():
+    if dest.exists() or dest in taken:
         stem = dest.stem
         suffix = dest.suffix
         counter = 1
-        while dest.exists():
+        while dest.exists() or dest in taken:
             dest = dest.parent / f"{stem}_{counter}{suffix}"
             counter += 1
 
-    shutil.move(str(file_path), str(dest))
+    taken.add(dest)
+    return dest
+
+
+def move_file(src: Path, dest: Path) -> None:
+    """Move a file, renaming it in place when both paths are on the same filesystem.
+
+    Across filesystems the file is copied to a temporary name beside dest,
+    fsynced, re-read from the disk and checked against the source's checksum,
+    then renamed into place before the source is removed, so dest never holds
+    a partial copy. A process killed mid-copy leaves the temporary file
+    behind for sweep_partial_copies.
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        _copy_verified(Path(src), dest)
+        os.unlink(src)
+
+
+def move_many(moves: Iterable[tuple[Path, Path]], workers: int = MOVE_WORKERS) -> list:
+    """Run move_file over (src, dest) pairs on a thread pool.
+
+    Returns one entry per pair, in order: None if it moved, else the exception.
+    """
+    def move(pair):
+        try:
+            move_file(*pair)
+        except OSError as e:
+            return e
+        return None
+
+    moves = list(moves)
+    if not moves:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(moves)))) as pool:
+        return list(pool.map(move, moves))
+
+
+def _copy_verified(src: Path, dest: Path):
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            digest = _copy_stream(fin, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+            _drop_cache(fout.fileno())
+        if _file_digest(tmp) != digest:
+            raise OSError(errno.EIO, f"Copy of {src} does not match the original")
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    _fsync_dir(dest.parent)
+
+
+def _copy_stream(fin, fout) -> bytes:
+    """Copy fin to fout through one reusable buffer, returning the source's digest."""
+    digest = hashlib.md5()
+    buf = bytearray(COPY_BUFFER)
+    view = memoryview(buf)
+    while n := fin.readinto(buf):
+        digest.update(view[:n])
+        fout.write(view[:n])
+    return digest.digest()
+
+
+def _drop_cache(fd: int):
+    """Evict a synced file from the page cache, so reading it back checks what reached the disk."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _file_digest(path: Path) -> bytes:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_BUFFER):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _fsync_dir(path: Path):
+    """Persist a rename by syncing the directory entry (not supported everywhere)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def is_partial_copy(name: str) -> bool:
+    """Whether a file name is one of move_file's temporary cross-device copies."""
+    return _PARTIAL_COPY.fullmatch(name) is not None
+
+
+def sweep_partial_copies(root: Path, min_age: float = PARTIAL_MAX_AGE) -> int:
+    """Delete temporary copies under root left by moves that were killed mid-copy.
+
+    Only files untouched for ``min_age`` seconds go, so copies still being
+    written are left alone. Returns the number deleted.
+    """
+    cutoff = time.time() - min_age
+    removed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not is_partial_copy(name):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def trash_file(file_path: Path, trash_dir: Path, music_root: Path = None, db=None) -> str:
+    """Move a file to the trash directory, preserving relative path structure.
+
+    The file is added to the trash ledger through ``db``, or a connection of
+    its own when none is given.
+    """
+    dest = trash_destination(file_path, trash_dir, music_root)
+    move_file(file_path, dest)
+    _update_ledger(db, record_trashed, trash_dir, [(str(dest), dest.stat().st_size)])
     return str(dest)
 
 
-def restore_file(trash_path: str, original_path: str) -> None:
+def restore_file(trash_path: str, original_path: str, db=None) -> None:
     """Restore a file from trash to its original location."""
     trash_path = Path(trash_path)
-    original = Path(original_path)
-    original.parent.mkdir(parents=True, exist_ok=True)
-    shutil.move(str(trash_path), str(original))
+    move_file(trash_path, Path(original_path))
+    _update_ledger(db, record_removed, [str(trash_path)])
 
 
 def get_trash_size(trash_dir: Path) -> int:
-    """Return total size in bytes of all files in trash."""
+    """Return total size in bytes of all files in trash, walking the disk (see trash_ledger for the fast path)."""
     trash_dir = Path(trash_dir)
     if not trash_dir.exists():
         return 0
     return sum(f.stat().st_size for f in trash_dir.rglob("*") if f.is_file())
 
 
-def empty_trash(trash_dir: Path) -> int:
-    """Delete all files in trash. Returns number of files deleted."""
-    trash_dir = Path(trash_dir)
-    count = 0
-    if trash_dir.exists():
-        for f in trash_dir.rglob("*"):
-            if f.is_file():
-                f.unlink()
-                count += 1
-        for d in sorted(trash_dir.rglob("*"), reverse=True):
-            if d.is_dir() and not any(d.iterdir()):
-                d.rmdir()
-    return count
+def remove_empty_dirs(root: Path, dirs: Iterable[Path] = None) -> int:
+    """Remove empty directories under root, deepest first, in a single pass.
+
+    Without ``dirs`` the whole tree is walked bottom-up; with them only those
+    directories and their ancestors below root are tried. Returns the number
+    removed.
+    """
+    root = Path(root)
+    if dirs is None:
+        candidates = [dirpath for dirpath, _, _ in os.walk(root, topdown=False) if dirpath != str(root)]
+    else:
+        found = set()
+        for d in dirs:
+            d = Path(d)
+            while d != root and root in d.parents and d not in found:
+                found.add(d)
+                d = d.parent
+        candidates = sorted(found, key=lambda d: len(d.parts), reverse=True)
+    return sum(_remove_if_empty(d) for d in candidates)
+
+
+def _remove_if_empty(path) -> bool:
+    try:
+        os.rmdir(path)
+    except OSError:
+        return False
+    return True
+
+
+def _update_ledger(db, record, *args):
+    if db is not None:
+        record(db, *args)
+        return
+    with get_db() as own:
+        record(own, *args)
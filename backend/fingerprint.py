@@ -0,0 +1,248 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FIRST_PASS_TIMEOUT = 30
+RETRY_TIMEOUT = 120
+
+# Task priorities: first attempts always run before retries of timed-out files
+PRIORITY_NORMAL = 0
+PRIORITY_RETRY = 1
+
+
+# Fingerprints are stored as little-endian uint32 sub-fingerprints
+FINGERPRINT_DTYPE = np.dtype("<u4")
+
+
+def fpcalc(file_path: Path, timeout: float = 30) -> bytes:
+    """Run fpcalc and return the raw fingerprint as a BLOB, or b"" if it can't decode the file.
+
+    Raises subprocess.TimeoutExpired so callers can account for slow files,
+    and FileNotFoundError if fpcalc isn't installed.
+    """
+    try:
+        result = subprocess.run(
+            ["fpcalc", "-raw", "-json", str(file_path)],
+            capture_output=True, text=True, timeout=timeout
+        )
+        if result.returncode != 0:
+            return b""
+        data = json.loads(result.stdout)
+        return pack_fingerprint(data.get("fingerprint", []))
+    except json.JSONDecodeError:
+        return b""
+
+
+def pack_fingerprint(values: Sequence[int]) -> bytes:
+    """Pack sub-fingerprints into a BLOB. Older fpcalc builds print them signed."""
+    return (np.asarray(values, dtype=np.int64) & 0xFFFFFFFF).astype(FINGERPRINT_DTYPE).tobytes()
+
+
+def unpack_fingerprint(blob: bytes) -> np.ndarray:
+    """Read a stored fingerprint BLOB as a uint32 array (a view on the bytes)."""
+    return np.frombuffer(blob, dtype=FINGERPRINT_DTYPE)
+
+
+def similarities(query: np.ndarray, candidates: Sequence[np.ndarray],
+                 offsets: Sequence[int] = None, min_overlap: int = 1) -> np.ndarray:
+    """Bit similarity of ``query`` against every candidate in one vectorized pass.
+
+    Candidate i is aligned so that candidates[i][j] pairs with
+    query[j + offsets[i]]. Returns the fraction of equal bits over each aligned
+    overlap, or 0.0 where the overlap is shorter than ``min_overlap``.
+    """
+    n = len(candidates)
+    if n == 0:
+        return np.zeros(0)
+    offsets = np.zeros(n, dtype=np.int64) if offsets is None else np.asarray(offsets, dtype=np.int64)
+    width = max(len(query), max(len(c) for c in candidates))
+    a = np.zeros((n, width), dtype=np.uint32)
+    b = np.zeros((n, width), dtype=np.uint32)
+    overlap = np.zeros(n, dtype=np.int64)
+    for i, (cand, offset) in enumerate(zip(candidates, offsets)):
+        q = query[offset:] if offset >= 0 else query
+        c = cand if offset >= 0 else cand[-offset:]
+        length = min(len(q), len(c))
+        a[i, :length] = q[:length]
+        b[i, :length] = c[:length]
+        overlap[i] = length
+    errors = np.bitwise_count(a ^ b).sum(axis=1, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = 1 - errors / (32 * overlap)
+    result[overlap < min_overlap] = 0.0
+    return result
+
+
+def decode_fingerprint(encoded: str) -> list[int]:
+    """Decode fpcalc's compressed fingerprint string into its 32-bit sub-fingerprints.
+
+    Format (chromaprint's FingerprintCompressor): URL-safe base64 without
+    padding; one algorithm byte and a 24-bit big-endian item count; then each
+    item's XOR with the previous item, written as the gaps between its set bits
+    and a 0 terminator. Gaps are packed LSB-first as 3-bit values, with 7
+    meaning "7 + the next 5-bit value from the exception stream", which starts
+    at the byte after the 3-bit stream.
+    """
+    if not encoded:
+        return []
+    data = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    if len(data) < 4:
+        raise ValueError("Fingerprint header is truncated")
+    count = int.from_bytes(data[1:4], "big")
+    body = data[4:] + b"\0"  # pad so two-byte reads never run off the end
+
+    gaps = []
+    pos = 0
+    zeros = 0
+    limit = (len(body) - 1) * 8
+    while zeros < count:
+        if pos + 3 > limit:
+            raise ValueError("Fingerprint data is truncated")
+        byte = pos >> 3
+        gap = ((body[byte] | body[byte + 1] << 8) >> (pos & 7)) & 7
+        gaps.append(gap)
+        zeros += gap == 0
+        pos += 3
+
+    pos = (pos + 7) & ~7
+    for i, gap in enumerate(gaps):
+        if gap == 7:
+            if pos + 5 > limit:
+                raise ValueError("Fingerprint exception data is truncated")
+            byte = pos >> 3
+            gaps[i] += ((body[byte] | body[byte + 1] << 8) >> (pos & 7)) & 31
+            pos += 5
+
+    values = []
+    prev = delta = bit = 0
+    for gap in gaps:
+        if gap == 0:
+            prev ^= delta
+            values.append(prev)
+            delta = bit = 0
+        else:
+            bit += gap
+            delta |= 1 << (bit - 1)
+    return values
+
+
+class FingerprintPool:
+    """Run fpcalc on many files at once and hand results back through a queue.
+
+    ``submit`` blocks once ``max_pending`` files are queued or running, so a fast
+    producer can't race ahead of fpcalc. A file that times out is retried once,
+    with ``retry_timeout``, after all first attempts queued ahead of it.
+    Completed items are collected with ``drain`` (non-blocking) or ``finish``.
+
+    Items are track metadata dicts; each comes back with ``fingerprint`` set to
+    the packed raw fingerprint, b"" if fpcalc couldn't decode the file, or None
+    if it timed out twice or couldn't run at all. ``stats["missing"]`` counts
+    files fpcalc couldn't be started for because it isn't installed.
+
+    A positive ``nice`` lowers the scheduling priority of the worker threads,
+    and so of the fpcalc processes they start, where the OS supports it.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = None,
+                 timeout: float = FIRST_PASS_TIMEOUT, retry_timeout: float = RETRY_TIMEOUT,
+                 nice: int = 0):
+        self.nice = nice
+        self.timeout = timeout
+        self.retry_timeout = retry_timeout
+        self.stats = {"completed": 0, "failed": 0, "timeouts": 0, "retried": 0, "missing": 0,
+                      "fpcalc_seconds": 0.0}
+        self._tasks = queue.PriorityQueue()
+        self._results = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"fpcalc-{i}")
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, item: dict):
+        self._slots.acquire()
+        self._tasks.put((PRIORITY_NORMAL, next(self._seq), item))
+
+    def drain(self) -> list[dict]:
+        """Return whatever results are ready without waiting."""
+        done = []
+        while True:
+            try:
+                done.append(self._results.get_nowait())
+            except queue.Empty:
+                return done
+
+    def close(self):
+        """Let the workers exit once queued work (including retries) is done."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._tasks.put((PRIORITY_RETRY + 1, next(self._seq), None))
+
+    def finish(self):
+        """Wait for all submitted work, yielding results as they arrive, then stop the workers."""
+        self.close()
+        while any(t.is_alive() for t in self._threads) or not self._results.empty():
+            try:
+                yield self._results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+    def _worker(self):
+        if self.nice > 0 and hasattr(os, "setpriority"):
+            # On Linux nice values are per thread and inherited by child processes
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except OSError:
+                pass
+        while True:
+            priority, _, item = self._tasks.get()
+            if item is None:
+                return
+            timeout = self.retry_timeout if priority == PRIORITY_RETRY else self.timeout
+            start = time.monotonic()
+            try:
+                item["fingerprint"] = fpcalc(Path(item["file_path"]), timeout)
+            except subprocess.TimeoutExpired:
+                self._record(time.monotonic() - start, timeouts=1)
+                if priority == PRIORITY_NORMAL:
+                    self._record(0, retried=1)
+                    self._tasks.put((PRIORITY_RETRY, next(self._seq), item))
+                    continue
+                logger.warning(f"fpcalc timed out twice on {item['file_path']}")
+                item["fingerprint"] = None
+            except FileNotFoundError:
+                self._record(0, missing=1)
+                item["fingerprint"] = None
+            except Exception as e:
+                logger.error(f"fpcalc failed on {item['file_path']}: {e}")
+                item["fingerprint"] = None
+            else:
+                self._record(time.monotonic() - start)
+            self._record(0, completed=1, failed=0 if item["fingerprint"] else 1)
+            self._results.put(item)
+            self._slots.release()
+
+    def _record(self, seconds: float, **counts):
+        with self._lock:
+            self.stats["fpcalc_seconds"] += seconds
+            for key, n in counts.items():
+                self.stats[key] += n
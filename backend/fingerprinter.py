@@ -0,0 +1,154 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from database import get_db
+from dedup import group_by_fingerprint
+from fingerprint import FingerprintPool, unpack_fingerprint
+from scanner import generate_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Unresolved groups in this confidence range are the ones a fingerprint can
+# settle: below it the durations already disagree, at the top it auto-resolves
+AMBIGUOUS_CONFIDENCE = (0.5, 0.95)
+LAZY_WORKERS = 2      # concurrent fpcalc processes, kept low so imports and the UI stay responsive
+LAZY_NICE = 10        # scheduling niceness of those processes
+LAZY_BATCH = 200      # tracks fingerprinted between regroupings
+
+fingerprint_status = {"running": False, "pending": 0, "completed": 0, "failed": 0}
+
+_fingerprint_lock = threading.Lock()
+
+
+def pending_fingerprints(db) -> list:
+    """Active, never-fingerprinted members of unresolved groups in the ambiguous band.
+
+    A stored fingerprint caches the result; an empty one records that fpcalc
+    failed so the track isn't retried.
+    """
+    low, high = AMBIGUOUS_CONFIDENCE
+    return db.execute("""
+        SELECT DISTINCT t.id, t.file_path, t.mtime_ns FROM dupe_groups g
+        JOIN dupe_group_members m ON m.group_id = g.id
+        JOIN tracks t ON t.id = m.track_id
+        WHERE g.resolved = 0 AND g.confidence >= ? AND g.confidence < ?
+            AND g.match_type IN ('metadata', 'fuzzy')
+            AND t.status = 'active' AND t.fingerprint IS NULL
+        ORDER BY t.id
+    """, (low, high)).fetchall()
+
+
+def fingerprint_tracks(rows, workers: int = LAZY_WORKERS, status: dict = None) -> int:
+    """Fingerprint (id, file_path, mtime_ns) rows at low priority and store the results.
+
+    Fingerprints, and b"" for files fpcalc can't decode, are stored; a file
+    that timed out is left to try again later, as is a row whose file changed
+    while it was being read. Raises FileNotFoundError, storing nothing, if
+    fpcalc isn't installed. Returns the number of tracks fpcalc ran on.
+    """
+    pool = FingerprintPool(workers=max(1, min(workers, len(rows))), nice=LAZY_NICE)
+    try:
+        for r in rows:
+            pool.submit({"id": r["id"], "file_path": r["file_path"], "mtime_ns": r["mtime_ns"]})
+        done = list(pool.finish())
+    finally:
+        pool.close()
+    if pool.stats["missing"]:
+        raise FileNotFoundError("fpcalc is not installed")
+
+    with get_db() as db:
+        db.executemany(
+            "UPDATE tracks SET fingerprint = ? WHERE id = ? AND mtime_ns IS ? AND fingerprint IS NULL",
+            [(item["fingerprint"], item["id"], item["mtime_ns"]) for item in done if item["fingerprint"] is not None]
+        )
+    if status is not None:
+        status["completed"] += sum(1 for item in done if item["fingerprint"])
+        status["failed"] += sum(1 for item in done if not item["fingerprint"])
+    return len(done)
+
+
+def run_fingerprinting():
+    """Background task: fingerprint ambiguous group members until none are left.
+
+    Groups are updated after every batch, so a confirmed or overruled group
+    leaves the band and later batches only see what is still undecided.
+    """
+    from routes.dupes import auto_resolve_high_confidence, update_dupe_groups
+
+    if not _fingerprint_lock.acquire(blocking=False):
+        return
+    fingerprint_status.update(running=True, pending=0, completed=0, failed=0)
+    tried: set[int] = set()
+    try:
+        while True:
+            with get_db() as db:
+                rows = [r for r in pending_fingerprints(db) if r["id"] not in tried]
+            fingerprint_status["pending"] = len(rows)
+            if not rows:
+                break
+            batch = rows[:LAZY_BATCH]
+            tried.update(r["id"] for r in batch)
+            fingerprint_tracks(batch, status=fingerprint_status)
+            update_dupe_groups()
+        if tried:
+            auto_resolve_high_confidence()
+        if fingerprint_status["completed"] or fingerprint_status["failed"]:
+            logger.info(
+                f"Fingerprinted {fingerprint_status['completed']} tracks in ambiguous duplicate groups "
+                f"({fingerprint_status['failed']} failed)"
+            )
+    except FileNotFoundError:
+        logger.warning("fpcalc is not installed; ambiguous duplicate groups were not fingerprinted")
+    except Exception as e:
+        logger.error(f"Background fingerprinting failed: {e}")
+    finally:
+        fingerprint_status["running"] = False
+        _fingerprint_lock.release()
+
+
+def fingerprint_threshold() -> float:
+    """The fingerprint_threshold setting, or its default if it isn't a number."""
+    from routes.settings import get_setting
+
+    try:
+        return float(get_setting("fingerprint_threshold"))
+    except ValueError:
+        return 0.85
+
+
+def start_fingerprinting() -> bool:
+    """Run run_fingerprinting on a daemon thread when fingerprint_mode is lazy. Returns whether it started."""
+    from routes.settings import get_setting
+
+    if get_setting("fingerprint_mode") != "lazy" or fingerprint_status["running"]:
+        return False
+    threading.Thread(target=run_fingerprinting, daemon=True, name="fingerprinter").start()
+    return True
+
+
+def verify_upgrade(track_id: int, download: Path, threshold: float) -> Optional[bytes]:
+    """Check a downloaded upgrade against the track it replaces by fingerprint.
+
+    The original's fingerprint comes from the cache, or is computed and cached
+    now. Raises ValueError if both fingerprints exist and don't match. Returns
+    the download's fingerprint to store (b"" if fpcalc couldn't decode it,
+    None if fpcalc couldn't run).
+    """
+    with get_db() as db:
+        row = db.execute("SELECT file_path, fingerprint FROM tracks WHERE id = ?", (track_id,)).fetchone()
+    original = row["fingerprint"]
+    if original is None:
+        original = generate_fingerprint(Path(row["file_path"]))
+        if original is not None:
+            with get_db() as db:
+                db.execute(
+                    "UPDATE tracks SET fingerprint = ? WHERE id = ? AND fingerprint IS NULL", (original, track_id)
+                )
+    downloaded = generate_fingerprint(download)
+    if original and downloaded and not group_by_fingerprint(
+        [(0, unpack_fingerprint(original)), (1, unpack_fingerprint(downloaded))], threshold
+    ):
+        raise ValueError("Downloaded audio doesn't match the original")
+    return downloaded
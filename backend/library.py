@@ -0,0 +1,217 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+from database import NORM_COLUMNS
+from dedup import grouping_key
+from scanner import quality_score, read_track_metadata, walk_audio_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+SQL_CHUNK = 500  # stay well under SQLite's bound-parameter limit
+
+# Columns written from scanned metadata, in INSERT order. The normalized
+# grouping key (see dedup.grouping_key) and the quality score are derived
+# from the metadata and come last.
+_SCANNED_COLUMNS = (
+    "file_path", "file_size", "format", "bitrate", "bit_depth", "sample_rate",
+    "duration", "artist", "album_artist", "album", "title", "track_number",
+    "disc_number", "fingerprint", "mtime_ns", "inode", "audio_hash",
+)
+TRACK_COLUMNS = _SCANNED_COLUMNS + NORM_COLUMNS + ("quality_score",)
+
+# Upsert, so a row written concurrently by another writer (watcher, upgrade
+# placement) for the same path is refreshed rather than failing the chunk
+_INSERT_SQL = (
+    f"INSERT INTO tracks ({', '.join(TRACK_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(TRACK_COLUMNS))}) "
+    "ON CONFLICT(file_path) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in TRACK_COLUMNS[1:])
+    + ", scanned_at = CURRENT_TIMESTAMP"
+)
+_UPDATE_SQL = (
+    "UPDATE tracks SET "
+    + ", ".join(f"{c} = ?" for c in TRACK_COLUMNS[1:])
+    + ", scanned_at = CURRENT_TIMESTAMP,"
+    " status = CASE WHEN status = 'deleted' THEN 'active' ELSE status END"
+    " WHERE id = ?"
+)
+
+
+def load_existing(db, paths: list[str] = None) -> dict:
+    """Map file_path -> row (id, file_size, mtime_ns, inode, status) for known tracks.
+
+    Loads every track, or only those at ``paths`` if given.
+    """
+    sql = "SELECT id, file_path, file_size, mtime_ns, inode, status FROM tracks"
+    if paths is None:
+        return {r["file_path"]: r for r in db.execute(sql).fetchall()}
+    existing = {}
+    paths = list(paths)
+    for i in range(0, len(paths), SQL_CHUNK):
+        chunk = paths[i:i + SQL_CHUNK]
+        rows = db.execute(f"{sql} WHERE file_path IN ({','.join('?' * len(chunk))})", chunk)
+        existing.update((r["file_path"], r) for r in rows)
+    return existing
+
+
+class TrackWriter:
+    """Buffer scanned tracks and write them in chunked transactions.
+
+    Existence is checked against ``existing`` (see load_existing) instead of a
+    SELECT per file. New files are inserted and modified files updated with
+    executemany, and the connection is committed after every chunk so a crash
+    loses at most one chunk and other connections see progress as it happens.
+    """
+
+    def __init__(self, db, existing: dict, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.existing = existing
+        self.batch_size = max(1, batch_size)
+        self.inserted = 0
+        self.updated = 0
+        self._inserts = []
+        self._updates = []
+        self._states = []
+
+    def write(self, meta: dict):
+        """Queue a scanned track: insert if the path is new, otherwise update its row."""
+        row = self.existing.get(meta["file_path"])
+        values = tuple(meta.get(c) for c in _SCANNED_COLUMNS) + grouping_key(meta) + (quality_score(meta),)
+        if row:
+            self._updates.append(values[1:] + (row["id"],))
+        else:
+            self._inserts.append(values)
+        self._maybe_flush()
+
+    def record_state(self, track_id: int, mtime_ns: int, inode: int):
+        """Queue a file-state backfill for a row scanned before states were tracked."""
+        self._states.append((mtime_ns, inode, track_id))
+        self._maybe_flush()
+
+    def flush(self):
+        if self._inserts:
+            self.db.executemany(_INSERT_SQL, self._inserts)
+            self.inserted += len(self._inserts)
+        if self._updates:
+            self.db.executemany(_UPDATE_SQL, self._updates)
+            self.updated += len(self._updates)
+        if self._states:
+            self.db.executemany("UPDATE tracks SET mtime_ns = ?, inode = ? WHERE id = ?", self._states)
+        self.db.commit()
+        self._inserts, self._updates, self._states = [], [], []
+
+    def _maybe_flush(self):
+        if len(self._inserts) + len(self._updates) + len(self._states) >= self.batch_size:
+            self.flush()
+
+
+def _prefix_range(root: Path) -> tuple[str, str]:
+    """Bounds for an index-friendly ``file_path >= lo AND file_path < hi`` subtree match."""
+    prefix = str(root).rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def mark_stale(db, root: Path, seen: set[str], unreadable: Iterable[str] = ()) -> int:
+    """Mark active tracks under root that are not in ``seen`` as deleted.
+
+    The stale set is the difference between the active paths in the DB and the
+    paths the walk found, applied in one UPDATE. Nothing is marked if the walk
+    found no files at all while the DB has some, since that almost always means
+    the library mount is missing rather than emptied. Tracks at or under an
+    ``unreadable`` path (one the walk got an error on) are left alone.
+    """
+    lo, hi = _prefix_range(root)
+    active = db.execute(
+        "SELECT id, file_path FROM tracks WHERE status = 'active' AND file_path >= ? AND file_path < ?",
+        (lo, hi)
+    ).fetchall()
+    if active and not seen:
+        logger.warning(f"No audio files found under {root}; skipping stale detection")
+        return 0
+
+    skipped = tuple(p for u in unreadable for p in (u, u.rstrip(os.sep) + os.sep))
+    stale_ids = [
+        (r["id"],) for r in active
+        if r["file_path"] not in seen and not (skipped and r["file_path"].startswith(skipped))
+    ]
+    if not stale_ids:
+        return 0
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS stale_ids (id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM temp.stale_ids")
+    db.executemany("INSERT INTO temp.stale_ids (id) VALUES (?)", stale_ids)
+    db.execute("UPDATE tracks SET status = 'deleted' WHERE id IN (SELECT id FROM temp.stale_ids)")
+    db.execute("DELETE FROM temp.stale_ids")
+    return len(stale_ids)
+
+
+def find_stale(db, root: Path) -> int:
+    """Walk just ``root`` (no metadata reads) and mark tracks missing under it as deleted."""
+    root = Path(root)
+    if not root.is_dir():
+        logger.warning(f"{root} is not a directory; skipping stale detection")
+        return 0
+    errors = []
+    seen = {entry.path for entry in walk_audio_files(root, errors)}
+    return mark_stale(db, root, seen, errors)
+
+
+def mark_missing(db, paths: list[str]) -> int:
+    """Mark active tracks at, or anywhere under, each path as deleted if it no longer exists."""
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            continue
+        lo, hi = _prefix_range(Path(path))
+        cursor = db.execute(
+            "UPDATE tracks SET status = 'deleted' WHERE status = 'active'"
+            " AND (file_path = ? OR (file_path >= ? AND file_path < ?))",
+            (path, lo, hi)
+        )
+        removed += cursor.rowcount
+    return removed
+
+
+def backfill_audio_hashes(db, workers: int = 1) -> int:
+    """Hash the audio of active tracks scanned before audio hashes were stored.
+
+    Unchanged files are never re-read by a scan, so this reads each such file
+    once, on a thread pool, committing every SQL_CHUNK rows. Files that can't
+    be decoded get "" so they aren't retried; files that raised OSError stay
+    NULL for the next scan. Returns the number of rows hashed.
+    """
+    rows = db.execute(
+        "SELECT id, file_path FROM tracks WHERE status = 'active' AND audio_hash IS NULL"
+    ).fetchall()
+    if not rows:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        hashes = pool.map(_audio_hash, [r["file_path"] for r in rows])
+        hashed = 0
+        updates = []
+        for row, audio_hash in zip(rows, hashes):
+            if audio_hash is None:
+                continue
+            hashed += 1
+            updates.append((audio_hash, row["id"]))
+            if len(updates) >= SQL_CHUNK:
+                db.executemany("UPDATE tracks SET audio_hash = ? WHERE id = ?", updates)
+                db.commit()
+                updates = []
+        db.executemany("UPDATE tracks SET audio_hash = ? WHERE id = ?", updates)
+        db.commit()
+    return hashed
+
+
+def _audio_hash(file_path: str) -> Optional[str]:
+    """The file's audio hash, "" if it can't be decoded, or None if it couldn't be read."""
+    try:
+        return read_track_metadata(Path(file_path))["audio_hash"]
+    except OSError as e:
+        logger.warning(f"Could not read {file_path} to hash it: {e}")
+        return None
+    except Exception:
+        return ""
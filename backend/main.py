@@ -2,7 +2,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from database import init_db
+from database import get_db, init_db
 import threading
 import time
 import os
@@ -14,9 +14,16 @@ logger = logging.getLogger(__name__)
 
 
 def _scheduled_scan_loop():
-    """Run a full scan (library + upgrades) daily at 1 AM."""
+    """Run a full scan (library + upgrades) daily at 1 AM.
+
+    While watch mode is indexing changes as they happen, the full scan is only a
+    reconciliation pass and runs every reconcile_interval_days instead.
+    """
     from routes.scan import run_scan, scan_status
+    from routes.settings import get_setting
+    from watcher import watch_status
 
+    last_full_scan = None
     while True:
         now = datetime.now()
         target = now.replace(hour=1, minute=0, second=0, microsecond=0)
@@ -30,21 +37,112 @@ def _scheduled_scan_loop():
             logger.info("Scheduled scan skipped — scan already in progress")
             continue
 
+        if watch_status["running"] and last_full_scan is not None:
+            try:
+                interval = timedelta(days=float(get_setting("reconcile_interval_days")))
+            except ValueError:
+                interval = timedelta(days=7)
+            if datetime.now() - last_full_scan < interval:
+                logger.info("Scheduled scan skipped — watch mode is keeping the library current")
+                continue
+
         logger.info("Starting scheduled scan (1 AM daily)")
         try:
             music_path = Path(os.environ.get("MUSIC_PATH", "/music"))
             run_scan(music_path)
+            last_full_scan = datetime.now()
             logger.info("Scheduled scan complete")
         except Exception as e:
             logger.error(f"Scheduled scan failed: {e}")
 
 
+def _trash_reconcile_loop():
+    """Reconcile the trash ledger with the disk at startup and every trash_reconcile_hours."""
+    from file_manager import sweep_partial_copies
+    from routes.settings import get_setting
+    from trash_ledger import reconcile_trash
+
+    trash_dir = Path(os.environ.get("TRASH_PATH", "/trash"))
+    while True:
+        try:
+            swept = sweep_partial_copies(trash_dir)
+            if swept:
+                logger.info(f"Removed {swept} abandoned partial copies from the trash")
+            with get_db() as db:
+                counts = reconcile_trash(db, trash_dir)
+            if any(counts.values()):
+                logger.info(
+                    f"Trash ledger reconciled: {counts['added']} added, {counts['removed']} removed, "
+                    f"{counts['resized']} resized"
+                )
+            if counts["unscanned"]:
+                logger.warning(f"Could not scan {counts['unscanned']} paths in the trash; kept their ledger entries")
+        except Exception as e:
+            logger.error(f"Trash reconcile failed: {e}")
+        try:
+            hours = float(get_setting("trash_reconcile_hours"))
+        except ValueError:
+            hours = 6
+        time.sleep(max(hours, 0.1) * 3600)
+
+
+def _trash_retention_loop():
+    """Nightly at 3 AM, purge up to trash_purge_slice files older than trash_retention_days, if set."""
+    from routes.settings import get_setting
+    from trash_purge import purge_status, run_purge
+
+    trash_dir = Path(os.environ.get("TRASH_PATH", "/trash"))
+    while True:
+        now = datetime.now()
+        target = now.replace(hour=3, minute=0, second=0, microsecond=0)
+        if target <= now:
+            target += timedelta(days=1)
+        time.sleep((target - now).total_seconds())
+
+        try:
+            days = float(get_setting("trash_retention_days"))
+            limit = int(get_setting("trash_purge_slice"))
+        except ValueError:
+            days, limit = 0, 2000
+        if days <= 0:
+            continue
+        if purge_status["running"]:
+            logger.info("Scheduled trash purge skipped — purge already in progress")
+            continue
+        logger.info(f"Purging up to {limit} trashed files older than {days:g} days")
+        run_purge(trash_dir, days, limit)
+
+
+def _start_watcher(stop_event: threading.Event):
+    """Start watch mode in a background thread if the watch_mode setting enables it."""
+    from routes.settings import get_setting
+    from watcher import resolve_mode, watch_library
+
+    music_path = Path(os.environ.get("MUSIC_PATH", "/music"))
+    mode = resolve_mode(get_setting("watch_mode"), music_path)
+    if mode == "off":
+        return
+    try:
+        poll_seconds = int(get_setting("watch_poll_seconds"))
+    except ValueError:
+        poll_seconds = 300
+    t = threading.Thread(
+        target=watch_library, args=(music_path, mode, stop_event, poll_seconds), daemon=True
+    )
+    t.start()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
     t = threading.Thread(target=_scheduled_scan_loop, daemon=True)
     t.start()
+    threading.Thread(target=_trash_reconcile_loop, daemon=True).start()
+    threading.Thread(target=_trash_retention_loop, daemon=True).start()
+    stop_watching = threading.Event()
+    _start_watcher(stop_watching)
     yield
+    stop_watching.set()
 
 app = FastAPI(title="plex-dedup", version="0.1.0", lifespan=lifespan)
 
@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from database import get_db
+from file_manager import move_file, trash_destination
+from trash_ledger import record_trashed
+
+logger = logging.getLogger(__name__)
+
+RESOLVE_WORKERS = 8   # concurrent file moves
+RESOLVE_CHUNK = 500   # groups planned, moved and committed together
+
+resolve_status = {"running": False, "phase": "idle", "total": 0, "resolved": 0, "failed": 0, "moved": 0}
+
+# One batch at a time, so two batches never plan the same trash paths or tracks
+_resolve_lock = threading.Lock()
+
+
+def resolve_groups(
+    groups: list[tuple[int, int]], trash_dir: Path, music_root: Path,
+    workers: int = RESOLVE_WORKERS, status: dict = None,
+) -> int:
+    """Resolve (group_id, keep_track_id) pairs, trashing every other active member.
+
+    Groups are handled RESOLVE_CHUNK at a time: the members to move are read
+    in one query and given trash paths up front, the moves run on a bounded
+    thread pool, and the chunk's track, file_actions and group updates are
+    committed together with their trash ledger entries. A group whose moves
+    fail stays unresolved. A track kept by any group in the batch is never
+    trashed by another. Returns the number of groups resolved.
+    """
+    kept = {keep_id for _, keep_id in groups}
+    resolved = 0
+    with _resolve_lock, get_db() as db, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        reserved: set = set()
+        planned: set[int] = set()
+        for start in range(0, len(groups), RESOLVE_CHUNK):
+            chunk = groups[start:start + RESOLVE_CHUNK]
+            moves, failed = _plan_moves(db, chunk, kept, planned, trash_dir, music_root, reserved)
+
+            futures = {pool.submit(_trash, Path(src), dest): (group_id, track_id, src, dest)
+                       for group_id, track_id, src, dest in moves}
+            actions = []
+            trashed = []
+            for future in as_completed(futures):
+                group_id, track_id, src, dest = futures[future]
+                try:
+                    size = future.result()
+                except OSError as e:
+                    logger.error(f"Could not trash {src} for group {group_id}: {e}")
+                    failed.add(group_id)
+                    continue
+                actions.append((track_id, src, str(dest)))
+                trashed.append((str(dest), size))
+
+            done = [(keep_id, group_id) for group_id, keep_id in chunk if group_id not in failed]
+            db.executemany("UPDATE tracks SET status = 'trashed' WHERE id = ?", [(a[0],) for a in actions])
+            db.executemany(
+                "INSERT INTO file_actions (track_id, action, source_path, dest_path) VALUES (?, 'trash', ?, ?)",
+                actions
+            )
+            db.executemany("UPDATE dupe_groups SET resolved = 1, kept_track_id = ? WHERE id = ?", done)
+            record_trashed(db, trash_dir, trashed)
+            db.commit()
+
+            resolved += len(done)
+            if status is not None:
+                status["resolved"] += len(done)
+                status["failed"] += len(failed)
+                status["moved"] += len(actions)
+    return resolved
+
+
+def _trash(src: Path, dest: Path) -> int:
+    """Move one file into the trash and return its size for the ledger."""
+    move_file(src, dest)
+    return os.stat(dest).st_size
+
+
+def _plan_moves(db, chunk, kept: set, planned: set, trash_dir: Path, music_root: Path, reserved: set):
+    """(group_id, track_id, source path, trash path) for each member a chunk of groups trashes.
+
+    Also returns the ids of groups that can't be resolved: those with a member
+    that can't be placed in the trash, or that another group in the batch
+    keeps. Nothing is moved for them, so they stay listed as duplicates.
+    """
+    marks = ",".join("?" * len(chunk))
+    rows = db.execute(f"""
+        SELECT m.group_id, t.id, t.file_path FROM dupe_group_members m
+        JOIN tracks t ON t.id = m.track_id
+        WHERE m.group_id IN ({marks}) AND t.status = 'active'
+        ORDER BY m.group_id, t.id
+    """, [group_id for group_id, _ in chunk])
+    keep_of = dict(chunk)
+    rows = rows.fetchall()
+    failed = set()
+    for r in rows:
+        # Never trash a track another group keeps
+        if r["id"] in kept and r["id"] != keep_of[r["group_id"]]:
+            logger.warning(f"Group {r['group_id']} not resolved: another group keeps {r['file_path']}")
+            failed.add(r["group_id"])
+
+    moves = []
+    for r in rows:
+        # Move a track that is in two groups (metadata and fingerprint) only once
+        if r["group_id"] in failed or r["id"] in kept or r["id"] in planned:
+            continue
+        try:
+            dest = trash_destination(Path(r["file_path"]), trash_dir, music_root, reserved)
+        except ValueError:
+            logger.error(f"{r['file_path']} is outside {music_root}; not trashing it")
+            failed.add(r["group_id"])
+            continue
+        planned.add(r["id"])
+        moves.append((r["group_id"], r["id"], r["file_path"], dest))
+    return moves, failed
+
+
+def run_resolve(groups: list[tuple[int, int]], trash_dir: Path, music_root: Path):
+    """Background task: resolve groups, reporting progress in resolve_status."""
+    resolve_status.update(running=True, phase="resolving", total=len(groups), resolved=0, failed=0, moved=0)
+    try:
+        resolved = resolve_groups(groups, trash_dir, music_root, status=resolve_status)
+        logger.info(f"Resolved {resolved} of {len(groups)} duplicate groups")
+        resolve_status["phase"] = "complete"
+    except Exception as e:
+        logger.error(f"Batch resolve failed: {e}")
+        resolve_status["phase"] = "failed"
+    finally:
+        resolve_status["running"] = False
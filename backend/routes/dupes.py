@@ -1,10 +1,23 @@
-from fastapi import APIRouter
-from database import get_db
-from dedup import group_by_metadata, find_duplicates
+from fastapi import APIRouter, BackgroundTasks
+from collections import Counter
+from itertools import groupby
+from database import API_TRACK_COLUMNS, GROUP_KEY_SEP, NORM_COLUMNS, USABLE_KEY_SQL, get_db
+from dedup import (
+    FP_COMPARE_LENGTH, FP_MAX_POSTINGS, FP_MIN_OVERLAP, FUZZY_MAX_CONFIDENCE, METADATA_MAX_GROUP,
+    compute_confidence, confirm_with_fingerprints, fingerprint_keys, group_by_fingerprint,
+    group_by_fuzzy_metadata, find_duplicates,
+)
+from fingerprint import unpack_fingerprint
+from routes.settings import get_setting
+from track_store import TrackStore
 from file_manager import trash_file
+from resolver import resolve_groups, resolve_status, run_resolve
+from fingerprinter import fingerprint_status, fingerprint_threshold, start_fingerprinting
 from pathlib import Path
 import logging
 import os
+import threading
+import numpy as np
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/dupes", tags=["dupes"])
@@ -26,89 +39,488 @@ def auto_resolve_high_confidence(threshold: float = None) -> int:
 
     with get_db() as db:
         groups = db.execute(
-            "SELECT id, kept_track_id, confidence FROM dupe_groups WHERE resolved = 0 AND confidence >= ?",
+            "SELECT id, kept_track_id FROM dupe_groups WHERE resolved = 0 AND confidence >= ?",
             (threshold,)
         ).fetchall()
 
-    resolved = 0
-    for g in groups:
-        try:
-            resolve_group(g["id"], g["kept_track_id"])
-            resolved += 1
-        except Exception as e:
-            logger.error(f"Auto-resolve failed for group {g['id']}: {e}")
+    trash_dir, music_root = _library_paths()
+    resolved = resolve_groups([(g["id"], g["kept_track_id"]) for g in groups], trash_dir, music_root)
 
     if resolved > 0:
         logger.info(f"Auto-resolved {resolved} duplicate groups (threshold: {threshold*100:.0f}%)")
     return resolved
 
-@router.post("/analyze")
-def analyze_dupes():
-    with get_db() as db:
-        rows = db.execute("SELECT * FROM tracks WHERE status = 'active'").fetchall()
-        tracks = [dict(r) for r in rows]
+def _library_paths() -> tuple[Path, Path]:
+    """(trash directory, music root) from the environment."""
+    return Path(os.environ.get("TRASH_PATH", "/trash")), Path(os.environ.get("MUSIC_PATH", "/music"))
 
-    groups = group_by_metadata(tracks)
-    results = []
+def _fuzzy_threshold() -> float:
+    try:
+        return float(get_setting("fuzzy_threshold"))
+    except ValueError:
+        return 0.8
 
-    with get_db() as db:
-        db.execute("DELETE FROM dupe_group_members WHERE group_id IN (SELECT id FROM dupe_groups WHERE resolved = 0)")
-        db.execute("DELETE FROM dupe_groups WHERE resolved = 0")
-
-        for group in groups:
-            result = find_duplicates(group)
-            cursor = db.execute(
-                "INSERT INTO dupe_groups (match_type, confidence, kept_track_id) VALUES (?, ?, ?)",
-                ("metadata", result["confidence"], result["keep_id"])
-            )
-            group_id = cursor.lastrowid
-            for track in group:
-                db.execute(
-                    "INSERT INTO dupe_group_members (group_id, track_id) VALUES (?, ?)",
-                    (group_id, track["id"])
+# Columns find_duplicates needs to rank and score a group's members. Members
+# are read best first (ORDER BY quality_score DESC) so ranking is a single pass.
+_RANK_COLUMNS = ("id", "format", "bitrate", "bit_depth", "sample_rate", "duration", "quality_score")
+
+# Serializes analyses started by scans, the watcher and the API
+_analysis_lock = threading.Lock()
+
+def _claim_dirty(db):
+    """Move the keys and track ids queued by the tracks triggers into this connection's temp tables.
+
+    The queue rows are deleted in the transaction this opens, which the
+    caller commits together with the regrouped results: if the analysis
+    fails or the process dies first, the queue is left as it was.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    db.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS analysis_keys (
+            norm_artist TEXT, norm_title TEXT, norm_album TEXT, group_key TEXT,
+            PRIMARY KEY (norm_artist, norm_title, norm_album)
+        )
+    """)
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS analysis_tracks (track_id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM temp.analysis_keys")
+    db.execute("DELETE FROM temp.analysis_tracks")
+    db.executemany(
+        "INSERT OR IGNORE INTO temp.analysis_keys VALUES (?, ?, ?, ?)",
+        ((*r["group_key"].split(GROUP_KEY_SEP), r["group_key"])
+         for r in db.execute("SELECT group_key FROM dupe_dirty_keys"))
+    )
+    db.execute("INSERT INTO temp.analysis_tracks SELECT track_id FROM dupe_dirty_tracks")
+    db.execute("DELETE FROM dupe_dirty_keys")
+    db.execute("DELETE FROM dupe_dirty_tracks")
+
+def _store_group(db, group_id, match_type: str, group: list[dict], similarity=None, group_key=None):
+    """Create, update or delete one unresolved group, keeping its ID. Returns the result or None."""
+    if len(group) < 2:
+        if group_id is not None:
+            db.execute("DELETE FROM dupe_group_members WHERE group_id = ?", (group_id,))
+            db.execute("DELETE FROM dupe_groups WHERE id = ?", (group_id,))
+        return None
+
+    result = find_duplicates(group)
+    if match_type == "fuzzy":
+        # Near-identical tags only suggest a duplicate; durations have to agree too
+        result["confidence"] = round(min(similarity * result["confidence"], FUZZY_MAX_CONFIDENCE), 4)
+    elif similarity is not None:
+        result["confidence"] = similarity
+    member_ids = sorted(t["id"] for t in group)
+    if group_id is None:
+        cursor = db.execute(
+            "INSERT INTO dupe_groups (match_type, confidence, kept_track_id, group_key) VALUES (?, ?, ?, ?)",
+            (match_type, result["confidence"], result["keep_id"], group_key)
+        )
+        group_id = cursor.lastrowid
+    else:
+        db.execute(
+            "UPDATE dupe_groups SET confidence = ?, kept_track_id = ? WHERE id = ?",
+            (result["confidence"], result["keep_id"], group_id)
+        )
+        current = [r["track_id"] for r in db.execute(
+            "SELECT track_id FROM dupe_group_members WHERE group_id = ? ORDER BY track_id", (group_id,)
+        )]
+        if current == member_ids:
+            return {"group_id": group_id, "match_type": match_type, "changed": False, **result}
+        db.execute("DELETE FROM dupe_group_members WHERE group_id = ?", (group_id,))
+    db.executemany(
+        "INSERT INTO dupe_group_members (group_id, track_id) VALUES (?, ?)",
+        [(group_id, tid) for tid in member_ids]
+    )
+    return {"group_id": group_id, "match_type": match_type, "changed": True, **result}
+
+def _same_key(other: str) -> str:
+    """SQL matching tracks t to another row on the grouping key columns."""
+    return " AND ".join(f"t.{c} = {other}.{c}" for c in NORM_COLUMNS)
+
+def _duplicate_candidates(db):
+    """Yield (group_key, members) for each claimed key shared by 2+ active tracks.
+
+    Grouping happens in SQLite on the indexed key columns, so only members of
+    duplicate groups reach Python, one group at a time. CROSS JOIN keeps the
+    claimed keys as the outer loop, so the work follows the size of the change.
+    Unusable keys and keys shared by more than METADATA_MAX_GROUP tracks are
+    skipped (see _skipped_tracks). Members carry their fingerprint, if any.
+    """
+    rows = db.execute(f"""
+        WITH dupes AS (
+            SELECT t.norm_artist, t.norm_title, t.norm_album
+            FROM temp.analysis_keys k CROSS JOIN tracks t ON {_same_key("k")}
+            WHERE t.status = 'active' AND {USABLE_KEY_SQL.format(row="k")}
+            GROUP BY t.norm_artist, t.norm_title, t.norm_album
+            HAVING COUNT(*) BETWEEN 2 AND {METADATA_MAX_GROUP}
+        )
+        SELECT d.norm_artist || char(31) || d.norm_title || char(31) || d.norm_album AS group_key,
+            {", ".join(f"t.{c}" for c in _RANK_COLUMNS)}, t.fingerprint
+        FROM dupes d JOIN tracks t ON {_same_key("d")}
+        WHERE t.status = 'active'
+        ORDER BY d.norm_artist, d.norm_title, d.norm_album, t.quality_score DESC, t.id
+    """)
+    for key, members in groupby(rows, key=lambda r: r["group_key"]):
+        yield key, [dict(m) for m in members]
+
+def _skipped_tracks(db, claimed_only: bool = True) -> int:
+    """Active tracks sharing a key that metadata grouping skips, under the claimed keys or all keys.
+
+    These are untagged files whose paths didn't supply a usable key, and
+    generic keys ("Unknown Artist" / "Track 01") shared by too many tracks.
+    """
+    source = f"temp.analysis_keys k CROSS JOIN tracks t ON {_same_key('k')}" if claimed_only else "tracks t"
+    return db.execute(f"""
+        SELECT IFNULL(SUM(n), 0) FROM (
+            SELECT COUNT(*) AS n FROM {source}
+            WHERE t.status = 'active'
+            GROUP BY t.norm_artist, t.norm_title, t.norm_album
+            HAVING COUNT(*) > 1
+                AND (NOT ({USABLE_KEY_SQL.format(row="t")}) OR COUNT(*) > {METADATA_MAX_GROUP})
+        )
+    """).fetchone()[0]
+
+def _update_metadata_groups(db) -> list[tuple]:
+    """Regroup the active tracks under each claimed key. Returns (old_id, result) pairs."""
+    existing = {
+        r["group_key"]: r["id"] for r in db.execute("""
+            SELECT g.id, g.group_key FROM dupe_groups g
+            JOIN temp.analysis_keys k ON g.group_key = k.group_key
+            WHERE g.resolved = 0 AND g.match_type = 'metadata'
+        """)
+    }
+    threshold = fingerprint_threshold()
+    outcomes = []
+    for key, members in _duplicate_candidates(db):
+        group_id = existing.pop(key, None)
+        confidence = _fingerprint_checked(members, threshold)
+        outcomes.append((group_id, _store_group(db, group_id, "metadata", members, confidence, group_key=key)))
+    # Claimed keys left without duplicates
+    for group_id in existing.values():
+        outcomes.append((group_id, _store_group(db, group_id, "metadata", [])))
+    return outcomes
+
+def _fingerprint_checked(members: list[dict], threshold: float):
+    """Confidence for a metadata group once every member is fingerprinted, else None.
+
+    Pops each member's fingerprint. With fingerprint_mode lazy, only members
+    of ambiguous groups are fingerprinted (see fingerprinter).
+    """
+    prints = [m.pop("fingerprint") for m in members]
+    if not all(prints):
+        return None
+    return confirm_with_fingerprints(
+        compute_confidence(members), [unpack_fingerprint(p) for p in prints], threshold
+    )
+
+def _update_exact_groups(db) -> list[tuple]:
+    """Regroup active tracks by audio hash for the hashes the change reaches, keeping group IDs.
+
+    Those are the hashes of the claimed tracks, of the other members of their
+    exact groups, and of tracks under a claimed key, whose metadata group may
+    have changed. One query then lists the members of each such hash shared by
+    2+ tracks that no single metadata group already covers, with confidence
+    1.0 and nothing decoded. Returns (old_id, result) pairs.
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS analysis_hashes (audio_hash TEXT PRIMARY KEY)")
+    db.execute("DELETE FROM temp.analysis_hashes")
+    db.execute(f"""
+        INSERT OR IGNORE INTO temp.analysis_hashes
+        SELECT t.audio_hash FROM temp.analysis_tracks a JOIN tracks t ON t.id = a.track_id
+        WHERE t.audio_hash != ''
+        UNION
+        SELECT t.audio_hash FROM temp.analysis_tracks a
+        JOIN dupe_group_members m ON m.track_id = a.track_id
+        JOIN dupe_groups g ON g.id = m.group_id
+        JOIN dupe_group_members mates ON mates.group_id = g.id
+        JOIN tracks t ON t.id = mates.track_id
+        WHERE g.match_type = 'exact' AND g.resolved = 0 AND t.audio_hash != ''
+        UNION
+        SELECT t.audio_hash FROM temp.analysis_keys k CROSS JOIN tracks t ON {_same_key("k")}
+        WHERE t.audio_hash != ''
+    """)
+    rows = db.execute("""
+        WITH members AS (
+            SELECT t.id, t.audio_hash FROM temp.analysis_hashes h CROSS JOIN tracks t ON t.audio_hash = h.audio_hash
+            WHERE t.status = 'active'
+        ),
+        shared AS (
+            SELECT audio_hash, COUNT(*) AS n, GROUP_CONCAT(id) AS ids FROM members
+            GROUP BY audio_hash HAVING COUNT(*) > 1
+        ),
+        covered AS (
+            SELECT mb.audio_hash, COUNT(*) AS n FROM members mb
+            JOIN dupe_group_members m ON m.track_id = mb.id
+            JOIN dupe_groups g ON g.id = m.group_id
+            WHERE g.match_type = 'metadata' AND g.resolved = 0
+            GROUP BY mb.audio_hash, m.group_id
+        )
+        SELECT s.ids FROM shared s
+        WHERE NOT EXISTS (SELECT 1 FROM covered c WHERE c.audio_hash = s.audio_hash AND c.n = s.n)
+    """).fetchall()
+    components = [([int(i) for i in r["ids"].split(",")], 1.0) for r in rows]
+    scope = {r[0] for r in db.execute("""
+        SELECT track_id FROM temp.analysis_tracks
+        UNION
+        SELECT t.id FROM temp.analysis_hashes h CROSS JOIN tracks t ON t.audio_hash = h.audio_hash
+    """)}
+    return _reconcile_groups(db, "exact", components, scope)
+
+def _update_fingerprint_groups(db) -> list[tuple]:
+    """Regroup the fingerprints the claimed tracks can reach, keeping existing group IDs.
+
+    Claimed and never-indexed tracks are (re)indexed in fingerprint_postings.
+    Starting from them and the fingerprint groups they belong to, tracks
+    sharing index keys are pulled in and grouped, and every newly linked
+    track is expanded the same way until no link leads anywhere new, so the
+    work follows the change rather than the library. Groups that a single
+    metadata group already covers (every member shares one grouping key) are
+    dropped. Returns (old_id, result) pairs.
+    """
+    claimed = [r["track_id"] for r in db.execute("SELECT track_id FROM temp.analysis_tracks")]
+    seeds = _index_fingerprints(db) | _fingerprint_group_mates(db, claimed)
+    if not seeds:
+        return []
+
+    keys = {}
+    prints = {}
+    pool: set[int] = set()
+    expanded: set[int] = set()
+    frontier = seeds
+    groups = []
+    while frontier:
+        expanded |= frontier
+        added = (frontier | _fingerprint_candidates(db, frontier)) - pool
+        added |= _fingerprint_group_mates(db, added)
+        pool |= added
+        for chunk in _chunks(sorted(added - prints.keys())):
+            for r in db.execute(
+                "SELECT id, fingerprint, norm_artist, norm_title, norm_album FROM tracks"
+                f" WHERE id IN ({','.join('?' * len(chunk))}) AND status = 'active' AND length(fingerprint) > 0",
+                chunk
+            ):
+                keys[r["id"]] = (r["norm_artist"], r["norm_title"], r["norm_album"])
+                prints[r["id"]] = unpack_fingerprint(r["fingerprint"])
+        groups = group_by_fingerprint(((tid, prints[tid]) for tid in sorted(pool) if tid in prints),
+                                      fingerprint_threshold())
+        frontier = {tid for ids, _ in groups for tid in ids} - expanded
+
+    components = [(ids, similarity) for ids, similarity in groups if len({keys[tid] for tid in ids}) > 1]
+    return _reconcile_groups(db, "fingerprint", components, scope=pool)
+
+def _chunks(ids: list, size: int = 500):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def _index_fingerprints(db) -> set[int]:
+    """Refresh the postings of claimed tracks and index any fingerprinted track without them.
+
+    Returns the ids of the tracks indexed.
+    """
+    db.execute("DELETE FROM fingerprint_postings WHERE track_id IN (SELECT track_id FROM temp.analysis_tracks)")
+    rows = db.execute("""
+        SELECT id, fingerprint FROM tracks t
+        WHERE length(fingerprint) > 0 AND status = 'active'
+            AND NOT EXISTS (SELECT 1 FROM fingerprint_postings p WHERE p.track_id = t.id)
+    """).fetchall()
+    postings = []
+    for r in rows:
+        values = unpack_fingerprint(r["fingerprint"])[:FP_COMPARE_LENGTH]
+        keys = fingerprint_keys(values) if len(values) >= FP_MIN_OVERLAP else []
+        postings.extend((key, r["id"], pos) for key, pos in keys)
+        if not keys:
+            postings.append((None, r["id"], 0))
+    db.executemany("INSERT INTO fingerprint_postings (key, track_id, pos) VALUES (?, ?, ?)", postings)
+    return {r["id"] for r in rows}
+
+def _fingerprint_candidates(db, ids: set[int]) -> set[int]:
+    """Tracks sharing an index key with any of ids, ignoring keys with more than FP_MAX_POSTINGS postings."""
+    found = set()
+    for chunk in _chunks(sorted(ids)):
+        found.update(r[0] for r in db.execute(f"""
+            WITH shared AS (
+                SELECT p.key FROM fingerprint_postings p
+                WHERE p.key IN (
+                    SELECT key FROM fingerprint_postings
+                    WHERE track_id IN ({",".join("?" * len(chunk))}) AND key IS NOT NULL
                 )
-            results.append({"group_id": group_id, **result})
+                GROUP BY p.key HAVING COUNT(*) <= ?
+            )
+            SELECT DISTINCT p.track_id FROM fingerprint_postings p JOIN shared s ON s.key = p.key
+        """, (*chunk, FP_MAX_POSTINGS)))
+    return found
+
+def _fingerprint_group_mates(db, ids) -> set[int]:
+    """Every member of the unresolved fingerprint groups any of ids belongs to."""
+    found = set()
+    for chunk in _chunks(sorted(ids)):
+        found.update(r[0] for r in db.execute(f"""
+            SELECT mates.track_id FROM dupe_group_members m
+            JOIN dupe_groups g ON g.id = m.group_id
+            JOIN dupe_group_members mates ON mates.group_id = m.group_id
+            WHERE g.match_type = 'fingerprint' AND g.resolved = 0
+                AND m.track_id IN ({",".join("?" * len(chunk))})
+        """, chunk))
+    return found
+
+def _update_fuzzy_groups(db) -> list[tuple]:
+    """Regroup active tracks by fuzzy artist and title, keeping existing fuzzy group IDs.
+
+    As with fingerprints, groups whose members all share one grouping key are
+    left to the metadata pass. Returns (old_id, result) pairs.
+    """
+    tracks = TrackStore.from_cursor(db.execute(
+        "SELECT id, artist, title, duration, norm_artist, norm_title, norm_album FROM tracks"
+        " WHERE status = 'active'"
+    ))
+
+    def spans_keys(ids):
+        rows = tracks.rows_of(ids)
+        return any(len(np.unique(tracks.column(c)[rows])) > 1 for c in NORM_COLUMNS)
+
+    components = [
+        (ids, similarity)
+        for ids, similarity in group_by_fuzzy_metadata(tracks, _fuzzy_threshold())
+        if spans_keys(ids)
+    ]
+    return _reconcile_groups(db, "fuzzy", components)
+
+def _remove_groups(db, match_type: str) -> list[tuple]:
+    """Delete every unresolved group of one match type. Returns (old_id, None) pairs."""
+    ids = [r["id"] for r in db.execute(
+        "SELECT id FROM dupe_groups WHERE match_type = ? AND resolved = 0", (match_type,)
+    )]
+    return [(group_id, _store_group(db, group_id, match_type, [])) for group_id in ids]
+
+def _reconcile_groups(
+    db, match_type: str, components: list[tuple[list[int], float]], scope: set[int] = None,
+) -> list[tuple]:
+    """Store freshly computed (track_ids, similarity) components over the unresolved groups of a type.
+
+    Each component takes over the existing group it shares the most members
+    with, so IDs carry over; groups no component claims are deleted. With
+    ``scope`` only groups with a member in it are considered: the components
+    must then have been computed over every member of those groups.
+    """
+    group_of = {}
+    for r in db.execute("""
+        SELECT m.group_id, m.track_id FROM dupe_group_members m
+        JOIN dupe_groups g ON g.id = m.group_id
+        WHERE g.match_type = ? AND g.resolved = 0
+    """, (match_type,)):
+        group_of[r["track_id"]] = r["group_id"]
+    if scope is not None:
+        in_scope = {group_of[tid] for tid in scope if tid in group_of}
+        group_of = {tid: gid for tid, gid in group_of.items() if gid in in_scope}
+    unclaimed = set(group_of.values())
 
+    outcomes = []
+    for ids, similarity in components:
+        overlap = Counter(group_of[tid] for tid in ids if group_of.get(tid) in unclaimed)
+        group_id = overlap.most_common(1)[0][0] if overlap else None
+        unclaimed.discard(group_id)
+        marks = ",".join("?" * len(ids))
+        members = db.execute(
+            f"SELECT {', '.join(_RANK_COLUMNS)} FROM tracks WHERE id IN ({marks}) ORDER BY quality_score DESC, id", ids
+        ).fetchall()
+        outcomes.append((group_id, _store_group(db, group_id, match_type, [dict(m) for m in members], similarity)))
+    for group_id in unclaimed:
+        outcomes.append((group_id, _store_group(db, group_id, match_type, [])))
+    return outcomes
+
+def update_dupe_groups(revisit_fuzzy: bool = False) -> dict:
+    """Bring unresolved dupe groups up to date with the tracks that changed since the last run.
+
+    Only grouping keys touched by inserted, updated or removed tracks are
+    regrouped, exact (audio hash) groups only for the hashes the change
+    reaches, and fingerprints only as far as the changed ones link.
+    With fuzzy_matching on, fuzzy groups are rebuilt whenever any key changed,
+    or always when revisit_fuzzy is set; with it off they are removed.
+    Groups are updated in place so unchanged groups keep their IDs. Returns
+    counts of created, updated and removed groups, the unresolved total, the
+    number of changed tracks left ungrouped because their key is missing or
+    generic, and the results for groups that were created or changed.
+    """
+    with _analysis_lock, get_db() as db:
+        _claim_dirty(db)
+        try:
+            outcomes = _update_metadata_groups(db)
+            outcomes += _update_exact_groups(db)
+            outcomes += _update_fingerprint_groups(db)
+            if get_setting("fuzzy_matching") != "on":
+                outcomes += _remove_groups(db, "fuzzy")
+            elif revisit_fuzzy or db.execute("SELECT 1 FROM temp.analysis_keys LIMIT 1").fetchone():
+                outcomes += _update_fuzzy_groups(db)
+            total = db.execute("SELECT COUNT(*) FROM dupe_groups WHERE resolved = 0").fetchone()[0]
+            skipped = _skipped_tracks(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    if skipped:
+        logger.warning(f"Skipped {skipped} tracks whose tags and paths don't identify a recording")
+    summary = {"created": 0, "updated": 0, "removed": 0, "total": total, "skipped": skipped, "results": []}
+    for old_id, result in outcomes:
+        if result is None:
+            summary["removed"] += old_id is not None
+            continue
+        changed = result.pop("changed")
+        if old_id is None:
+            summary["created"] += 1
+        elif changed:
+            summary["updated"] += 1
+        else:
+            continue
+        summary["results"].append(result)
+    return summary
+
+@router.post("/analyze")
+def analyze_dupes():
+    summary = update_dupe_groups(revisit_fuzzy=True)
     auto_resolved = auto_resolve_high_confidence()
-    return {"groups_found": len(results), "auto_resolved": auto_resolved, "results": results}
+    start_fingerprinting()
+    with get_db() as db:
+        skipped = _skipped_tracks(db, claimed_only=False)
+    return {
+        "groups_found": summary["total"],
+        "created": summary["created"],
+        "updated": summary["updated"],
+        "removed": summary["removed"],
+        "auto_resolved": auto_resolved,
+        "skipped": skipped,
+        "results": summary["results"],
+    }
 
 @router.get("/")
 def list_dupes(resolved: bool = None):
-    with get_db() as db:
-        if resolved is None:
-            groups = db.execute("""
-                SELECT dg.*, GROUP_CONCAT(dgm.track_id) as member_ids
-                FROM dupe_groups dg
-                JOIN dupe_group_members dgm ON dg.id = dgm.group_id
-                GROUP BY dg.id
-            """).fetchall()
-        else:
-            groups = db.execute("""
-                SELECT dg.*, GROUP_CONCAT(dgm.track_id) as member_ids
-                FROM dupe_groups dg
-                JOIN dupe_group_members dgm ON dg.id = dgm.group_id
-                WHERE dg.resolved = ?
-                GROUP BY dg.id
-            """, (int(resolved),)).fetchall()
-
-        result = []
-        for g in groups:
-            member_ids = [int(x) for x in g["member_ids"].split(",")]
-            placeholders = ",".join("?" * len(member_ids))
-            members = db.execute(
-                f"SELECT * FROM tracks WHERE id IN ({placeholders})", member_ids
-            ).fetchall()
-            result.append({
-                "group": dict(g),
-                "members": [dict(m) for m in members]
-            })
-
-    return result
+    """Every duplicate group with its members, read in two queries of the API columns only."""
+    condition = "" if resolved is None else "WHERE dg.resolved = ?"
+    params = () if resolved is None else (int(resolved),)
+    with get_db(readonly=True) as db:
+        groups = db.execute(f"""
+            SELECT dg.*, GROUP_CONCAT(dgm.track_id) as member_ids
+            FROM dupe_groups dg
+            JOIN dupe_group_members dgm ON dg.id = dgm.group_id
+            {condition}
+            GROUP BY dg.id
+        """, params).fetchall()
+        rows = db.execute(f"""
+            SELECT dgm.group_id, {", ".join(f"t.{c}" for c in API_TRACK_COLUMNS)}
+            FROM dupe_groups dg
+            JOIN dupe_group_members dgm ON dg.id = dgm.group_id
+            JOIN tracks t ON t.id = dgm.track_id
+            {condition}
+            ORDER BY dgm.group_id, t.id
+        """, params)
+        members = {
+            group_id: [{c: m[c] for c in API_TRACK_COLUMNS} for m in group_rows]
+            for group_id, group_rows in groupby(rows, key=lambda r: r["group_id"])
+        }
+
+    return [{"group": dict(g), "members": members.get(g["id"], [])} for g in groups]
 
 @router.post("/{group_id}/resolve")
 def resolve_group(group_id: int, keep_track_id: int):
-    trash_dir = Path(os.environ.get("TRASH_PATH", "/trash"))
-    music_root = Path(os.environ.get("MUSIC_PATH", "/music"))
+    trash_dir, music_root = _library_paths()
 
     with get_db() as db:
         members = db.execute(
@@ -121,7 +533,7 @@ def resolve_group(group_id: int, keep_track_id: int):
                 continue
             track = db.execute("SELECT * FROM tracks WHERE id = ?", (tid,)).fetchone()
             if track:
-                dest = trash_file(Path(track["file_path"]), trash_dir, music_root)
+                dest = trash_file(Path(track["file_path"]), trash_dir, music_root, db)
                 db.execute("UPDATE tracks SET status = 'trashed' WHERE id = ?", (tid,))
                 db.execute(
                     "INSERT INTO file_actions (track_id, action, source_path, dest_path) VALUES (?, 'trash', ?, ?)",
@@ -136,15 +548,24 @@ def resolve_group(group_id: int, keep_track_id: int):
     return {"status": "resolved", "kept": keep_track_id}
 
 @router.post("/resolve-all")
-def resolve_all():
+def resolve_all(background_tasks: BackgroundTasks):
+    """Resolve every unresolved group in the background; poll /resolve-status for progress."""
+    if resolve_status["running"]:
+        return {"error": "Resolve already in progress"}
     with get_db() as db:
         groups = db.execute(
             "SELECT id, kept_track_id FROM dupe_groups WHERE resolved = 0"
         ).fetchall()
 
-    resolved = 0
-    for g in groups:
-        resolve_group(g["id"], g["kept_track_id"])
-        resolved += 1
+    resolve_status.update(running=True, phase="starting", total=len(groups))
+    trash_dir, music_root = _library_paths()
+    background_tasks.add_task(run_resolve, [(g["id"], g["kept_track_id"]) for g in groups], trash_dir, music_root)
+    return {"status": "started", "total": len(groups)}
+
+@router.get("/resolve-status")
+def get_resolve_status():
+    return resolve_status
 
-    return {"resolved": resolved}
+@router.get("/fingerprint-status")
+def get_fingerprint_status():
+    return fingerprint_status
@@ -1,9 +1,16 @@
 from fastapi import APIRouter, BackgroundTasks, WebSocket
 from database import get_db
-from scanner import scan_directory, generate_fingerprint, AUDIO_EXTENSIONS
-from dedup import group_by_metadata, find_duplicates
-from routes.dupes import auto_resolve_high_confidence
+from scanner import scan_directory, read_track_metadata, file_state, state_matches
+from fingerprint import FingerprintPool
+from fingerprinter import start_fingerprinting
+from watcher import watch_status
+from library import (
+    TrackWriter, load_existing, mark_stale, mark_missing, find_stale, backfill_audio_hashes,
+    DEFAULT_BATCH_SIZE,
+)
+from routes.dupes import auto_resolve_high_confidence, update_dupe_groups
 from routes.upgrades import queue_upgrade_candidates, run_upgrade_search
+from routes.settings import get_setting
 from pathlib import Path
 import asyncio
 import os
@@ -16,7 +23,8 @@ router = APIRouter(prefix="/api/scan", tags=["scan"])
 
 scan_status = {
     "running": False, "progress": 0, "total": 0, "current_file": "",
-    "phase": "idle", "started_at": None, "stale_removed": 0,
+    "phase": "idle", "started_at": None, "stale_removed": 0, "workers": {},
+    "fingerprints": {},
 }
 ws_clients: list[WebSocket] = []
 
@@ -49,6 +57,28 @@ async def start_scan(background_tasks: BackgroundTasks):
 def get_scan_status():
     return scan_status
 
+@router.get("/watch")
+def get_watch_status():
+    return watch_status
+
+@router.post("/stale")
+def remove_stale(path: str = None):
+    """Mark tracks whose files are gone as deleted, without a full scan.
+
+    ``path`` limits the check to a subtree of the music library.
+    """
+    if scan_status["running"]:
+        return {"error": "Scan already in progress"}
+    music_path = Path(os.environ.get("MUSIC_PATH", "/music"))
+    root = Path(os.path.normpath(path)) if path else music_path
+    if not root.is_relative_to(music_path):
+        return {"error": f"{root} is outside the music library"}
+    with get_db() as db:
+        removed = find_stale(db, root)
+    if removed > 0:
+        logger.info(f"Removed {removed} stale track records under {root}")
+    return {"stale_removed": removed}
+
 def _broadcast_sync(data: dict):
     """Broadcast from sync context."""
     try:
@@ -60,101 +90,128 @@ def _broadcast_sync(data: dict):
     except RuntimeError:
         pass
 
+def _int_setting(key: str, default: int) -> int:
+    try:
+        return int(get_setting(key))
+    except ValueError:
+        return default
+
+def _worker_setting(key: str) -> int:
+    """Read a worker-count setting; 0 or invalid means one per CPU."""
+    workers = _int_setting(key, 0)
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def _scan_fingerprints(workers: int):
+    """A FingerprintPool for scanned files when fingerprint_mode is "scan", otherwise None.
+
+    In lazy mode (the default) scans don't decode audio at all; the
+    fingerprinter picks up tracks in ambiguous duplicate groups afterwards.
+    """
+    if get_setting("fingerprint_mode") != "scan" or workers < 1:
+        return None
+    return FingerprintPool(workers=workers)
+
 def run_scan(music_path: Path):
     scan_status["running"] = True
     scan_status["progress"] = 0
-    scan_status["phase"] = "counting"
+    scan_status["phase"] = "scanning"
     scan_status["started_at"] = time.time()
     scan_status["stale_removed"] = 0
     scan_status["current_file"] = ""
+    scan_status["workers"] = {}
+    scan_status["fingerprints"] = {}
 
     try:
-        # Phase 1: Count files
-        total = 0
-        for dirpath, _, filenames in os.walk(music_path):
-            for f in filenames:
-                if Path(f).suffix.lower() in AUDIO_EXTENSIONS:
-                    total += 1
-        scan_status["total"] = total
-
-        # Phase 2: Scan new files
-        scan_status["phase"] = "scanning"
+        # Phase 1: Scan new and modified files. A single walk drives reading,
+        # progress and stale detection; the total starts as an estimate from the
+        # previous run and is corrected as files are found.
+        seen: set[str] = set()
+        unreadable: list[str] = []
         with get_db() as db:
-            for i, meta in enumerate(scan_directory(music_path)):
-                scan_status["progress"] = i + 1
-                scan_status["current_file"] = meta["file_path"]
-
-                existing = db.execute(
-                    "SELECT id FROM tracks WHERE file_path = ?", (meta["file_path"],)
-                ).fetchone()
-                if existing:
-                    continue
+            existing = load_existing(db)
+            # Deleted rows are left out so a file that reappears is re-read and reactivated
+            known = {
+                path: (r["file_size"], r["mtime_ns"], r["inode"])
+                for path, r in existing.items() if r["status"] != "deleted"
+            }
+            estimate = sum(1 for r in existing.values() if r["status"] == "active")
+            scan_status["total"] = estimate
 
-                fp = generate_fingerprint(meta["file_path"])
-                meta["fingerprint"] = fp
-
-                db.execute("""
-                    INSERT INTO tracks (file_path, file_size, format, bitrate, bit_depth,
-                        sample_rate, duration, artist, album_artist, album, title,
-                        track_number, disc_number, fingerprint)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    meta["file_path"], meta["file_size"], meta["format"], meta["bitrate"],
-                    meta["bit_depth"], meta["sample_rate"], meta["duration"], meta["artist"],
-                    meta["album_artist"], meta["album"], meta["title"], meta["track_number"],
-                    meta["disc_number"], meta["fingerprint"]
-                ))
-
-        # Phase 3: Remove stale records (files that no longer exist on disk)
+            writer = TrackWriter(db, existing, _int_setting("scan_batch_size", DEFAULT_BATCH_SIZE))
+            workers = _worker_setting("scan_workers")
+            fingerprints = _scan_fingerprints(_worker_setting("fingerprint_workers"))
+            if fingerprints:
+                scan_status["fingerprints"] = fingerprints.stats
+            scan = scan_directory(
+                music_path, known, workers=workers, stats=scan_status["workers"], seen=seen,
+                errors=unreadable,
+            )
+            try:
+                for i, meta in enumerate(scan):
+                    scan_status["progress"] = i + 1
+                    scan_status["total"] = max(estimate, len(seen))
+                    scan_status["current_file"] = meta["file_path"]
+
+                    if meta.get("unchanged"):
+                        row = existing[meta["file_path"]]
+                        if row["mtime_ns"] is None:
+                            writer.record_state(row["id"], meta["mtime_ns"], meta["inode"])
+                        continue
+
+                    if not fingerprints:
+                        writer.write(meta)
+                        continue
+                    fingerprints.submit(meta)
+                    for done in fingerprints.drain():
+                        writer.write(done)
+
+                scan_status["total"] = len(seen)
+                if fingerprints:
+                    scan_status["current_file"] = "Finishing fingerprints..."
+                    for done in fingerprints.finish():
+                        writer.write(done)
+                writer.flush()
+            finally:
+                if fingerprints:
+                    fingerprints.close()
+        logger.info(f"Scan wrote {writer.inserted} new and {writer.updated} changed tracks")
+
+        # Phase 2: Remove stale records (active tracks the walk didn't find)
         scan_status["phase"] = "cleaning"
         scan_status["current_file"] = "Removing stale records..."
-        stale_count = 0
         with get_db() as db:
-            active_tracks = db.execute(
-                "SELECT id, file_path FROM tracks WHERE status = 'active'"
-            ).fetchall()
-            for track in active_tracks:
-                if not os.path.exists(track["file_path"]):
-                    db.execute(
-                        "UPDATE tracks SET status = 'deleted' WHERE id = ?", (track["id"],)
-                    )
-                    stale_count += 1
+            stale_count = mark_stale(db, music_path, seen, unreadable)
+        if unreadable:
+            logger.warning(f"{len(unreadable)} paths could not be read; tracks under them were kept")
         if stale_count > 0:
             logger.info(f"Removed {stale_count} stale track records (files no longer on disk)")
         scan_status["stale_removed"] = stale_count
 
-        # Phase 4: Analyze duplicates
+        # Tracks scanned before audio hashes were stored are hashed once here,
+        # since the walk skips unchanged files
+        scan_status["current_file"] = "Hashing audio..."
+        with get_db() as db:
+            hashed = backfill_audio_hashes(db, workers)
+        if hashed > 0:
+            logger.info(f"Stored audio hashes for {hashed} previously scanned tracks")
+
+        # Phase 3: Analyze duplicates
         scan_status["phase"] = "analyzing"
         scan_status["current_file"] = "Analyzing duplicates..."
         try:
-            with get_db() as db2:
-                rows = db2.execute("SELECT * FROM tracks WHERE status = 'active'").fetchall()
-                tracks = [dict(r) for r in rows]
-                groups = group_by_metadata(tracks)
-
-                db2.execute("DELETE FROM dupe_group_members WHERE group_id IN (SELECT id FROM dupe_groups WHERE resolved = 0)")
-                db2.execute("DELETE FROM dupe_groups WHERE resolved = 0")
-
-                for group in groups:
-                    result = find_duplicates(group)
-                    cursor = db2.execute(
-                        "INSERT INTO dupe_groups (match_type, confidence, kept_track_id) VALUES (?, ?, ?)",
-                        ("metadata", result["confidence"], result["keep_id"])
-                    )
-                    group_id = cursor.lastrowid
-                    for track in group:
-                        db2.execute(
-                            "INSERT INTO dupe_group_members (group_id, track_id) VALUES (?, ?)",
-                            (group_id, track["id"])
-                        )
-            logger.info(f"Auto-analysis found {len(groups)} duplicate groups")
+            summary = update_dupe_groups()
+            logger.info(
+                f"Auto-analysis: {summary['created']} new, {summary['updated']} changed and "
+                f"{summary['removed']} removed duplicate groups ({summary['total']} unresolved, "
+                f"{summary['skipped']} tracks skipped for missing tags)"
+            )
             auto_resolved = auto_resolve_high_confidence()
             if auto_resolved > 0:
                 logger.info(f"Auto-resolved {auto_resolved} high-confidence duplicates after scan")
         except Exception as e:
             logger.error(f"Auto duplicate analysis failed: {e}")
 
-        # Phase 5: Search for FLAC upgrades of lossy tracks
+        # Phase 4: Search for FLAC upgrades of lossy tracks
         scan_status["phase"] = "upgrades"
         scan_status["current_file"] = "Searching for FLAC upgrades..."
         try:
@@ -168,3 +225,59 @@ def run_scan(music_path: Path):
         scan_status["phase"] = "complete"
     finally:
         scan_status["running"] = False
+    # Fingerprint what the analysis left ambiguous, after the scan is reported done
+    start_fingerprinting()
+
+def index_paths(changed: set[str], removed: set[str]) -> dict:
+    """Apply a batch of filesystem changes without walking the library.
+
+    ``changed`` are audio files that were created or modified; ``removed`` are
+    files or directories that were deleted or moved away. Changed files get the
+    same file-state check, metadata read and fingerprinting as a full scan, and
+    duplicates are re-analyzed if anything was written.
+    """
+    with get_db() as db:
+        removed_count = mark_missing(db, sorted(removed))
+        existing = load_existing(db, sorted(changed))
+        writer = TrackWriter(db, existing)
+        to_read = []
+        for path in sorted(changed):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = existing.get(path)
+            recorded = (row["file_size"], row["mtime_ns"], row["inode"]) if row else None
+            if row and row["status"] != "deleted" and state_matches(recorded, file_state(stat)):
+                continue
+            to_read.append((path, stat))
+
+        fingerprints = _scan_fingerprints(min(len(to_read), _worker_setting("fingerprint_workers")))
+        try:
+            for path, stat in to_read:
+                try:
+                    meta = read_track_metadata(Path(path), stat)
+                except Exception as e:
+                    logger.warning(f"Could not read {path}: {e}")
+                    continue
+                if fingerprints:
+                    fingerprints.submit(meta)
+                else:
+                    writer.write(meta)
+            if fingerprints:
+                for done in fingerprints.finish():
+                    writer.write(done)
+        finally:
+            if fingerprints:
+                fingerprints.close()
+        writer.flush()
+
+    if writer.inserted or writer.updated or removed_count:
+        summary = update_dupe_groups()
+        auto_resolve_high_confidence()
+        start_fingerprinting()
+        logger.info(
+            f"Indexed {writer.inserted} new, {writer.updated} changed and {removed_count} removed "
+            f"tracks; {summary['total']} duplicate groups"
+        )
+    return {"inserted": writer.inserted, "updated": writer.updated, "removed": removed_count}
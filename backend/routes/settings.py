@@ -6,17 +6,35 @@ router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 DEFAULTS = {
     "fingerprint_threshold": "0.85",
+    "fingerprint_mode": "lazy",  # lazy (only tracks in ambiguous duplicate groups) | scan (every new file)
+    "fuzzy_matching": "off",  # off | on; also group near-identical artist/title tags
+    "fuzzy_threshold": "0.8",  # trigram similarity needed for a fuzzy match
     "squid_rate_limit": "3",
     "auto_resolve_threshold": "0.95",
     "upgrade_scan_folders": "",
+    "scan_workers": "0",  # metadata worker processes; 0 = one per CPU, 1 = serial
+    "fingerprint_workers": "0",  # concurrent fpcalc processes; 0 = one per CPU
+    "scan_batch_size": "500",  # tracks written per scan transaction
+    "watch_mode": "off",  # off | auto | events (inotify) | poll; applied at startup
+    "watch_poll_seconds": "300",
+    "reconcile_interval_days": "7",  # full scan interval while watch mode is on
+    "trash_reconcile_hours": "6",  # how often the trash ledger is checked against the disk
+    "trash_retention_days": "0",  # nightly purge of files trashed longer ago; 0 = keep until emptied
+    "trash_purge_slice": "2000",  # most files one nightly purge deletes
 }
 
+def get_setting(key: str) -> str:
+    """Read a single setting, falling back to DEFAULTS."""
+    with get_db(readonly=True) as db:
+        row = db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else DEFAULTS.get(key, "")
+
 @router.get("/")
 def get_settings():
     settings = dict(DEFAULTS)
     settings["music_path"] = os.environ.get("MUSIC_PATH", "/music")
     settings["trash_path"] = os.environ.get("TRASH_PATH", "/trash")
-    with get_db() as db:
+    with get_db(readonly=True) as db:
         rows = db.execute("SELECT key, value FROM settings").fetchall()
         for row in rows:
             settings[row["key"]] = row["value"]
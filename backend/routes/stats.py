@@ -5,7 +5,7 @@ router = APIRouter(prefix="/api/stats", tags=["stats"])
 
 @router.get("/")
 def get_stats():
-    with get_db() as db:
+    with get_db(readonly=True) as db:
         total = db.execute("SELECT COUNT(*) as c FROM tracks WHERE status = 'active'").fetchone()["c"]
         formats = db.execute("""
             SELECT format, COUNT(*) as count
@@ -1,14 +1,21 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from database import get_db
-from file_manager import restore_file, get_trash_size, empty_trash
+from file_manager import restore_file
+from trash_ledger import reconcile_trash, trash_breakdown, trash_totals
+from trash_purge import purge_status, run_purge
+from trash_restore import restore_status, run_restore
+from datetime import datetime
 from pathlib import Path
 import os
 
 router = APIRouter(prefix="/api/trash", tags=["trash"])
 
+def _trash_dir() -> Path:
+    return Path(os.environ.get("TRASH_PATH", "/trash"))
+
 @router.get("/")
 def list_trash():
-    with get_db() as db:
+    with get_db(readonly=True) as db:
         items = db.execute("""
             SELECT fa.*, t.artist, t.title, t.album, t.format
             FROM file_actions fa
@@ -20,9 +27,49 @@ def list_trash():
 
 @router.get("/size")
 def trash_size():
-    trash_dir = Path(os.environ.get("TRASH_PATH", "/trash"))
-    size = get_trash_size(trash_dir)
-    return {"size_bytes": size, "size_mb": round(size / 1024 / 1024, 2)}
+    """Trash totals from the ledger; no walk of the trash directory."""
+    with get_db(readonly=True) as db:
+        totals = trash_totals(db)
+    size = totals["bytes"]
+    return {"size_bytes": size, "size_mb": round(size / 1024 / 1024, 2), "files": totals["files"]}
+
+@router.get("/breakdown")
+def breakdown(by: str = "folder"):
+    """Files and bytes in the trash per top-level folder (by=folder) or by age (by=age)."""
+    with get_db(readonly=True) as db:
+        try:
+            return trash_breakdown(db, by)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/reconcile")
+def reconcile():
+    """Rebuild the ledger from the disk, for when files were changed outside the app."""
+    with get_db() as db:
+        return reconcile_trash(db, _trash_dir())
+
+@router.post("/restore")
+def restore_many(
+    background_tasks: BackgroundTasks, since: datetime = None, until: datetime = None,
+    group_id: int = None, folder: str = None,
+):
+    """Restore every trashed file matching all the given filters in the background.
+
+    since/until bound when the files were trashed (UTC if no offset is given),
+    group_id selects a duplicate group's members and folder a top-level trash
+    folder. Poll /restore-status for progress.
+    """
+    if since is None and until is None and group_id is None and folder is None:
+        raise HTTPException(status_code=400, detail="Give a time range, group_id or folder to restore")
+    if restore_status["running"]:
+        return {"error": "Restore already in progress"}
+    restore_status.update(running=True, phase="starting")
+    background_tasks.add_task(run_restore, since, until, group_id, folder)
+    return {"status": "started"}
+
+@router.get("/restore-status")
+def get_restore_status():
+    return restore_status
 
 @router.post("/{action_id}/restore")
 def restore(action_id: int):
@@ -30,19 +77,31 @@ def restore(action_id: int):
         action = db.execute("SELECT * FROM file_actions WHERE id = ?", (action_id,)).fetchone()
         if not action:
             return {"error": "Action not found"}
-        restore_file(action["dest_path"], action["source_path"])
+        restore_file(action["dest_path"], action["source_path"], db)
         db.execute("UPDATE tracks SET status = 'active' WHERE id = ?", (action["track_id"],))
         db.execute("DELETE FROM file_actions WHERE id = ?", (action_id,))
     return {"status": "restored"}
 
 @router.post("/empty")
-def empty():
-    trash_dir = Path(os.environ.get("TRASH_PATH", "/trash"))
-    try:
-        count = empty_trash(trash_dir)
-    except Exception as e:
-        from fastapi import HTTPException
-        raise HTTPException(status_code=500, detail=f"Failed to delete files: {e}")
-    with get_db() as db:
-        db.execute("UPDATE tracks SET status = 'deleted' WHERE status = 'trashed'")
-    return {"deleted": count}
+def empty(background_tasks: BackgroundTasks):
+    """Delete everything in the trash in the background; poll /purge-status for progress."""
+    if purge_status["running"]:
+        return {"error": "Purge already in progress"}
+    purge_status.update(running=True, phase="starting")
+    background_tasks.add_task(run_purge, _trash_dir())
+    return {"status": "started"}
+
+@router.post("/purge")
+def purge(background_tasks: BackgroundTasks, older_than_days: float, limit: int = None):
+    """Delete files trashed more than older_than_days ago, oldest first, at most limit of them."""
+    if older_than_days < 0:
+        raise HTTPException(status_code=400, detail="older_than_days must not be negative")
+    if purge_status["running"]:
+        return {"error": "Purge already in progress"}
+    purge_status.update(running=True, phase="starting")
+    background_tasks.add_task(run_purge, _trash_dir(), older_than_days, limit)
+    return {"status": "started"}
+
+@router.get("/purge-status")
+def get_purge_status():
+    return purge_status
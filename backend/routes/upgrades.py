@@ -1,15 +1,16 @@
 from fastapi import APIRouter, BackgroundTasks
-from database import get_db
+from database import API_TRACK_COLUMNS, get_db
 from upgrade_service import (
     build_search_query, find_and_match_track, find_album_match,
     get_album_tracks, get_download_url, download_flac, QUALITY_HI_RES,
 )
-from dedup import normalize_text
-from file_manager import trash_file
-from scanner import read_track_metadata
+from dedup import grouping_key, normalize_many, normalize_text
+from file_manager import move_file, trash_file
+from fingerprinter import fingerprint_threshold, verify_upgrade
+from routes.settings import get_setting
+from scanner import quality_score, read_track_metadata
 from pathlib import Path
 import os
-import shutil
 import asyncio
 import logging
 
@@ -32,15 +33,23 @@ def _get_upgrade_folders() -> list[str]:
     return [music_path + "/"]
 
 
+# Orderings for the candidates listing; "quality" lists the worst-sounding files first
+CANDIDATE_ORDER = {
+    "artist": "t.artist, t.album, t.track_number",
+    "quality": "t.quality_score, t.artist, t.album, t.track_number",
+}
+
+
 @router.get("/candidates")
-def get_upgrade_candidates():
+def get_upgrade_candidates(sort: str = "artist"):
     """Find lossy tracks that could be upgraded to FLAC."""
+    order = CANDIDATE_ORDER.get(sort, CANDIDATE_ORDER["artist"])
     folders = _get_upgrade_folders()
     path_filters = " OR ".join(["t.file_path LIKE ?" for _ in folders])
     path_params = [f"{folder}%" for folder in folders]
-    with get_db() as db:
+    with get_db(readonly=True) as db:
         candidates = db.execute(f"""
-            SELECT t.* FROM tracks t
+            SELECT {", ".join(f"t.{c}" for c in API_TRACK_COLUMNS)} FROM tracks t
             WHERE t.format IN ('mp3', 'aac', 'ogg', 'm4a')
             AND t.status = 'active'
             AND ({path_filters})
@@ -49,7 +58,7 @@ def get_upgrade_candidates():
                 JOIN dupe_groups dg ON dgm.group_id = dg.id
                 WHERE dg.resolved = 1
             )
-            ORDER BY t.artist, t.album, t.track_number
+            ORDER BY {order}
         """, path_params).fetchall()
     return [dict(c) for c in candidates]
 
@@ -77,11 +86,12 @@ def queue_upgrade_candidates() -> int:
         path_filters = " OR ".join(["file_path LIKE ?" for _ in folders])
         path_params = [f"{folder}%" for folder in folders]
         candidates = db.execute(f"""
-            SELECT * FROM tracks
+            SELECT id, artist, album FROM tracks
             WHERE format IN ('mp3', 'aac', 'ogg', 'm4a')
             AND status = 'active'
             AND ({path_filters})
             AND id NOT IN (SELECT track_id FROM upgrade_queue)
+            ORDER BY quality_score
         """, path_params).fetchall()
 
         for c in candidates:
@@ -112,7 +122,7 @@ def get_upgrade_status():
 
 @router.get("/queue")
 def get_queue(status: str = None):
-    with get_db() as db:
+    with get_db(readonly=True) as db:
         if status:
             items = db.execute("""
                 SELECT uq.*, t.artist, t.title, t.album, t.format, t.bitrate
@@ -204,20 +214,21 @@ async def _find_track_with_cache(
     tracks = await get_album_tracks(album_match["tidal_id"], rate_limit)
     n_title = normalize_text(title)
 
+    titles = normalize_many(t["title"] for t in tracks)
+
     # Try track number + title match first
     if track_number > 0:
-        for t in tracks:
-            if t["track_number"] == track_number and normalize_text(t["title"]) == n_title:
+        for t, t_title in zip(tracks, titles):
+            if t["track_number"] == track_number and t_title == n_title:
                 return {**t, "match_type": "exact", "album_tidal_id": album_match["tidal_id"]}
 
     # Exact title match
-    for t in tracks:
-        if normalize_text(t["title"]) == n_title:
+    for t, t_title in zip(tracks, titles):
+        if t_title == n_title:
             return {**t, "match_type": "exact", "album_tidal_id": album_match["tidal_id"]}
 
     # Fuzzy title match
-    for t in tracks:
-        t_title = normalize_text(t["title"])
+    for t, t_title in zip(tracks, titles):
         if n_title in t_title or t_title in n_title:
             return {**t, "match_type": "fuzzy", "album_tidal_id": album_match["tidal_id"]}
 
@@ -329,12 +340,13 @@ def run_downloads():
                 new_meta = read_track_metadata(staging_path)
                 if new_meta["format"] != "flac" or new_meta["file_size"] < 1000:
                     raise ValueError("Downloaded file is not a valid FLAC")
+                new_meta["fingerprint"] = verify_upgrade(item["track_id"], staging_path, fingerprint_threshold())
 
                 # Move FLAC to final location (same dir as original, new extension)
                 original_path = Path(item["file_path"])
                 flac_dest = original_path.with_suffix(".flac")
-                flac_dest.parent.mkdir(parents=True, exist_ok=True)
-                shutil.move(str(staging_path), str(flac_dest))
+                move_file(staging_path, flac_dest)
+                flac_stat = flac_dest.stat()
 
                 # Move original lossy file to trash (after FLAC is safely in place)
                 dest = trash_file(original_path, trash_dir, music_root)
@@ -350,23 +362,48 @@ def run_downloads():
                         (item["track_id"], item["file_path"], dest)
                     )
 
-                    # Insert new FLAC track
+                    # Insert new FLAC track (or refresh the row if watch mode indexed it first)
+                    tags = {
+                        "artist": new_meta["artist"] or item["artist"],
+                        "album": new_meta["album"] or item["album"],
+                        "title": new_meta["title"] or item["title"],
+                    }
                     db.execute("""
                         INSERT INTO tracks (file_path, file_size, format, bitrate, bit_depth,
                             sample_rate, duration, artist, album_artist, album, title,
-                            track_number, disc_number, fingerprint, status)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active')
+                            track_number, disc_number, fingerprint, mtime_ns, inode,
+                            norm_artist, norm_title, norm_album, quality_score, audio_hash, status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active')
+                        ON CONFLICT(file_path) DO UPDATE SET
+                            file_size = excluded.file_size, format = excluded.format,
+                            bitrate = excluded.bitrate, bit_depth = excluded.bit_depth,
+                            sample_rate = excluded.sample_rate, duration = excluded.duration,
+                            artist = excluded.artist, album_artist = excluded.album_artist,
+                            album = excluded.album, title = excluded.title,
+                            track_number = excluded.track_number, disc_number = excluded.disc_number,
+                            fingerprint = excluded.fingerprint, mtime_ns = excluded.mtime_ns,
+                            inode = excluded.inode, norm_artist = excluded.norm_artist,
+                            norm_title = excluded.norm_title, norm_album = excluded.norm_album,
+                            quality_score = excluded.quality_score, audio_hash = excluded.audio_hash,
+                            status = 'active'
                     """, (
                         str(flac_dest), new_meta["file_size"], "flac",
                         new_meta.get("bitrate", 0),
                         dl_info["bit_depth"], dl_info["sample_rate"], new_meta["duration"],
-                        new_meta["artist"] or item["artist"],
+                        tags["artist"],
                         new_meta.get("album_artist", ""),
-                        new_meta["album"] or item["album"],
-                        new_meta["title"] or item["title"],
+                        tags["album"],
+                        tags["title"],
                         new_meta["track_number"] or item["track_number"],
                         new_meta.get("disc_number", 1),
-                        new_meta.get("fingerprint", ""),
+                        new_meta.get("fingerprint"),
+                        flac_stat.st_mtime_ns, flac_stat.st_ino,
+                        *grouping_key(tags),
+                        quality_score({
+                            "format": "flac", "bitrate": new_meta.get("bitrate", 0),
+                            "bit_depth": dl_info["bit_depth"], "sample_rate": dl_info["sample_rate"],
+                        }),
+                        new_meta["audio_hash"],
                     ))
 
                     # Mark queue item complete
@@ -1,27 +1,60 @@
-import json
+import multiprocessing
 import os
 import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Optional
 from mutagen import File as MutagenFile
 from mutagen.mp3 import MP3
 from mutagen.flac import FLAC
 from mutagen.mp4 import MP4
 from mutagen.oggvorbis import OggVorbis
+import numpy as np
+
+from fingerprint import fpcalc
+from tag_reader import flac_audio_hash, mp3_audio_hash, read_tags
 
 AUDIO_EXTENSIONS = {".mp3", ".flac", ".m4a", ".ogg", ".opus", ".wma", ".aac", ".wav"}
 LOSSLESS_FORMATS = {"flac", "wav", "alac"}
+SCAN_CHUNK_SIZE = 32
+
+
+def file_state(stat: os.stat_result) -> tuple[int, int, int]:
+    """Return the (size, mtime_ns, inode) triple used to detect changed files."""
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def state_matches(recorded: tuple, state: tuple[int, int, int]) -> bool:
+    """Check a recorded file state against a fresh one.
 
+    Rows scanned before file-state tracking have no mtime/inode yet; for those
+    a matching size is trusted so an upgrade doesn't force a full re-read.
+    """
+    if recorded[1] is None:
+        return recorded[0] == state[0]
+    return tuple(recorded) == state
 
-def read_track_metadata(file_path: Path) -> dict:
-    """Read audio metadata from a file using mutagen."""
+
+def read_track_metadata(file_path: Path, stat: os.stat_result = None) -> dict:
+    """Read audio metadata from a file.
+
+    FLAC and MP3 headers are read directly where possible so embedded artwork
+    is skipped; everything else, and any file the fast path declines, goes
+    through mutagen. The tag-independent audio hash (see tag_reader) is ""
+    for formats that don't have one.
+    """
     file_path = Path(file_path)
     ext = file_path.suffix.lower()
-    stat = file_path.stat()
+    if stat is None:
+        stat = file_path.stat()
 
     meta = {
         "file_path": str(file_path),
         "file_size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
         "format": ext.lstrip("."),
         "bitrate": 0,
         "bit_depth": 0,
@@ -33,8 +66,16 @@ def read_track_metadata(file_path: Path) -> dict:
         "title": "",
         "track_number": 0,
         "disc_number": 0,
+        "audio_hash": "",
     }
 
+    tags = read_tags(file_path, stat.st_size)
+    if tags is not None:
+        meta.update(tags)
+        meta["track_number"] = _parse_int(tags["track_number"])
+        meta["disc_number"] = _parse_int(tags["disc_number"])
+        return _add_mp3_hash(meta, file_path, stat.st_size)
+
     audio = MutagenFile(file_path)
     if audio is None:
         return meta
@@ -50,6 +91,7 @@ def read_track_metadata(file_path: Path) -> dict:
     if isinstance(audio, FLAC):
         meta["format"] = "flac"
         meta["bit_depth"] = audio.info.bits_per_sample
+        meta["audio_hash"] = flac_audio_hash(audio.info.md5_signature)
         meta["artist"] = _first(audio.get("artist"))
         meta["album_artist"] = _first(audio.get("albumartist", audio.get("artist")))
         meta["album"] = _first(audio.get("album"))
@@ -67,6 +109,7 @@ def read_track_metadata(file_path: Path) -> dict:
             meta["title"] = str(audio.tags.get("TIT2", ""))
             meta["track_number"] = _parse_int(str(audio.tags.get("TRCK", "0")))
             meta["disc_number"] = _parse_int(str(audio.tags.get("TPOS", "0")))
+        _add_mp3_hash(meta, file_path, stat.st_size)
     elif isinstance(audio, OggVorbis):
         meta["format"] = "ogg"
         meta["artist"] = _first(audio.get("artist"))
@@ -88,53 +131,188 @@ def read_track_metadata(file_path: Path) -> dict:
     return meta
 
 
+def _add_mp3_hash(meta: dict, file_path: Path, file_size: int) -> dict:
+    if meta["format"] == "mp3":
+        meta["audio_hash"] = mp3_audio_hash(file_path, file_size)
+    return meta
+
+
 def quality_score(meta: dict) -> int:
     """Return a numeric quality score. Higher = better."""
     score = 0
-    fmt = meta.get("format", "").lower()
+    fmt = (meta.get("format") or "").lower()
 
     if fmt in LOSSLESS_FORMATS:
         score += 10000
 
-    bit_depth = meta.get("bit_depth", 0)
+    bit_depth = meta.get("bit_depth") or 0
     score += bit_depth * 100
 
-    sample_rate = meta.get("sample_rate", 0)
+    sample_rate = meta.get("sample_rate") or 0
     score += sample_rate // 100
 
-    bitrate = meta.get("bitrate", 0)
+    bitrate = meta.get("bitrate") or 0
     score += bitrate
 
     return score
 
 
-def generate_fingerprint(file_path: Path) -> str:
-    """Generate Chromaprint fingerprint using fpcalc CLI."""
-    file_path = Path(file_path)
+def quality_scores(store) -> np.ndarray:
+    """quality_score for every row of a TrackStore at once."""
+    lossless = store.map_text("format", lambda fmt: fmt.lower() in LOSSLESS_FORMATS, dtype=bool)
+    return (
+        lossless * 10000
+        + store.column("bit_depth").astype(np.int64) * 100
+        + store.column("sample_rate").astype(np.int64) // 100
+        + store.column("bitrate")
+    )
+
+
+def generate_fingerprint(file_path: Path) -> Optional[bytes]:
+    """Generate a raw Chromaprint fingerprint (packed uint32 BLOB) using fpcalc CLI.
+
+    b"" means fpcalc couldn't decode the file; None that it timed out or isn't
+    installed, so there is no result to keep.
+    """
     try:
-        result = subprocess.run(
-            ["fpcalc", "-json", str(file_path)],
-            capture_output=True, text=True, timeout=30
-        )
-        if result.returncode != 0:
-            return ""
-        data = json.loads(result.stdout)
-        return data.get("fingerprint", "")
-    except (subprocess.TimeoutExpired, json.JSONDecodeError, FileNotFoundError):
-        return ""
+        return fpcalc(Path(file_path))
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return None
 
 
-def scan_directory(root: Path) -> Generator[dict, None, None]:
-    """Walk directory tree and yield metadata for each audio file."""
+def scan_directory(
+    root: Path, known: dict[str, tuple] = None, workers: int = 1,
+    chunk_size: int = SCAN_CHUNK_SIZE, stats: dict = None, seen: set = None, errors: list = None,
+) -> Generator[dict, None, None]:
+    """Walk directory tree and yield metadata for each audio file.
+
+    ``known`` maps file paths to their recorded (size, mtime_ns, inode). Files whose
+    state still matches are not opened; they are yielded as
+    ``{"file_path", "file_size", "mtime_ns", "inode", "unchanged": True}``.
+
+    With ``workers > 1`` files are parsed in a process pool, ``chunk_size`` files
+    per task, with at most two chunks per worker in flight. Results then arrive
+    in chunk order rather than strict walk order. If ``stats`` is given it is
+    filled with per-worker throughput, keyed by worker pid.
+
+    If ``seen`` is given, the path of every audio file found is added to it as
+    the walk reaches it, including files that later fail to parse. If
+    ``errors`` is given, directories and files that could not be listed or
+    stat-ed are appended to it (see walk_audio_files).
+    """
     root = Path(root)
-    for dirpath, _, filenames in os.walk(root):
-        for filename in sorted(filenames):
-            filepath = Path(dirpath) / filename
-            if filepath.suffix.lower() in AUDIO_EXTENSIONS:
-                try:
-                    yield read_track_metadata(filepath)
-                except Exception:
-                    continue
+    known = known or {}
+    if workers <= 1:
+        for filepath, stat, unchanged in _stat_audio_files(root, known, seen, errors):
+            if unchanged:
+                yield _unchanged(filepath, stat)
+                continue
+            try:
+                yield read_track_metadata(filepath, stat)
+            except Exception:
+                continue
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        chunk = []
+        for filepath, stat, unchanged in _stat_audio_files(root, known, seen, errors):
+            if unchanged:
+                yield _unchanged(filepath, stat)
+                continue
+            chunk.append((str(filepath), stat))
+            if len(chunk) >= chunk_size:
+                pending.append(pool.submit(_read_chunk, chunk))
+                chunk = []
+            while len(pending) >= workers * 2:
+                yield from _collect_chunk(pending.popleft(), stats)
+        if chunk:
+            pending.append(pool.submit(_read_chunk, chunk))
+        while pending:
+            yield from _collect_chunk(pending.popleft(), stats)
+
+
+def walk_audio_files(root: Path, errors: list = None) -> Generator[os.DirEntry, None, None]:
+    """Yield a DirEntry for every audio file under root, in a single scandir pass.
+
+    Entries are yielded in sorted order within each directory. DirEntry caches
+    its stat() result, so callers can stat each file once and share it.
+    Symlinked directories are not followed, matching os.walk.
+
+    Directories and entries that raise OSError (EIO, EACCES, ...) are skipped
+    and, if ``errors`` is given, their paths appended to it: whatever is under
+    them is unknown, not gone.
+    """
+    stack = [str(root)]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            if errors is not None:
+                errors.append(path)
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS and entry.is_file():
+                    yield entry
+            except OSError:
+                if errors is not None:
+                    errors.append(entry.path)
+                continue
+        stack.extend(reversed(subdirs))
+
+
+def _stat_audio_files(root: Path, known: dict[str, tuple], seen: set = None, errors: list = None):
+    """Yield (path, stat, unchanged) for every audio file under root."""
+    for entry in walk_audio_files(root, errors):
+        try:
+            stat = entry.stat()
+        except OSError:
+            if errors is not None:
+                errors.append(entry.path)
+            continue
+        if seen is not None:
+            seen.add(entry.path)
+        recorded = known.get(entry.path)
+        unchanged = recorded is not None and state_matches(recorded, file_state(stat))
+        yield Path(entry.path), stat, unchanged
+
+
+def _unchanged(filepath: Path, stat: os.stat_result) -> dict:
+    size, mtime_ns, inode = file_state(stat)
+    return {
+        "file_path": str(filepath), "file_size": size,
+        "mtime_ns": mtime_ns, "inode": inode, "unchanged": True,
+    }
+
+
+def _read_chunk(chunk: list[tuple[str, os.stat_result]]) -> tuple[int, float, list[dict]]:
+    """Process-pool task: read metadata for a chunk of files."""
+    start = time.monotonic()
+    results = []
+    for path, stat in chunk:
+        try:
+            results.append(read_track_metadata(Path(path), stat))
+        except Exception:
+            continue
+    return os.getpid(), time.monotonic() - start, results
+
+
+def _collect_chunk(future, stats: dict = None) -> list[dict]:
+    pid, elapsed, results = future.result()
+    if stats is not None:
+        worker = stats.setdefault(pid, {"files": 0, "seconds": 0.0, "files_per_sec": 0.0})
+        worker["files"] += len(results)
+        worker["seconds"] += elapsed
+        if worker["seconds"] > 0:
+            worker["files_per_sec"] = round(worker["files"] / worker["seconds"], 1)
+    return results
 
 
 def _first(val) -> str:
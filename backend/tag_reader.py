@@ -0,0 +1,419 @@
+"""Header-only tag readers for FLAC and MP3.
+
+mutagen.File parses every metadata block and ID3 frame, including embedded
+cover art that can run to several megabytes. These readers walk the block and
+frame headers, read only the fields the scanner stores and seek past the rest.
+
+Each reader returns None for anything outside the common case (ID3 prepended
+to FLAC, unsynchronised or compressed ID3 frames, duplicate frames, ID3v1
+trailers, ...) so the caller can fall back to mutagen and get exactly the
+same result it always did.
+
+Tracks also get an audio hash that ignores tags: the MD5 of the decoded audio
+that FLAC encoders store in STREAMINFO, or an MD5 of an MP3's frames with its
+ID3 and APE tags left out. Equal hashes mean the same audio, with no decoding.
+"""
+import hashlib
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from mutagen import MutagenError
+from mutagen.id3 import Frames
+from mutagen.mp3 import MPEGInfo
+
+FLAC_STREAMINFO = 0
+FLAC_SEEKTABLE = 3
+FLAC_VORBIS_COMMENT = 4
+FLAC_CUESHEET = 5
+FLAC_PICTURE = 6
+
+ID3_FIELDS = {
+    "TPE1": "artist",
+    "TPE2": "album_artist",
+    "TALB": "album",
+    "TIT2": "title",
+    "TRCK": "track_number",
+    "TPOS": "disc_number",
+}
+VORBIS_FIELDS = {"artist", "albumartist", "album", "title", "tracknumber", "discnumber"}
+
+_ID3_ENCODINGS = {
+    0: ("latin1", b"\x00"),
+    1: ("utf16", b"\x00\x00"),
+    2: ("utf_16_be", b"\x00\x00"),
+    3: ("utf8", b"\x00"),
+}
+# ID3v2.4 frame format flags: grouping, compression, encryption, unsync, length
+_ID3V24_FORMAT_FLAGS = 0x004F
+# ID3v2.3 frame format flags: compression, encryption, grouping
+_ID3V23_FORMAT_FLAGS = 0x00E0
+HASH_BLOCK = 1 << 20  # bytes read at a time when hashing MP3 audio
+_APE_HAS_HEADER = 0x80000000
+
+
+def read_flac(file_path: Path, file_size: int) -> Optional[dict]:
+    """Read stream info and Vorbis comments from a FLAC file's header blocks."""
+    try:
+        with open(file_path, "rb") as f:
+            return _read_flac(f, file_size)
+    except (OSError, struct.error, UnicodeError):
+        return None
+
+
+def read_mp3(file_path: Path, file_size: int) -> Optional[dict]:
+    """Read ID3v2.3/2.4 text frames and MPEG stream info from an MP3 file."""
+    try:
+        with open(file_path, "rb") as f:
+            return _read_mp3(f, file_size)
+    except (OSError, struct.error, UnicodeError, MutagenError):
+        return None
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise struct.error("unexpected end of file")
+    return data
+
+
+def _read_flac(f: BinaryIO, file_size: int) -> Optional[dict]:
+    if f.read(4) != b"fLaC":
+        return None
+
+    info = None
+    comments = None
+    seen = set()
+    last = False
+    while not last:
+        header = _read_exact(f, 4)
+        last = bool(header[0] & 0x80)
+        code = header[0] & 0x7F
+        size = int.from_bytes(header[1:], "big")
+        start = f.tell()
+        if code in (FLAC_SEEKTABLE, FLAC_CUESHEET):
+            if code in seen:
+                # mutagen refuses files with more than one of these
+                return None
+            seen.add(code)
+
+        if code == FLAC_STREAMINFO and info is None:
+            info = _flac_stream_info(_read_exact(f, size))
+        elif info is None:
+            # mutagen takes stream info from the first block only
+            return None
+        elif code == FLAC_VORBIS_COMMENT and comments is None:
+            comments = _vorbis_comments(_read_exact(f, size))
+            if comments is None:
+                return None
+        elif code in (FLAC_VORBIS_COMMENT, FLAC_PICTURE):
+            # mutagen sizes these blocks by parsing them rather than trusting
+            # the header, so make sure the two agree before skipping
+            if code == FLAC_PICTURE and _flac_picture_size(f) != size:
+                return None
+            if code == FLAC_VORBIS_COMMENT and _vorbis_comments(_read_exact(f, size)) is None:
+                return None
+        f.seek(start + size)
+
+    if info is None:
+        return None
+
+    length = info["duration"]
+    audio_start = f.tell()
+    # Same arithmetic as mutagen, then kbps as the scanner stores it
+    bitrate = int(float(file_size - audio_start) * 8 / length) if length else 0
+    info["bitrate"] = int(bitrate / 1000)
+
+    comments = comments or {}
+    info["artist"] = comments.get("artist", "")
+    info["album_artist"] = comments.get("albumartist", comments.get("artist", ""))
+    info["album"] = comments.get("album", "")
+    info["title"] = comments.get("title", "")
+    info["track_number"] = comments.get("tracknumber", "")
+    info["disc_number"] = comments.get("discnumber", "")
+    return info
+
+
+def _flac_stream_info(data: bytes) -> Optional[dict]:
+    if len(data) < 34:
+        raise struct.error("short STREAMINFO block")
+    sample_rate = int.from_bytes(data[10:13], "big") >> 4
+    if not sample_rate:
+        return None
+    bps_total = int.from_bytes(data[13:18], "big")
+    bits_per_sample = (((data[12] & 1) << 4) | (bps_total >> 36)) + 1
+    total_samples = bps_total & 0xFFFFFFFFF
+    return {
+        "format": "flac",
+        "sample_rate": sample_rate,
+        "bit_depth": bits_per_sample,
+        "duration": total_samples / float(sample_rate),
+        "audio_hash": flac_audio_hash(int.from_bytes(data[18:34], "big")),
+    }
+
+
+def flac_audio_hash(md5_signature: int) -> str:
+    """The STREAMINFO MD5 as hex, or "" when the encoder left it unset (all zeros)."""
+    return f"{md5_signature:032x}" if md5_signature else ""
+
+
+def _flac_picture_size(f: BinaryIO) -> int:
+    """Return the real size of a PICTURE block by reading its length fields."""
+    size = 4
+    _read_exact(f, 4)
+    mime_length = struct.unpack(">I", _read_exact(f, 4))[0]
+    f.seek(mime_length, os.SEEK_CUR)
+    desc_length = struct.unpack(">I", _read_exact(f, 4))[0]
+    f.seek(desc_length + 16, os.SEEK_CUR)
+    data_length = struct.unpack(">I", _read_exact(f, 4))[0]
+    size += 4 + mime_length + 4 + desc_length + 16 + 4 + data_length
+    return size
+
+
+def _vorbis_comments(data: bytes) -> Optional[dict]:
+    """Return the first value of each wanted field, or None if the block is odd."""
+    offset = 0
+
+    def take(length: int) -> bytes:
+        nonlocal offset
+        if offset + length > len(data):
+            raise struct.error("truncated Vorbis comment")
+        chunk = data[offset:offset + length]
+        offset += length
+        return chunk
+
+    vendor_length = struct.unpack("<I", take(4))[0]
+    take(vendor_length)
+    count = struct.unpack("<I", take(4))[0]
+    comments = {}
+    for _ in range(count):
+        length = struct.unpack("<I", take(4))[0]
+        entry = take(length).decode("utf-8", "replace")
+        key, sep, value = entry.partition("=")
+        if not sep:
+            continue
+        key = key.lower()
+        if key in VORBIS_FIELDS and key not in comments:
+            comments[key] = value
+    if offset != len(data):
+        return None
+    return comments
+
+
+def _read_mp3(f: BinaryIO, file_size: int) -> Optional[dict]:
+    header = f.read(10)
+    if len(header) != 10 or header[:3] != b"ID3":
+        return None
+    version, flags = header[3], header[5]
+    if version not in (3, 4) or flags & (0xCF if version == 4 else 0xDF):
+        # v2.2, unsynchronisation, extended headers and invalid flags
+        return None
+    size_bytes = header[6:10]
+    if any(b & 0x80 for b in size_bytes):
+        return None
+    tag_size = _synchsafe(size_bytes) + 10
+
+    frames = _id3_frame_headers(f, tag_size, version)
+    if frames is None:
+        return None
+
+    fields = {}
+    for name, offset, size, frame_flags in frames:
+        if name not in ID3_FIELDS:
+            continue
+        if name in fields or size == 0:
+            return None
+        f.seek(offset)
+        fields[name] = _id3_text(_read_exact(f, size), version)
+        if fields[name] is None:
+            return None
+
+    if _has_id3v1(f, file_size):
+        return None
+
+    f.seek(0)
+    mpeg = MPEGInfo(f, tag_size)
+    info = {
+        "format": "mp3",
+        "sample_rate": mpeg.sample_rate,
+        "bit_depth": 0,
+        "duration": mpeg.length,
+        "bitrate": int(mpeg.bitrate / 1000),
+    }
+    for frame_id, key in ID3_FIELDS.items():
+        info[key] = fields.get(frame_id, "")
+    if "TPE2" not in fields:
+        info["album_artist"] = info["artist"]
+    return info
+
+
+def _synchsafe(data: bytes) -> int:
+    value = 0
+    for b in data:
+        value = (value << 7) | (b & 0x7F)
+    return value
+
+
+def _id3_frame_headers(f: BinaryIO, tag_size: int, version: int) -> Optional[list]:
+    """Walk the frame headers only, returning (name, data offset, size, flags)."""
+    if version == 4 and not _synchsafe_frame_sizes(f, tag_size):
+        return None
+    frames = []
+    offset = 10
+    while offset + 10 <= tag_size:
+        f.seek(offset)
+        header = _read_exact(f, 10)
+        raw_name, size, frame_flags = struct.unpack(">4sLH", header)
+        if raw_name.strip(b"\x00") == b"":
+            break
+        if version == 4:
+            size = _synchsafe(header[4:8])
+        try:
+            name = raw_name.decode("ascii")
+        except UnicodeDecodeError:
+            return None
+        if name.endswith("\x00"):
+            # v2.2 names padded to four characters; mutagen maps these
+            return None
+        if name in ID3_FIELDS:
+            mask = _ID3V24_FORMAT_FLAGS if version == 4 else _ID3V23_FORMAT_FLAGS
+            if frame_flags & mask:
+                return None
+        frames.append((name, offset + 10, size, frame_flags))
+        offset += 10 + size
+    if offset > tag_size:
+        return None
+    return frames
+
+
+def _synchsafe_frame_sizes(f: BinaryIO, tag_size: int) -> bool:
+    """Decide whether v2.4 frame sizes are synchsafe, as mutagen does.
+
+    Old iTunes versions wrote plain ints, so mutagen walks the frame headers
+    both ways and keeps whichever reading finds more known frames. Only the
+    headers are read here, never the frame data.
+    """
+    data_len = tag_size - 10
+    counts = []
+    overshoot = []
+    for decode in (_synchsafe_int, int):
+        o = 0
+        found = 0
+        while o < data_len - 10:
+            f.seek(10 + o)
+            part = _read_exact(f, 10)
+            if part == b"\x00" * 10:
+                off = -((data_len - o) % 10)
+                break
+            raw_name, size, _ = struct.unpack(">4sLH", part)
+            o += 10 + decode(size)
+            try:
+                name = raw_name.decode("ascii")
+            except UnicodeDecodeError:
+                continue
+            if name in Frames:
+                found += 1
+        else:
+            off = o - data_len
+        counts.append(found)
+        overshoot.append(off)
+    as_synchsafe, as_int = counts
+    synchsafe_off, int_off = overshoot
+    return not (as_int > as_synchsafe or (
+        as_int == as_synchsafe and synchsafe_off >= 1 and int_off <= 1))
+
+
+def _synchsafe_int(value: int) -> int:
+    return _synchsafe(value.to_bytes(4, "big"))
+
+
+def _id3_text(data: bytes, version: int) -> Optional[str]:
+    """Decode a text frame the way str(mutagen TextFrame) renders it."""
+    encoding = _ID3_ENCODINGS.get(data[0])
+    if encoding is None:
+        return None
+    codec, terminator = encoding
+    data = data[1:]
+    values = []
+    while data:
+        index = _find_terminator(data, terminator)
+        if index == -1:
+            values.append(data.decode(codec))
+            break
+        values.append(data[:index].decode(codec))
+        data = data[index + len(terminator):]
+        if version < 4 and not data.strip(b"\x00"):
+            break
+    return "\u0000".join(values)
+
+
+def _find_terminator(data: bytes, terminator: bytes) -> int:
+    if len(terminator) == 1:
+        return data.find(terminator)
+    index = data.find(terminator)
+    while index != -1 and index % 2:
+        index = data.find(terminator, index + 1)
+    return index
+
+
+def _has_id3v1(f: BinaryIO, file_size: int) -> bool:
+    f.seek(max(file_size - 133, 0))
+    return b"TAG" in f.read(133)
+
+
+def mp3_audio_hash(file_path: Path, file_size: int) -> str:
+    """MD5 of an MP3's audio frames with leading ID3v2 and trailing APEv2/ID3v1 tags left out.
+
+    Returns "" if the file is malformed or holds no audio. OSError is left to
+    the caller, since a read that failed may well work next time.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            start, end = _mp3_audio_span(f, file_size)
+            digest = hashlib.md5()
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = _read_exact(f, min(HASH_BLOCK, remaining))
+                digest.update(block)
+                remaining -= len(block)
+    except struct.error:
+        return ""
+    return digest.hexdigest() if end > start else ""
+
+
+def _mp3_audio_span(f: BinaryIO, file_size: int) -> tuple[int, int]:
+    """(start, end) byte offsets of the audio between an MP3's tags."""
+    start = 0
+    while True:
+        f.seek(start)
+        header = f.read(10)
+        if len(header) != 10 or header[:3] != b"ID3" or any(b & 0x80 for b in header[6:10]):
+            break
+        # Tag size excludes the header, and the footer if flag 0x10 says there is one
+        start += 10 + _synchsafe(header[6:10]) + (10 if header[5] & 0x10 else 0)
+
+    end = file_size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = _read_exact(f, 32)
+        if footer[:8] == b"APETAGEX":
+            # Size counts the items and footer; a header, if flagged, is 32 bytes more
+            size, _, flags = struct.unpack("<III", footer[12:24])
+            end -= size + (32 if flags & _APE_HAS_HEADER else 0)
+    return start, max(end, start)
+
+
+def read_tags(file_path: Path, file_size: int) -> Optional[dict]:
+    """Fast-path metadata for FLAC and MP3, or None to use mutagen instead."""
+    ext = Path(file_path).suffix.lower()
+    if ext == ".flac":
+        return read_flac(file_path, file_size)
+    if ext == ".mp3":
+        return read_mp3(file_path, file_size)
+    return None
@@ -0,0 +1,112 @@
+"""Fixtures and helpers shared by the test modules."""
+import base64
+
+import pytest
+import database
+from database import get_db
+from library import TrackWriter, load_existing
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point the app at a fresh, initialised database file."""
+    path = tmp_path / "plex-dedup.db"
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    return path
+
+
+def track_meta(path, **overrides):
+    """Metadata as the scanner returns it for a plain 320 kbps MP3 at path."""
+    meta = {
+        "file_path": path, "file_size": 1000, "format": "mp3", "bitrate": 320,
+        "bit_depth": 0, "sample_rate": 44100, "duration": 200.0, "artist": "Artist",
+        "album_artist": "Artist", "album": "Album", "title": "Title", "track_number": 1,
+        "disc_number": 1, "fingerprint": "", "mtime_ns": 1, "inode": 1,
+        "audio_hash": "",
+    }
+    meta.update(overrides)
+    return meta
+
+
+def write_tracks(*metas):
+    """Write scanned metadata to the tracks table as a scan would."""
+    with get_db() as db:
+        writer = TrackWriter(db, load_existing(db))
+        for meta in metas:
+            writer.write(meta)
+        writer.flush()
+
+
+def unresolved_groups():
+    """{group id: (match type, sorted member paths)} for every unresolved group."""
+    with get_db() as db:
+        rows = db.execute("""
+            SELECT g.id, g.match_type, GROUP_CONCAT(t.file_path) AS paths
+            FROM dupe_groups g JOIN dupe_group_members m ON m.group_id = g.id
+            JOIN tracks t ON t.id = m.track_id
+            WHERE g.resolved = 0 GROUP BY g.id
+        """).fetchall()
+    return {r["id"]: (r["match_type"], sorted(r["paths"].split(","))) for r in rows}
+
+
+def library_with_groups(tmp_path, count):
+    """count groups of two tracks each, with real files under tmp_path/music."""
+    music = tmp_path / "music"
+    metas = []
+    for i in range(count):
+        for fmt in ("mp3", "flac"):
+            path = music / f"artist{i}" / f"song.{fmt}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"audio")
+            metas.append(track_meta(str(path), format=fmt, title=f"Song {i}"))
+    write_tracks(*metas)
+    with get_db() as db:
+        rows = db.execute("SELECT id, file_path FROM tracks ORDER BY id").fetchall()
+        groups = []
+        for keep, other in zip(rows[1::2], rows[0::2]):
+            group_id = db.execute(
+                "INSERT INTO dupe_groups (match_type, confidence, kept_track_id) VALUES ('metadata', 0.9, ?)",
+                (keep["id"],)
+            ).lastrowid
+            db.executemany(
+                "INSERT INTO dupe_group_members VALUES (?, ?)", [(group_id, keep["id"]), (group_id, other["id"])]
+            )
+            groups.append((group_id, keep["id"]))
+    return music, groups
+
+
+def noisy_copy(values, rng, flip_rate=0.03, shift=0):
+    """A copy of sub-fingerprints with bits flipped at flip_rate, starting shift values in."""
+    out = []
+    for v in values[shift:]:
+        for bit in range(32):
+            if rng.random() < flip_rate:
+                v ^= 1 << bit
+        out.append(v)
+    return out
+
+
+def encode_fingerprint(values, algorithm=1):
+    """Reference compressor following chromaprint's FingerprintCompressor."""
+    gaps, prev = [], 0
+    for v in values:
+        x, prev = v ^ prev, v
+        bit, last = 1, 0
+        while x:
+            if x & 1:
+                gaps.append(bit - last)
+                last = bit
+            x >>= 1
+            bit += 1
+        gaps.append(0)
+
+    def pack(vals, width):
+        acc = 0
+        for i, v in enumerate(vals):
+            acc |= v << (i * width)
+        return acc.to_bytes((len(vals) * width + 7) // 8, "little")
+
+    data = (bytes([algorithm]) + len(values).to_bytes(3, "big")
+            + pack([min(g, 7) for g in gaps], 3) + pack([g - 7 for g in gaps if g >= 7], 5))
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
@@ -0,0 +1,75 @@
+import gc
+import sqlite3
+import threading
+import weakref
+
+import pytest
+
+import database
+from database import get_db
+
+
+def test_connections_are_reused_per_thread_and_nesting_gets_its_own(db_path):
+    with get_db() as db:
+        first = db
+        with get_db() as inner:
+            assert inner is not db
+            inner.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+        db.execute("INSERT INTO settings (key, value) VALUES ('b', '2')")
+        assert db.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    with get_db() as db:
+        assert db is first
+
+    other = []
+
+    def use():
+        with get_db() as db:
+            other.append(db)
+
+    thread = threading.Thread(target=use)
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_readonly_connections_see_commits_and_refuse_writes(db_path):
+    with get_db(readonly=True) as ro:
+        assert ro.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0
+    with get_db() as db:
+        db.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+    with get_db(readonly=True) as ro:
+        assert ro.execute("SELECT value FROM settings").fetchone()[0] == "1"
+        with pytest.raises(sqlite3.OperationalError):
+            ro.execute("DELETE FROM settings")
+
+
+def test_idle_connections_are_capped_across_threads(db_path, monkeypatch):
+    monkeypatch.setattr(database, "POOL_MAX_IDLE", 3)
+    monkeypatch.setattr(database, "_pooled", weakref.WeakSet())
+    barrier = threading.Barrier(5)
+    conns = []
+
+    def use():
+        with get_db() as db:
+            conns.append(db)
+            barrier.wait()
+        barrier.wait()
+        # Still alive, so this thread's idle connection still counts
+        barrier.wait()
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    barrier.wait()
+    assert len(database._pooled) == 3
+    closed = [db for db in conns if db not in database._pooled]
+    with pytest.raises(sqlite3.ProgrammingError):
+        closed[0].execute("SELECT 1")
+    barrier.wait()
+    for t in threads:
+        t.join()
+    del conns, closed
+    gc.collect()
+    # Threads that exit give their slots back
+    assert len(database._pooled) == 0
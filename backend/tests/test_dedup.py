@@ -1,5 +1,16 @@
+import os
 import pytest
-from dedup import normalize_text, group_by_metadata, find_duplicates
+import random
+import re
+import time
+import unicodedata
+import dedup
+from dedup import (
+    normalize_text, normalize_many, group_by_metadata, find_duplicates,
+    group_by_fingerprint, fingerprint_similarity, strip_edition, group_by_fuzzy_metadata,
+    minhash_signatures, path_tags, grouping_key, METADATA_MAX_GROUP,
+)
+from tests.conftest import noisy_copy
 
 
 def test_normalize_text_lowercase():
@@ -19,6 +30,84 @@ def test_normalize_text_collapses_whitespace():
     assert normalize_text("  hello   world  ") == "hello world"
 
 
+def _reference_normalize(text):
+    """normalize_text as originally written, before caching and the ASCII fast path."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = text.lower().strip()
+    text = re.sub(r"[^\w\s]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    if text.startswith("the "):
+        text = text[4:]
+    return text
+
+
+def _tag_corpus(seed=1):
+    """Artist, album artist, album and title for a few thousand tracks."""
+    rng = random.Random(seed)
+    words = ("love night heart fire rain gold blue dream road home light time wild "
+             "summer city girl boy moon star river song dance life world").split()
+    accented = ["Björk", "Sigur Rós", "Motörhead", "Beyoncé", "Céline", "Zoë", "Mötley Crüe"]
+    suffixes = ["", "", "", " (Live)", " - Remastered 2011", " (feat. MC Ren)", "!", "?", " [Demo]"]
+
+    def phrase(n):
+        return " ".join(rng.choice(words).capitalize() for _ in range(n))
+
+    fields = []
+    for _ in range(300):
+        artist = rng.choice(accented) if rng.random() < 0.08 else "The " * (rng.random() < 0.2) + phrase(2)
+        for _ in range(rng.randint(1, 4)):
+            album = phrase(rng.randint(1, 3)) + rng.choice(suffixes)
+            for _ in range(rng.randint(8, 14)):
+                fields += [artist, artist, album, phrase(rng.randint(1, 4)) + rng.choice(suffixes)]
+    return fields
+
+
+def test_normalize_many_matches_reference():
+    odd = [
+        "ＡＢＣ Ｔｈｅ", "ﬁve ﬂowers", "a\x1cb\x1fc", "a\u00a0b\u3000c", "\tThe\nEnd\r", "snake_case 2",
+        "The", "THE  the x", "½ time", "İstanbul", "x\u200by", "—", "", None, "«Quoted»", "Déjà vu",
+    ]
+    corpus = _tag_corpus() + odd
+    assert normalize_many(corpus) == [_reference_normalize(t) for t in corpus]
+    assert [normalize_text(t) for t in odd] == [_reference_normalize(t) for t in odd]
+
+
+def test_normalize_many_normalizes_each_distinct_value_once():
+    corpus = _tag_corpus()
+    distinct = {t for t in corpus if t}
+    assert len(distinct) * 5 <= len(corpus)  # the repetition the cache pays off on
+
+    dedup._normalize.cache_clear()
+    normalize_many(corpus)
+    info = dedup._normalize.cache_info()
+    assert info.misses == len(distinct)
+    assert info.hits == sum(1 for t in corpus if t) - len(distinct)
+
+
+# Timing comparisons flake on loaded CI machines; run them with BENCHMARK=1
+benchmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="set BENCHMARK=1 to run benchmarks")
+
+
+@benchmark
+def test_normalize_many_is_5x_faster_than_reference():
+    corpus = _tag_corpus()
+
+    def best_of(fn, runs=5):
+        times = []
+        for _ in range(runs):
+            dedup._normalize.cache_clear()  # measure from a cold cache every run
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    reference = best_of(lambda: [_reference_normalize(t) for t in corpus])
+    batch = best_of(lambda: normalize_many(corpus))
+    assert reference / batch >= 5
+
+
 def test_group_by_metadata_finds_dupes():
     tracks = [
         {"id": 1, "artist": "Beatles", "title": "Help", "album": "Help!", "format": "mp3", "bitrate": 128, "bit_depth": 0, "sample_rate": 44100},
@@ -47,3 +136,128 @@ def test_find_duplicates_picks_best_quality():
     result = find_duplicates(group)
     assert result["keep_id"] == 2
     assert result["trash_ids"] == [1]
+
+
+def test_find_duplicates_uses_stored_quality_score():
+    group = [
+        {"id": 1, "format": "mp3", "bitrate": 128, "quality_score": 20000},
+        {"id": 2, "format": "flac", "bitrate": 0, "quality_score": 10441},
+        {"id": 3, "format": "flac", "bitrate": 0, "quality_score": 10441},
+    ]
+    result = find_duplicates(group)
+    assert (result["keep_id"], result["trash_ids"], result["quality_gap"]) == (1, [2, 3], 9559)
+
+
+def test_group_by_fingerprint_matches_noisy_shifted_copy():
+    rng = random.Random(42)
+    original = [rng.getrandbits(32) for _ in range(300)]
+    unrelated = [rng.getrandbits(32) for _ in range(300)]
+    groups = group_by_fingerprint([
+        (1, original),
+        (2, noisy_copy(original, rng, shift=3)),
+        (3, unrelated),
+    ], threshold=0.85)
+    assert len(groups) == 1
+    members, confidence = groups[0]
+    assert sorted(members) == [1, 2]
+    assert 0.9 < confidence < 1.0
+
+
+def test_group_by_fingerprint_respects_threshold():
+    rng = random.Random(7)
+    original = [rng.getrandbits(32) for _ in range(300)]
+    copy = noisy_copy(original, rng, flip_rate=0.2)
+    assert group_by_fingerprint([(1, original), (2, copy)], threshold=0.85) == []
+
+
+def test_fingerprint_similarity_alignment():
+    values = list(range(1000, 1200))
+    assert fingerprint_similarity(values, values[5:], 5) == 1.0
+    assert fingerprint_similarity(values[:10], values[:10]) == 0.0  # too short to judge
+
+
+@pytest.mark.parametrize("title", [
+    "Song (Remastered 2011)", "Song - 2011 Remaster", "Song [Mono Version]",
+    "Song (feat. Someone)", "Song (Radio Edit)",
+])
+def test_strip_edition(title):
+    assert strip_edition(title) == "Song"
+
+
+def test_strip_edition_keeps_distinct_takes():
+    assert strip_edition("Song (Live at Wembley)") == "Song (Live at Wembley)"
+    assert strip_edition("Song - Acoustic Version") == "Song - Acoustic Version"
+
+
+def _track(track_id, artist, title, duration=200.0):
+    return {"id": track_id, "artist": artist, "title": title, "duration": duration}
+
+
+def test_group_by_fuzzy_metadata_matches_release_variants():
+    tracks = [
+        _track(1, "Artist", "Song (Remastered 2011)"),
+        _track(2, "Artist feat. Guest", "Song - 2011 Remaster", 201.0),
+        _track(3, "Artist", "Song", None),
+        _track(4, "Artist", "Different Song"),
+        _track(5, "Other Band", "Song"),
+    ]
+    [(members, similarity)] = group_by_fuzzy_metadata(tracks, threshold=0.8)
+    assert sorted(members) == [1, 2, 3]
+    assert similarity == 1.0
+
+
+def test_group_by_fuzzy_metadata_scores_near_matches():
+    tracks = [_track(1, "The Beatles", "Here Comes the Sun"), _track(2, "Beatles", "Here Comes The Sun!!")]
+    assert [sorted(m) for m, _ in group_by_fuzzy_metadata(tracks, 0.8)] == [[1, 2]]
+    tracks = [_track(1, "Artist", "Love Song"), _track(2, "Artist", "Long Song")]
+    [(_, similarity)] = group_by_fuzzy_metadata(tracks, 0.5)
+    assert 0.5 <= similarity < 0.8
+    assert group_by_fuzzy_metadata(tracks, 0.8) == []
+
+
+def test_group_by_fuzzy_metadata_needs_matching_durations():
+    tracks = [_track(1, "Artist", "Song"), _track(2, "Artist", "Song (Remastered)", 260.0)]
+    assert group_by_fuzzy_metadata(tracks, 0.8) == []
+
+
+def test_minhash_blocking_limits_comparisons(monkeypatch):
+    rng = random.Random(3)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 8))) for _ in range(3000)]
+    texts = [" ".join(rng.choices(words, k=3)) for _ in range(5000)]
+    pairs = dedup._band_candidates(minhash_signatures(texts))
+    assert len(pairs) < 5 * len(texts)
+
+    # Every pair above the threshold is still found
+    scored = []
+    monkeypatch.setattr(dedup, "trigram_similarity", lambda a, b: scored.append((a, b)) or 1.0)
+    tracks = [_track(i, "", text) for i, text in enumerate(texts)]
+    tracks.append(_track(len(texts), "", texts[0] + "s"))
+    groups = group_by_fuzzy_metadata(tracks, 0.8)
+    assert [0, len(texts)] in [sorted(m) for m, _ in groups]
+    assert len(scored) < len(texts)
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/music/Artist/Album/01 - Song.flac", ("Artist", "Album", "Song")),
+    ("/music/Artist/Album/03_Song.mp3", ("Artist", "Album", "Song")),
+    ("/music/Various/Comp/12. Other - Tune.mp3", ("Other", "Comp", "Tune")),
+])
+def test_path_tags(path, expected):
+    tags = path_tags(path)
+    assert (tags["artist"], tags["album"], tags["title"]) == expected
+
+
+def test_grouping_key_falls_back_to_path():
+    untagged = {"artist": "", "title": "", "album": "", "file_path": "/music/The Artist/LP/01 - Song!.mp3"}
+    tagged = {"artist": "Artist", "title": "Song", "album": "LP", "file_path": "/elsewhere/x.flac"}
+    assert grouping_key(untagged) == grouping_key(tagged) == ("artist", "song", "lp")
+    # Tagged tracks never take anything from their path
+    assert grouping_key({**tagged, "album": ""}) == ("artist", "song", "")
+
+
+def test_group_by_metadata_skips_degenerate_and_generic_keys():
+    untagged = [{"artist": "", "title": "", "album": ""} for _ in range(5)]
+    title_only = [{"artist": "", "title": "Intro", "album": ""} for _ in range(5)]
+    generic = [{"artist": "Unknown", "title": "Track 01", "album": "Unknown"}] * (METADATA_MAX_GROUP + 1)
+    real = [{"artist": "A", "title": "T", "album": "L"}] * 2
+    assert group_by_metadata(untagged + title_only + generic + real) == [real]
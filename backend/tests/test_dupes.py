@@ -0,0 +1,299 @@
+import sqlite3
+import database
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from database import get_db
+from fingerprint import pack_fingerprint
+from library import mark_missing
+from dedup import group_by_metadata
+from routes import dupes
+from routes.dupes import update_dupe_groups
+from tests.conftest import noisy_copy, track_meta, unresolved_groups, write_tracks
+
+import numpy as np
+
+
+def test_update_groups_only_touched_keys(db_path):
+    write_tracks(
+        track_meta("/music/a.mp3"), track_meta("/music/b.flac", format="flac"), track_meta("/music/c.mp3", title="Other")
+    )
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["total"]) == (1, 1)
+    [group_id] = unresolved_groups()
+
+    # Nothing changed: nothing is queued and the group is left alone
+    summary = update_dupe_groups()
+    assert summary["created"] == summary["updated"] == summary["removed"] == 0
+    assert summary["results"] == []
+
+    # An unrelated duplicate pair forms its own group; the first keeps its ID
+    write_tracks(track_meta("/music/d.mp3", title="Other", format="flac"))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"], summary["total"]) == (1, 0, 2)
+    assert group_id in unresolved_groups()
+
+    # A third copy joins the existing group in place
+    write_tracks(track_meta("/music/e.mp3"))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"]) == (0, 1)
+    assert unresolved_groups()[group_id] == ("metadata", ["/music/a.mp3", "/music/b.flac", "/music/e.mp3"])
+
+
+def test_update_groups_removes_groups_that_shrink(db_path):
+    write_tracks(track_meta("/music/a.mp3"), track_meta("/music/b.mp3"))
+    update_dupe_groups()
+    with get_db() as db:
+        mark_missing(db, ["/music/b.mp3"])
+    summary = update_dupe_groups()
+    assert (summary["removed"], summary["total"]) == (1, 0)
+    assert unresolved_groups() == {}
+
+
+def test_retagged_track_moves_between_groups(db_path):
+    write_tracks(track_meta("/music/a.mp3"), track_meta("/music/b.mp3"), track_meta("/music/c.mp3", title="Other"))
+    update_dupe_groups()
+    [group_id] = unresolved_groups()
+    write_tracks(track_meta("/music/b.mp3", title="Other", mtime_ns=2))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["removed"]) == (1, 1)
+    assert group_id not in unresolved_groups()
+    assert list(unresolved_groups().values()) == [("metadata", ["/music/b.mp3", "/music/c.mp3"])]
+
+
+def test_unchanged_rescan_queues_nothing(db_path):
+    write_tracks(track_meta("/music/a.mp3"), track_meta("/music/b.mp3"))
+    update_dupe_groups()
+    write_tracks(track_meta("/music/a.mp3", mtime_ns=2), track_meta("/music/b.mp3", scanned_at=None))
+    with get_db() as db:
+        assert db.execute("SELECT COUNT(*) FROM dupe_dirty_keys").fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM dupe_dirty_tracks").fetchone()[0] == 0
+
+
+def test_claimed_queue_survives_an_interrupted_analysis(db_path):
+    from routes.dupes import _claim_dirty
+
+    write_tracks(track_meta("/music/a.mp3"), track_meta("/music/b.mp3"))
+    # Killed mid-analysis: the claim is never committed
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    _claim_dirty(conn)
+    assert conn.execute("SELECT COUNT(*) FROM dupe_dirty_tracks").fetchone()[0] == 0
+    conn.close()
+    with get_db() as db:
+        assert db.execute("SELECT COUNT(*) FROM dupe_dirty_tracks").fetchone()[0] == 2
+    assert update_dupe_groups()["created"] == 1
+
+
+def test_fingerprint_groups_keep_ids(db_path):
+    rng = np.random.default_rng(7)
+    audio = rng.integers(0, 2**32, size=400, dtype=np.uint64)
+    write_tracks(
+        track_meta("/music/a.mp3", title="Live", fingerprint=pack_fingerprint(audio)),
+        track_meta("/music/b.flac", title="Live (Remaster)", fingerprint=pack_fingerprint(noisy_copy(audio, rng))),
+    )
+    update_dupe_groups()
+    [(group_id, (match_type, _))] = unresolved_groups().items()
+    assert match_type == "fingerprint"
+
+    write_tracks(track_meta("/music/c.mp3", title="Unrelated"))
+    write_tracks(track_meta("/music/d.mp3", title="Live [Mono]", fingerprint=pack_fingerprint(noisy_copy(audio, rng))))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"]) == (0, 1)
+    assert unresolved_groups()[group_id][1] == ["/music/a.mp3", "/music/b.flac", "/music/d.mp3"]
+
+
+def test_fingerprint_regrouping_only_reads_what_the_change_reaches(db_path, monkeypatch):
+    import routes.dupes
+
+    rng = np.random.default_rng(11)
+    songs = [rng.integers(0, 2**32, size=400, dtype=np.uint64) for _ in range(3)]
+    write_tracks(*(
+        track_meta(
+            f"/music/{n}{copy}.mp3", title=f"Song {n}{copy}", fingerprint=pack_fingerprint(noisy_copy(audio, rng))
+        )
+        for n, audio in enumerate(songs) for copy in "ab"
+    ))
+    update_dupe_groups()
+    assert len(unresolved_groups()) == 3
+
+    read = []
+    unpack = routes.dupes.unpack_fingerprint
+    monkeypatch.setattr(routes.dupes, "unpack_fingerprint", lambda blob: read.append(blob) or unpack(blob))
+    write_tracks(track_meta("/music/0c.mp3", title="Song 0c", fingerprint=pack_fingerprint(noisy_copy(songs[0], rng))))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"]) == (0, 1)
+    # The new track is indexed, then it and the group it joins are read; the other songs are not
+    assert len(read) == 4
+    assert sorted(paths for _, paths in unresolved_groups().values())[0] == [
+        "/music/0a.mp3", "/music/0b.mp3", "/music/0c.mp3"
+    ]
+
+
+def test_backfill_keeps_existing_group_ids(db_path):
+    with get_db() as db:
+        for path in ("/music/a.mp3", "/music/b.mp3"):
+            db.execute(
+                "INSERT INTO tracks (file_path, format, bitrate, bit_depth, sample_rate, duration, artist, title, album)"
+                " VALUES (?, 'mp3', 320, 0, 44100, 200.0, 'The Artist', 'Song!', 'LP')",
+                (path,)
+            )
+        db.execute("UPDATE tracks SET norm_artist = NULL, norm_title = NULL, norm_album = NULL")
+        db.execute("DELETE FROM dupe_dirty_keys")
+        group_id = db.execute(
+            "INSERT INTO dupe_groups (match_type, confidence, kept_track_id) VALUES ('metadata', 0.5, 1)"
+        ).lastrowid
+        db.executemany("INSERT INTO dupe_group_members VALUES (?, ?)", [(group_id, 1), (group_id, 2)])
+
+    database.init_db()
+    summary = update_dupe_groups()
+    assert summary["created"] == 0 and summary["total"] == 1
+    assert group_id in unresolved_groups()
+
+
+def test_sql_grouping_matches_group_by_metadata(db_path):
+    tags = [
+        ("The Beatles", "Help!", "Help"), ("beatles", "help", "HELP"), ("Beatles", "Help", "1"),
+        ("Björk", "Jóga", "Homogenic"), ("Bjork", "Joga", "Homogenic"), ("björk", "jóga ", "homogenic"),
+        ("", "", ""), ("", "", ""), ("Solo", "Only", "One"),
+    ]
+    metas = [
+        track_meta(f"/music/{i}.mp3", artist=artist, title=title, album=album)
+        for i, (artist, title, album) in enumerate(tags)
+    ]
+    write_tracks(*metas)
+    update_dupe_groups()
+
+    expected = sorted(sorted(t["file_path"] for t in group) for group in group_by_metadata(metas))
+    assert sorted(paths for _, paths in unresolved_groups().values()) == expected
+
+
+def test_fuzzy_groups_follow_the_setting(db_path):
+    write_tracks(
+        track_meta("/music/a.mp3", title="Song (Remastered 2011)"),
+        track_meta("/music/b.flac", title="Song - 2011 Remaster", format="flac"),
+        track_meta("/music/c.mp3", title="Unrelated"),
+    )
+    update_dupe_groups()
+    assert unresolved_groups() == {}
+
+    with get_db() as db:
+        db.execute("INSERT INTO settings (key, value) VALUES ('fuzzy_matching', 'on')")
+    summary = update_dupe_groups(revisit_fuzzy=True)
+    [(group_id, group)] = unresolved_groups().items()
+    assert group == ("fuzzy", ["/music/a.mp3", "/music/b.flac"])
+    assert 0 < summary["results"][0]["confidence"] < 0.95
+
+    # A rescan that touches keys rebuilds fuzzy groups in place
+    write_tracks(track_meta("/music/d.mp3", title="Song [Deluxe Edition]"))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"]) == (0, 1)
+    assert unresolved_groups()[group_id][1] == ["/music/a.mp3", "/music/b.flac", "/music/d.mp3"]
+
+    with get_db() as db:
+        db.execute("UPDATE settings SET value = 'off' WHERE key = 'fuzzy_matching'")
+    assert update_dupe_groups()["removed"] == 1
+    assert unresolved_groups() == {}
+
+
+def test_untagged_tracks_group_by_path_and_degenerate_keys_are_skipped(db_path):
+    untagged = {"artist": "", "title": "", "album": ""}
+    write_tracks(
+        track_meta("/music/Artist/LP/01 - Song.mp3", **untagged),
+        track_meta("/music/Artist/LP/01 - Song.flac", **untagged, format="flac"),
+        track_meta("/a.mp3", **{**untagged, "title": "x"}),
+        track_meta("/b.mp3", **{**untagged, "title": "x"}),
+    )
+    summary = update_dupe_groups()
+    assert list(unresolved_groups().values()) == [
+        ("metadata", ["/music/Artist/LP/01 - Song.flac", "/music/Artist/LP/01 - Song.mp3"])
+    ]
+    assert summary["skipped"] == 2
+
+
+def test_backfill_rekeys_untagged_tracks_and_drops_empty_group(db_path):
+    with get_db() as db:
+        for path in ("/music/A/LP/1 - One.mp3", "/music/B/LP/2 - Two.mp3", "/music/B/LP/2 - Two.flac"):
+            db.execute(
+                "INSERT INTO tracks (file_path, format, bitrate, bit_depth, sample_rate, duration,"
+                " artist, title, album, norm_artist, norm_title, norm_album)"
+                " VALUES (?, 'mp3', 320, 0, 44100, 200.0, '', '', '', '', '', '')",
+                (path,)
+            )
+        group_id = db.execute(
+            "INSERT INTO dupe_groups (match_type, confidence, kept_track_id, group_key)"
+            " VALUES ('metadata', 0.5, 1, char(31) || char(31))"
+        ).lastrowid
+        db.executemany("INSERT INTO dupe_group_members VALUES (?, ?)", [(group_id, i) for i in (1, 2, 3)])
+        db.execute("DELETE FROM dupe_dirty_keys")
+
+    database.init_db()
+    update_dupe_groups()
+    assert list(unresolved_groups().values()) == [("metadata", ["/music/B/LP/2 - Two.flac", "/music/B/LP/2 - Two.mp3"])]
+
+
+def test_identical_audio_forms_an_exact_group(db_path):
+    write_tracks(
+        track_meta("/music/a.mp3", title="Song", audio_hash="ab" * 16),
+        track_meta("/music/b.mp3", title="Renamed", artist="Someone", audio_hash="ab" * 16),
+        track_meta("/music/c.mp3", title="Song", audio_hash="cd" * 16, format="flac"),
+        track_meta("/music/d.mp3", title="Other", audio_hash=""),
+        track_meta("/music/e.mp3", title="Else", audio_hash=""),
+    )
+    summary = update_dupe_groups()
+    groups = sorted(unresolved_groups().values())
+    assert groups == [("exact", ["/music/a.mp3", "/music/b.mp3"]), ("metadata", ["/music/a.mp3", "/music/c.mp3"])]
+    exact = next(r for r in summary["results"] if r["match_type"] == "exact")
+    assert exact["confidence"] == 1.0
+
+    # Byte-identical copies that already share a metadata group aren't listed twice
+    write_tracks(track_meta("/music/b.mp3", title="Song", mtime_ns=2, audio_hash="ab" * 16))
+    update_dupe_groups()
+    assert sorted(unresolved_groups().values()) == [("metadata", ["/music/a.mp3", "/music/b.mp3", "/music/c.mp3"])]
+
+
+def test_listing_returns_fingerprinted_members_without_the_blob(db_path):
+    fingerprint = pack_fingerprint([0xFFFFFFFF] * 200)
+    write_tracks(track_meta("/music/a.mp3", fingerprint=fingerprint), track_meta("/music/b.flac", format="flac"))
+    update_dupe_groups()
+    app = FastAPI()
+    app.include_router(dupes.router)
+
+    response = TestClient(app).get("/api/dupes/")
+    assert response.status_code == 200
+    [group] = response.json()
+    assert sorted(m["file_path"] for m in group["members"]) == ["/music/a.mp3", "/music/b.flac"]
+    assert all("fingerprint" not in m for m in group["members"])
+
+
+def test_exact_regrouping_only_reads_the_hashes_the_change_reaches(db_path, monkeypatch):
+    import routes.dupes
+
+    write_tracks(*(
+        track_meta(f"/music/{n}{copy}.mp3", title=f"Song {n}{copy}", audio_hash=f"{n:02x}" * 16)
+        for n in range(3) for copy in "ab"
+    ))
+    update_dupe_groups()
+    assert len(unresolved_groups()) == 3
+
+    seen = []
+    reconcile = routes.dupes._reconcile_groups
+
+    def spy(db, match_type, components, scope=None):
+        if match_type == "exact":
+            seen.append((sorted(len(ids) for ids, _ in components), len(scope)))
+        return reconcile(db, match_type, components, scope)
+
+    monkeypatch.setattr(routes.dupes, "_reconcile_groups", spy)
+    write_tracks(track_meta("/music/0c.mp3", title="Song 0c", audio_hash="00" * 16))
+    summary = update_dupe_groups()
+    assert (summary["created"], summary["updated"]) == (0, 1)
+    # Only the new track's hash is regrouped; the other two pairs aren't read
+    assert seen == [([3], 3)]
+
+    # Retitling a pair into one metadata group hands it over, though its hash didn't change
+    seen.clear()
+    write_tracks(track_meta("/music/1b.mp3", title="Song 1a", mtime_ns=2, audio_hash="01" * 16))
+    update_dupe_groups()
+    assert seen == [([], 2)]
+    assert ("metadata", ["/music/1a.mp3", "/music/1b.mp3"]) in unresolved_groups().values()
+    assert len(unresolved_groups()) == 3
@@ -1,12 +1,18 @@
+import errno
+import os
 import pytest
 from pathlib import Path
 import tempfile
 import shutil
-from file_manager import trash_file, restore_file, get_trash_size
+import file_manager
+from database import get_db
+from file_manager import trash_file, restore_file, get_trash_size, move_file, move_many
+from trash_ledger import reconcile_trash, trash_breakdown, trash_totals
+from trash_purge import purge_trash
 
 
 @pytest.fixture
-def temp_dirs():
+def temp_dirs(db_path):
     music_dir = Path(tempfile.mkdtemp())
     trash_dir = Path(tempfile.mkdtemp())
     test_file = music_dir / "artist" / "album" / "song.mp3"
@@ -44,3 +50,106 @@ def test_get_trash_size(temp_dirs):
     trash_file(test_file, trash_dir)
     size = get_trash_size(trash_dir)
     assert size > 0
+
+
+def _totals():
+    with get_db() as db:
+        return trash_totals(db)
+
+
+def test_ledger_follows_trash_restore_and_purge(temp_dirs):
+    music_dir, trash_dir, test_file = temp_dirs
+    other = music_dir / "other" / "b.mp3"
+    other.parent.mkdir()
+    other.write_bytes(b"x" * 10)
+
+    dest = trash_file(test_file, trash_dir, music_root=music_dir)
+    trash_file(other, trash_dir, music_root=music_dir)
+    assert _totals() == {"files": 2, "bytes": 1610}
+    with get_db() as db:
+        assert trash_breakdown(db, "folder") == [
+            {"name": "artist", "files": 1, "bytes": 1600}, {"name": "other", "files": 1, "bytes": 10},
+        ]
+        assert trash_breakdown(db, "age")[0] == {"name": "day", "files": 2, "bytes": 1610}
+
+    restore_file(dest, str(test_file))
+    assert _totals() == {"files": 1, "bytes": 10}
+    assert purge_trash(trash_dir) == 1
+    assert _totals() == {"files": 0, "bytes": 0}
+
+
+def test_reconcile_matches_the_disk(temp_dirs):
+    music_dir, trash_dir, test_file = temp_dirs
+    dest = Path(trash_file(test_file, trash_dir, music_root=music_dir))
+    # Changed behind the ledger's back: one file resized, one copied in
+    dest.write_bytes(b"z" * 20)
+    stray = trash_dir / "old" / "stray.flac"
+    stray.parent.mkdir()
+    stray.write_bytes(b"y" * 50)
+
+    with get_db() as db:
+        assert reconcile_trash(db, trash_dir) == {"added": 1, "removed": 0, "resized": 1, "unscanned": 0}
+        assert trash_totals(db) == {"files": 2, "bytes": get_trash_size(trash_dir)}
+        dest.unlink()
+        assert reconcile_trash(db, trash_dir) == {"added": 0, "removed": 1, "resized": 0, "unscanned": 0}
+        assert trash_totals(db) == {"files": 1, "bytes": 50}
+        assert reconcile_trash(db, trash_dir) == {"added": 0, "removed": 0, "resized": 0, "unscanned": 0}
+
+
+def _cross_device(monkeypatch):
+    def rename(src, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(file_manager.os, "rename", rename)
+
+
+def test_cross_device_move_copies_verifies_and_keeps_mtime(temp_dirs, monkeypatch):
+    music_dir, trash_dir, test_file = temp_dirs
+    os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+    _cross_device(monkeypatch)
+    monkeypatch.setattr(file_manager, "COPY_BUFFER", 64)
+
+    dest = trash_dir / "a" / "song.mp3"
+    move_file(test_file, dest)
+    assert not test_file.exists()
+    assert dest.read_bytes() == b"fake audio data " * 100
+    assert dest.stat().st_mtime_ns == 1_000_000_000
+    assert list(dest.parent.iterdir()) == [dest]
+
+
+def test_failed_verification_leaves_the_source_and_no_partial_copy(temp_dirs, monkeypatch):
+    music_dir, trash_dir, test_file = temp_dirs
+    _cross_device(monkeypatch)
+    monkeypatch.setattr(file_manager, "_file_digest", lambda path: b"corrupt")
+
+    dest = trash_dir / "song.mp3"
+    [error] = move_many([(test_file, dest)])
+    assert error.errno == errno.EIO
+    assert test_file.exists()
+    assert list(trash_dir.iterdir()) == []
+
+
+def test_verification_rereads_the_copy_from_disk(temp_dirs, monkeypatch):
+    music_dir, trash_dir, test_file = temp_dirs
+    _cross_device(monkeypatch)
+    events = []
+    monkeypatch.setattr(file_manager, "_drop_cache", lambda fd: events.append("drop"))
+    real_digest = file_manager._file_digest
+    monkeypatch.setattr(file_manager, "_file_digest", lambda path: events.append("verify") or real_digest(path))
+
+    move_file(test_file, trash_dir / "song.mp3")
+    assert events == ["drop", "verify"]
+
+
+def test_abandoned_partial_copies_are_swept_and_never_ledgered(temp_dirs):
+    music_dir, trash_dir, test_file = temp_dirs
+    stale = trash_dir / "a" / ".song.mp3.123.456.part"
+    fresh = trash_dir / "a" / ".other.mp3.123.789.part"
+    stale.parent.mkdir()
+    stale.write_bytes(b"half")
+    fresh.write_bytes(b"half")
+    os.utime(stale, (0, 0))
+
+    with get_db() as db:
+        assert reconcile_trash(db, trash_dir)["added"] == 0
+    assert file_manager.sweep_partial_copies(trash_dir) == 1
+    assert sorted(p.name for p in stale.parent.iterdir()) == [fresh.name]
@@ -1,21 +1,93 @@
 import pytest
+import numpy as np
+import random
+import shutil
+import subprocess
 from pathlib import Path
+import fingerprint
+from fingerprint import (
+    FingerprintPool, decode_fingerprint, pack_fingerprint, unpack_fingerprint, similarities,
+)
 from scanner import generate_fingerprint
+from tests.conftest import encode_fingerprint
 
 FIXTURES = Path(__file__).parent / "fixtures"
+# generate_fingerprint returns None without fpcalc, so these need the real binary
+requires_fpcalc = pytest.mark.skipif(shutil.which("fpcalc") is None, reason="fpcalc not installed")
 
-def test_fingerprint_returns_string():
+@requires_fpcalc
+def test_fingerprint_returns_raw_blob():
     fp = generate_fingerprint(FIXTURES / "test_128.mp3")
-    assert isinstance(fp, str)
+    assert isinstance(fp, bytes)
     assert len(fp) > 0
+    assert len(unpack_fingerprint(fp)) == len(fp) // 4
 
+@requires_fpcalc
 def test_same_file_same_fingerprint():
     fp1 = generate_fingerprint(FIXTURES / "test_128.mp3")
     fp2 = generate_fingerprint(FIXTURES / "test_128.mp3")
     assert fp1 == fp2
 
+@requires_fpcalc
 def test_different_files_produce_fingerprints():
     fp1 = generate_fingerprint(FIXTURES / "test_128.mp3")
     fp2 = generate_fingerprint(FIXTURES / "test_16_44.flac")
-    assert isinstance(fp1, str)
-    assert isinstance(fp2, str)
+    assert isinstance(fp1, bytes)
+    assert isinstance(fp2, bytes)
+
+
+def _fake_fpcalc(slow_paths):
+    def run(path, timeout):
+        if str(path) in slow_paths and timeout < 60:
+            raise subprocess.TimeoutExpired("fpcalc", timeout)
+        return f"fp:{path}".encode()
+    return run
+
+
+def test_fingerprint_pool_returns_every_item(monkeypatch):
+    monkeypatch.setattr(fingerprint, "fpcalc", _fake_fpcalc(set()))
+    pool = FingerprintPool(workers=3, max_pending=2)
+    results = []
+    for i in range(10):
+        pool.submit({"file_path": f"/music/{i}.mp3"})
+        results.extend(pool.drain())
+    results.extend(pool.finish())
+    assert sorted(r["fingerprint"] for r in results) == sorted(f"fp:/music/{i}.mp3".encode() for i in range(10))
+    assert pool.stats["completed"] == 10
+
+
+def test_fingerprint_pool_retries_timeouts_with_longer_timeout(monkeypatch):
+    monkeypatch.setattr(fingerprint, "fpcalc", _fake_fpcalc({"/music/slow.mp3"}))
+    pool = FingerprintPool(workers=2, timeout=30, retry_timeout=120)
+    pool.submit({"file_path": "/music/slow.mp3"})
+    pool.submit({"file_path": "/music/fast.mp3"})
+    results = {r["file_path"]: r["fingerprint"] for r in pool.finish()}
+    assert results["/music/slow.mp3"] == b"fp:/music/slow.mp3"
+    assert pool.stats["timeouts"] == 1
+    assert pool.stats["retried"] == 1
+
+
+@pytest.mark.parametrize("n", [0, 1, 7, 300])
+def test_decode_fingerprint_round_trips(n):
+    rng = random.Random(n)
+    values = [rng.getrandbits(32) for _ in range(n)]
+    assert decode_fingerprint(encode_fingerprint(values)) == values
+
+
+def test_decode_fingerprint_rejects_truncated_data():
+    encoded = encode_fingerprint([0xFFFFFFFF] * 10)
+    with pytest.raises(ValueError):
+        decode_fingerprint(encoded[:12])
+
+
+def test_pack_fingerprint_handles_signed_values():
+    blob = pack_fingerprint([1, -1, 2**31])
+    assert len(blob) == 12
+    assert unpack_fingerprint(blob).tolist() == [1, 0xFFFFFFFF, 2**31]
+
+
+def test_similarities_scores_many_candidates_at_once():
+    query = np.arange(100, dtype=np.uint32)
+    flipped = query ^ np.uint32(1)  # one bit in 32 differs
+    scores = similarities(query, [query, flipped, query[5:], query[:10]], [0, 0, 5, 0], min_overlap=64)
+    assert scores.tolist() == [1.0, 1 - 1 / 32, 1.0, 0.0]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import fingerprint
+import fingerprinter
+from database import get_db
+from fingerprint import pack_fingerprint
+from fingerprinter import pending_fingerprints, run_fingerprinting, verify_upgrade
+from routes.dupes import update_dupe_groups
+from tests.conftest import noisy_copy, track_meta, unresolved_groups, write_tracks
+
+
+def _meta(path, **overrides):
+    """A track scanned in lazy mode, not fingerprinted yet."""
+    return track_meta(path, fingerprint=None, **overrides)
+
+
+def _fake_fpcalc(prints):
+    calls = []
+
+    def run(path, timeout=30):
+        calls.append(str(path))
+        return prints.get(str(path), b"")
+    return run, calls
+
+
+def _audio(seed):
+    return np.random.default_rng(seed).integers(0, 2**32, size=400, dtype=np.uint64)
+
+
+def test_only_ambiguous_groups_are_fingerprinted(db_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    audio = _audio(1)
+    prints = {
+        "/music/a.mp3": pack_fingerprint(audio),
+        "/music/b.flac": pack_fingerprint(noisy_copy(audio, rng)),
+        "/music/c.mp3": pack_fingerprint(_audio(2)),
+        "/music/d.flac": pack_fingerprint(_audio(3)),
+    }
+    fake, calls = _fake_fpcalc(prints)
+    monkeypatch.setattr(fingerprint, "fpcalc", fake)
+    write_tracks(
+        # Durations a few percent apart: ambiguous until fingerprints settle it
+        _meta("/music/a.mp3", title="One", duration=200.0),
+        _meta("/music/b.flac", title="One", duration=215.0, format="flac"),
+        _meta("/music/c.mp3", title="Two", duration=200.0),
+        _meta("/music/d.flac", title="Two", duration=215.0, format="flac"),
+        # Matching durations: confident without fingerprints
+        _meta("/music/e.mp3", title="Three"),
+        _meta("/music/f.flac", title="Three", format="flac"),
+    )
+    summary = update_dupe_groups()
+    assert sorted(r["confidence"] for r in summary["results"]) == [0.85, 0.85, 0.95]
+    with get_db() as db:
+        assert [r["file_path"] for r in pending_fingerprints(db)] == [
+            "/music/a.mp3", "/music/b.flac", "/music/c.mp3", "/music/d.flac"
+        ]
+
+    run_fingerprinting()
+    assert sorted(calls) == ["/music/a.mp3", "/music/b.flac", "/music/c.mp3", "/music/d.flac"]
+    with get_db() as db:
+        confidences = dict(db.execute(
+            "SELECT t.title, g.confidence FROM dupe_groups g JOIN tracks t ON t.id = g.kept_track_id"
+        ).fetchall())
+        assert pending_fingerprints(db) == []
+    # Matching audio confirms the first group, different audio overrules the second
+    assert confidences["One"] > 0.9
+    assert confidences["Two"] == 0.3
+    assert confidences["Three"] == 0.95
+    assert len(unresolved_groups()) == 3
+
+    # Results are cached, failures included: nothing is fingerprinted twice
+    run_fingerprinting()
+    assert len(calls) == 4
+
+
+def test_missing_fpcalc_stores_nothing(db_path, monkeypatch):
+    def missing(path, timeout=30):
+        raise FileNotFoundError("fpcalc")
+
+    monkeypatch.setattr(fingerprint, "fpcalc", missing)
+    write_tracks(_meta("/music/a.mp3", duration=200.0), _meta("/music/b.flac", duration=215.0, format="flac"))
+    update_dupe_groups()
+    run_fingerprinting()
+    with get_db() as db:
+        # Still pending, so a later run with fpcalc installed picks them up
+        assert len(pending_fingerprints(db)) == 2
+
+
+def test_verify_upgrade_caches_the_original_and_rejects_other_audio(db_path, monkeypatch):
+    audio = _audio(1)
+    prints = {"/music/a.mp3": pack_fingerprint(audio), "/staging/good.flac": pack_fingerprint(audio),
+              "/staging/bad.flac": pack_fingerprint(_audio(2))}
+    fake, calls = _fake_fpcalc(prints)
+    monkeypatch.setattr(fingerprint, "fpcalc", fake)
+    monkeypatch.setattr(fingerprinter, "generate_fingerprint", lambda path: fake(path))
+    write_tracks(_meta("/music/a.mp3"))
+
+    assert verify_upgrade(1, "/staging/good.flac", 0.85) == prints["/staging/good.flac"]
+    with pytest.raises(ValueError):
+        verify_upgrade(1, "/staging/bad.flac", 0.85)
+    assert calls.count("/music/a.mp3") == 1
+    # Audio fpcalc can't read isn't held against the download
+    assert verify_upgrade(1, "/staging/unreadable.flac", 0.85) == b""
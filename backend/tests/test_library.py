@@ -0,0 +1,160 @@
+import os
+from pathlib import Path
+from database import get_db
+from library import TrackWriter, backfill_audio_hashes, load_existing, mark_stale, find_stale
+from tests.conftest import encode_fingerprint, track_meta
+
+
+def test_writer_inserts_in_chunks(db_path):
+    with get_db() as db:
+        writer = TrackWriter(db, {}, batch_size=2)
+        for i in range(5):
+            writer.write(track_meta(f"/music/{i}.mp3"))
+        # Two full chunks are committed before the final flush
+        with get_db() as other:
+            assert other.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] == 4
+        writer.flush()
+    assert writer.inserted == 5
+
+
+def test_writer_updates_known_paths(db_path):
+    with get_db() as db:
+        first = TrackWriter(db, {})
+        first.write(track_meta("/music/a.mp3"))
+        first.flush()
+        db.execute("UPDATE tracks SET status = 'deleted'")
+        db.commit()
+        writer = TrackWriter(db, load_existing(db))
+        writer.write(track_meta("/music/a.mp3", title="Retagged", mtime_ns=2))
+        writer.flush()
+        row = db.execute("SELECT title, mtime_ns, status FROM tracks").fetchone()
+    assert (row["title"], row["mtime_ns"], row["status"]) == ("Retagged", 2, "active")
+    assert writer.updated == 1 and writer.inserted == 0
+
+
+def test_writer_backfills_file_state(db_path):
+    with get_db() as db:
+        writer = TrackWriter(db, {})
+        writer.write(track_meta("/music/a.mp3", mtime_ns=None, inode=None))
+        writer.flush()
+        track_id = db.execute("SELECT id FROM tracks").fetchone()["id"]
+        writer.record_state(track_id, 5, 6)
+        writer.flush()
+        row = db.execute("SELECT mtime_ns, inode FROM tracks").fetchone()
+    assert (row["mtime_ns"], row["inode"]) == (5, 6)
+
+
+def _insert_paths(db, paths):
+    writer = TrackWriter(db, {})
+    for p in paths:
+        writer.write(track_meta(p))
+    writer.flush()
+
+
+def _statuses(db):
+    return {r["file_path"]: r["status"] for r in db.execute("SELECT file_path, status FROM tracks")}
+
+
+def test_mark_stale_is_scoped_to_root(db_path):
+    with get_db() as db:
+        _insert_paths(db, ["/music/a/1.mp3", "/music/a/2.mp3", "/music/ab/3.mp3", "/music/b/4.mp3"])
+        removed = mark_stale(db, Path("/music/a"), {"/music/a/1.mp3"})
+        statuses = _statuses(db)
+    assert removed == 1
+    assert statuses["/music/a/2.mp3"] == "deleted"
+    assert statuses["/music/ab/3.mp3"] == "active"
+    assert statuses["/music/b/4.mp3"] == "active"
+
+
+def test_mark_stale_refuses_empty_walk(db_path):
+    with get_db() as db:
+        _insert_paths(db, ["/music/a/1.mp3"])
+        assert mark_stale(db, Path("/music"), set()) == 0
+        assert _statuses(db)["/music/a/1.mp3"] == "active"
+
+
+def test_find_stale_walks_subtree(db_path, tmp_path):
+    (tmp_path / "album").mkdir()
+    kept = tmp_path / "album" / "kept.flac"
+    kept.write_bytes(b"x")
+    with get_db() as db:
+        _insert_paths(db, [str(kept), str(tmp_path / "album" / "gone.flac")])
+        assert find_stale(db, tmp_path / "album") == 1
+        assert _statuses(db)[str(kept)] == "active"
+
+
+def test_find_stale_keeps_tracks_under_unreadable_directories(db_path, tmp_path, monkeypatch):
+    import scanner
+
+    for name in ("ok", "flaky"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "song.flac").write_bytes(b"x")
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if path == str(tmp_path / "flaky"):
+            raise OSError(5, "Input/output error")
+        return real_scandir(path)
+
+    monkeypatch.setattr(scanner.os, "scandir", scandir)
+    with get_db() as db:
+        _insert_paths(db, [str(tmp_path / "ok" / "gone.flac"), str(tmp_path / "flaky" / "song.flac")])
+        assert find_stale(db, tmp_path) == 1
+        assert _statuses(db)[str(tmp_path / "flaky" / "song.flac")] == "active"
+
+
+def test_init_db_converts_text_fingerprints(db_path):
+    import database
+    from fingerprint import unpack_fingerprint
+
+    with get_db() as db:
+        _insert_paths(db, ["/music/a.mp3", "/music/b.mp3"])
+        db.execute(
+            "UPDATE tracks SET fingerprint = ? WHERE file_path = '/music/a.mp3'", (encode_fingerprint([1, 2, 3]),)
+        )
+        db.execute("UPDATE tracks SET fingerprint = 'garbage!' WHERE file_path = '/music/b.mp3'")
+    database.init_db()
+    with get_db() as db:
+        rows = {r["file_path"]: r["fingerprint"] for r in db.execute("SELECT file_path, fingerprint FROM tracks")}
+    assert unpack_fingerprint(rows["/music/a.mp3"]).tolist() == [1, 2, 3]
+    assert rows["/music/b.mp3"] is None
+
+
+def test_writer_stores_quality_score_and_init_db_backfills_it(db_path):
+    import database
+    from scanner import quality_score
+
+    flac = track_meta("/music/a.flac", format="flac", bit_depth=24, sample_rate=96000, bitrate=2800)
+    with get_db() as db:
+        writer = TrackWriter(db, {})
+        writer.write(flac)
+        writer.write(track_meta("/music/b.mp3"))
+        writer.flush()
+        db.execute("UPDATE tracks SET quality_score = NULL WHERE file_path = '/music/b.mp3'")
+    database.init_db()
+    with get_db() as db:
+        rows = db.execute("SELECT file_path FROM tracks ORDER BY quality_score DESC").fetchall()
+        scores = dict(db.execute("SELECT file_path, quality_score FROM tracks").fetchall())
+    assert [r["file_path"] for r in rows] == ["/music/a.flac", "/music/b.mp3"]
+    assert scores == {"/music/a.flac": quality_score(flac), "/music/b.mp3": quality_score(track_meta(""))}
+
+
+def test_backfill_audio_hashes_reads_each_unhashed_track_once(db_path, tmp_path):
+    fixture = Path(__file__).parent / "fixtures" / "test_16_44.flac"
+    copies = [tmp_path / f"{i}.flac" for i in range(3)]
+    for copy in copies:
+        copy.write_bytes(fixture.read_bytes())
+    corrupt = tmp_path / "corrupt.flac"
+    corrupt.write_bytes(b"fLaC" + b"\xff" * 100)
+    with get_db() as db:
+        _insert_paths(db, [str(c) for c in copies] + [str(corrupt), "/music/missing.flac"])
+        db.execute("UPDATE tracks SET audio_hash = CASE WHEN file_path = ? THEN 'done' END", (str(copies[0]),))
+
+        assert backfill_audio_hashes(db, workers=2) == 3
+        hashes = dict(db.execute("SELECT file_path, audio_hash FROM tracks"))
+        assert backfill_audio_hashes(db) == 0
+    assert hashes[str(copies[0])] == "done"
+    assert hashes[str(copies[1])] == hashes[str(copies[2])] != ""
+    # A file that won't decode is settled; one that couldn't be read is retried next time
+    assert hashes[str(corrupt)] == ""
+    assert hashes["/music/missing.flac"] is None
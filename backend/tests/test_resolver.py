@@ -0,0 +1,58 @@
+import os
+
+import resolver
+from database import get_db
+from resolver import resolve_groups
+from trash_ledger import trash_totals
+from tests.conftest import library_with_groups
+
+
+def test_resolve_groups_moves_in_chunks(tmp_path, db_path, monkeypatch):
+    monkeypatch.setattr(resolver, "RESOLVE_CHUNK", 3)
+    music, groups = library_with_groups(tmp_path, 7)
+    trash = tmp_path / "trash"
+    status = {"resolved": 0, "failed": 0, "moved": 0}
+
+    assert resolve_groups(groups, trash, music, workers=4, status=status) == 7
+    assert status == {"resolved": 7, "failed": 0, "moved": 7}
+    assert sorted(p.name for p in music.rglob("*.*")) == ["song.flac"] * 7
+    assert sorted(str(p.relative_to(trash)) for p in trash.rglob("*.mp3")) == [
+        f"artist{i}/song.mp3" for i in range(7)
+    ]
+    with get_db() as db:
+        assert db.execute("SELECT COUNT(*) FROM dupe_groups WHERE resolved = 1").fetchone()[0] == 7
+        statuses = {tuple(r) for r in db.execute("SELECT status, format, COUNT(*) FROM tracks GROUP BY 1, 2")}
+        assert db.execute("SELECT COUNT(*) FROM file_actions WHERE action = 'trash'").fetchone()[0] == 7
+        assert trash_totals(db) == {"files": 7, "bytes": 7 * len(b"audio")}
+    assert statuses == {("active", "flac", 7), ("trashed", "mp3", 7)}
+
+
+def test_failed_move_leaves_group_unresolved(tmp_path, db_path):
+    music, groups = library_with_groups(tmp_path, 3)
+    os.remove(music / "artist1" / "song.mp3")
+
+    assert resolve_groups(groups, tmp_path / "trash", music) == 2
+    with get_db() as db:
+        unresolved = [r["id"] for r in db.execute("SELECT id FROM dupe_groups WHERE resolved = 0")]
+        trashed = db.execute("SELECT COUNT(*) FROM tracks WHERE status = 'trashed'").fetchone()[0]
+    assert unresolved == [groups[1][0]]
+    assert trashed == 2
+
+
+def test_groups_that_disagree_on_the_keeper_stay_unresolved(tmp_path, db_path):
+    music, groups = library_with_groups(tmp_path, 1)
+    [(group_id, keep_id)] = groups
+    with get_db() as db:
+        other_id = db.execute("SELECT id FROM tracks WHERE id != ?", (keep_id,)).fetchone()[0]
+        second = db.execute(
+            "INSERT INTO dupe_groups (match_type, confidence, kept_track_id) VALUES ('fingerprint', 0.9, ?)",
+            (other_id,)
+        ).lastrowid
+        db.executemany("INSERT INTO dupe_group_members VALUES (?, ?)", [(second, keep_id), (second, other_id)])
+
+    status = {"resolved": 0, "failed": 0, "moved": 0}
+    assert resolve_groups([(group_id, keep_id), (second, other_id)], tmp_path / "trash", music, status=status) == 0
+    assert status == {"resolved": 0, "failed": 2, "moved": 0}
+    assert len(list(music.rglob("song.*"))) == 2
+    with get_db() as db:
+        assert db.execute("SELECT COUNT(*) FROM dupe_groups WHERE resolved = 0").fetchone()[0] == 2
@@ -1,6 +1,6 @@
 import pytest
 from pathlib import Path
-from scanner import read_track_metadata, scan_directory, quality_score
+from scanner import read_track_metadata, scan_directory, quality_score, walk_audio_files
 
 FIXTURES = Path(__file__).parent / "fixtures"
 
@@ -50,3 +50,51 @@ def test_quality_score_320_beats_128():
 def test_scan_directory_finds_all_files():
     results = list(scan_directory(FIXTURES))
     assert len(results) == 4  # 2 mp3 + 2 flac
+
+
+def test_scan_directory_skips_unchanged_files():
+    first = {m["file_path"]: m for m in scan_directory(FIXTURES)}
+    known = {p: (m["file_size"], m["mtime_ns"], m["inode"]) for p, m in first.items()}
+    results = list(scan_directory(FIXTURES, known))
+    assert len(results) == 4
+    assert all(r["unchanged"] for r in results)
+    assert all("title" not in r for r in results)
+
+
+def test_scan_directory_rereads_modified_files():
+    path = str(FIXTURES / "test_128.mp3")
+    meta = read_track_metadata(FIXTURES / "test_128.mp3")
+    known = {path: (meta["file_size"], meta["mtime_ns"] - 1, meta["inode"])}
+    results = {r["file_path"]: r for r in scan_directory(FIXTURES, known)}
+    assert not results[path].get("unchanged")
+    assert results[path]["title"] == "Test Song"
+
+
+def test_scan_directory_trusts_size_for_legacy_rows():
+    path = str(FIXTURES / "test_128.mp3")
+    size = (FIXTURES / "test_128.mp3").stat().st_size
+    results = {r["file_path"]: r for r in scan_directory(FIXTURES, {path: (size, None, None)})}
+    assert results[path]["unchanged"]
+
+
+def test_scan_directory_parallel_matches_serial():
+    serial = {m["file_path"]: m for m in scan_directory(FIXTURES)}
+    stats = {}
+    parallel = {m["file_path"]: m for m in scan_directory(FIXTURES, workers=2, chunk_size=1, stats=stats)}
+    assert parallel == serial
+    assert sum(w["files"] for w in stats.values()) == 4
+
+
+def test_walk_audio_files_recurses_and_filters(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "one.flac").write_bytes(b"x")
+    (tmp_path / "a" / "b" / "two.MP3").write_bytes(b"x")
+    (tmp_path / "a" / "cover.jpg").write_bytes(b"x")
+    paths = [e.path for e in walk_audio_files(tmp_path)]
+    assert paths == [str(tmp_path / "a" / "one.flac"), str(tmp_path / "a" / "b" / "two.MP3")]
+
+
+def test_scan_directory_records_seen_paths():
+    seen = set()
+    results = list(scan_directory(FIXTURES, seen=seen))
+    assert seen == {r["file_path"] for r in results}
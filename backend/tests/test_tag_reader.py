@@ -0,0 +1,150 @@
+import shutil
+import struct
+from pathlib import Path
+
+import pytest
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import APIC, COMM, ID3, TALB, TIT2, TPE1, TPE2, TPOS, TRCK
+
+import scanner
+import tag_reader
+from scanner import read_track_metadata
+
+FIXTURES = Path(__file__).parent / "fixtures"
+COVER = b"\xff\xd8" + bytes(range(256)) * 8192  # ~2 MB of fake JPEG
+
+
+def _mutagen_metadata(monkeypatch, path):
+    with monkeypatch.context() as m:
+        m.setattr(scanner, "read_tags", lambda *args: None)
+        return read_track_metadata(path)
+
+
+def _tagged_mp3(tmp_path, version, encoding=3, **frames):
+    path = tmp_path / f"v2{version}_{encoding}.mp3"
+    shutil.copy(FIXTURES / "test_320.mp3", path)
+    tags = ID3()
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="cover", data=COVER))
+    tags.add(COMM(encoding=3, lang="eng", desc="", text="x" * 300))
+    for frame in (TPE1, TPE2, TALB, TIT2, TRCK, TPOS):
+        if frame.__name__ in frames:
+            tags.add(frame(encoding=encoding, text=frames[frame.__name__]))
+    tags.save(path, v2_version=version)
+    return path
+
+
+def _tagged_flac(tmp_path, **comments):
+    path = tmp_path / "cover.flac"
+    shutil.copy(FIXTURES / "test_24_96.flac", path)
+    audio = FLAC(path)
+    picture = Picture()
+    picture.type = 3
+    picture.mime = "image/jpeg"
+    picture.data = COVER
+    audio.add_picture(picture)
+    for key, value in comments.items():
+        audio[key] = value
+    audio.save()
+    return path
+
+
+@pytest.mark.parametrize("name", ["test_128.mp3", "test_320.mp3", "test_16_44.flac", "test_24_96.flac"])
+def test_fast_path_matches_mutagen_on_fixtures(monkeypatch, name):
+    path = FIXTURES / name
+    assert tag_reader.read_tags(path, path.stat().st_size) is not None
+    assert read_track_metadata(path) == _mutagen_metadata(monkeypatch, path)
+
+
+@pytest.mark.parametrize("version", [3, 4])
+@pytest.mark.parametrize("encoding", [0, 1, 2, 3])
+def test_fast_path_matches_mutagen_on_tagged_mp3(tmp_path, monkeypatch, version, encoding):
+    if encoding == 2 and version == 3:
+        pytest.skip("UTF-16BE is a v2.4 encoding")
+    path = _tagged_mp3(
+        tmp_path, version, encoding,
+        TPE1=["Artist", "Featured"], TALB="Album", TIT2="Titlé", TRCK="3/12", TPOS="2/2",
+    )
+    assert tag_reader.read_tags(path, path.stat().st_size) is not None
+    meta = read_track_metadata(path)
+    assert meta == _mutagen_metadata(monkeypatch, path)
+    # v2.3 has no multi-value frames; mutagen joins them with "/" on save
+    assert meta["artist"] == ("Artist\u0000Featured" if version == 4 else "Artist/Featured")
+    assert meta["album_artist"] == meta["artist"]
+    assert (meta["track_number"], meta["disc_number"]) == (3, 2)
+
+
+def test_fast_path_matches_mutagen_on_tagged_flac(tmp_path, monkeypatch):
+    path = _tagged_flac(tmp_path, ALBUMARTIST=["Various", "Others"], discnumber="1/2")
+    assert tag_reader.read_tags(path, path.stat().st_size) is not None
+    meta = read_track_metadata(path)
+    assert meta == _mutagen_metadata(monkeypatch, path)
+    assert meta["album_artist"] == "Various"
+    assert meta["disc_number"] == 1
+
+
+@pytest.mark.parametrize("make", [_tagged_flac, lambda tmp_path: _tagged_mp3(tmp_path, 4, TIT2="Song")])
+def test_fast_path_skips_cover_art(tmp_path, monkeypatch, make):
+    path = make(tmp_path)
+    read = []
+
+    class CountingFile:
+        def __init__(self, *args):
+            self._f = open(*args)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self._f.close()
+
+        def read(self, size=-1):
+            data = self._f.read(size)
+            read.append(len(data))
+            return data
+
+        def __getattr__(self, name):
+            return getattr(self._f, name)
+
+    monkeypatch.setattr(tag_reader, "open", CountingFile, raising=False)
+    assert tag_reader.read_tags(path, path.stat().st_size) is not None
+    assert sum(read) < 64 * 1024 < len(COVER)
+
+
+def test_fast_path_declines_id3v1_trailer(tmp_path, monkeypatch):
+    path = _tagged_mp3(tmp_path, 4, TIT2="Song")
+    with open(path, "ab") as f:
+        f.write(b"TAG" + b"V1 Title".ljust(30, b"\x00") + b"V1 Artist".ljust(30, b"\x00") + bytes(65))
+    assert tag_reader.read_tags(path, path.stat().st_size) is None
+    meta = read_track_metadata(path)
+    assert meta["artist"] == "V1 Artist"
+    assert meta == _mutagen_metadata(monkeypatch, path)
+
+
+def test_fast_path_declines_prepended_id3_on_flac(tmp_path, monkeypatch):
+    path = tmp_path / "id3.flac"
+    path.write_bytes(b"ID3\x04\x00\x00\x00\x00\x00\x00" + (FIXTURES / "test_16_44.flac").read_bytes())
+    assert tag_reader.read_tags(path, path.stat().st_size) is None
+    assert read_track_metadata(path)["bit_depth"] == 16
+
+
+def test_mp3_audio_hash_ignores_tags(tmp_path):
+    plain = tmp_path / "plain.mp3"
+    shutil.copy(FIXTURES / "test_320.mp3", plain)
+    tagged = _tagged_mp3(tmp_path, 4, TIT2="Song", TPE1="Artist")
+    with open(tagged, "ab") as f:
+        ape_items = b"\x05\x00\x00\x00\x00\x00\x00\x00Title\x00Other"
+        footer = b"APETAGEX" + struct.pack("<IIII", 2000, len(ape_items) + 32, 1, 0) + bytes(8)
+        f.write(ape_items + footer)
+        f.write(b"TAG" + b"V1 Title".ljust(125, b"\x00"))
+
+    def audio_hash(path):
+        return read_track_metadata(path)["audio_hash"]
+
+    assert audio_hash(plain) and audio_hash(plain) == audio_hash(tagged)
+    assert audio_hash(FIXTURES / "test_128.mp3") != audio_hash(plain)
+
+
+def test_flac_audio_hash_is_the_streaminfo_md5():
+    path = FIXTURES / "test_16_44.flac"
+    assert read_track_metadata(path)["audio_hash"] == f"{FLAC(path).info.md5_signature:032x}"
+    assert tag_reader.flac_audio_hash(0) == ""
@@ -0,0 +1,85 @@
+import gc
+import random
+import tracemalloc
+
+from database import get_db
+from dedup import compute_confidence, compute_confidences, group_by_metadata, group_rows_by_metadata
+from scanner import quality_score, quality_scores
+from track_store import FETCH_SIZE, TrackStore
+from tests.conftest import track_meta, write_tracks
+
+RANK_COLUMNS = "id, format, bitrate, bit_depth, sample_rate, duration, artist, title, album"
+
+
+def _library(count, seed=5):
+    rng = random.Random(seed)
+    artists = [f"Artist {i}" for i in range(count // 20 + 1)]
+    metas = []
+    for i in range(count):
+        lossless = rng.random() < 0.3
+        metas.append(track_meta(
+            f"/music/{i}.{'flac' if lossless else 'mp3'}",
+            format="FLAC" if lossless else "mp3",
+            bitrate=rng.choice([128, 256, 320, 1411]),
+            bit_depth=rng.choice([16, 24]) if lossless else 0,
+            sample_rate=rng.choice([44100, 48000, 96000]),
+            duration=rng.choice([0, None, rng.uniform(100, 400)]),
+            artist=rng.choice(artists),
+            title=f"Song {rng.randrange(count // 3)}",
+            album=rng.choice(["Album", "The Album!", "Other"]),
+        ))
+    return metas
+
+
+def test_store_matches_rows(db_path):
+    write_tracks(*_library(FETCH_SIZE + 10))
+    with get_db() as db:
+        rows = [dict(r) for r in db.execute(f"SELECT {RANK_COLUMNS} FROM tracks ORDER BY id")]
+        store = TrackStore.from_cursor(db.execute(f"SELECT {RANK_COLUMNS} FROM tracks ORDER BY id"))
+
+    assert len(store) == len(rows)
+    expected = [{k: (v or 0) if k in ("bitrate", "duration") else v for k, v in r.items()} for r in rows[:5]]
+    assert store.records(range(5)) == expected
+    assert store.rows_of([rows[7]["id"], rows[2]["id"]]).tolist() == [7, 2]
+    # Artist strings repeat across the library and are stored once
+    assert len(store.pool) < len(rows)
+
+
+def test_vectorized_scoring_matches_per_track(db_path):
+    write_tracks(*_library(500))
+    with get_db() as db:
+        rows = [dict(r) for r in db.execute(f"SELECT {RANK_COLUMNS} FROM tracks ORDER BY id")]
+        store = TrackStore.from_cursor(db.execute(f"SELECT {RANK_COLUMNS} FROM tracks ORDER BY id"))
+    for row in rows:
+        row["duration"] = row["duration"] or 0
+
+    assert quality_scores(store).tolist() == [quality_score(r) for r in rows]
+
+    groups = group_rows_by_metadata(store)
+    expected = group_by_metadata(rows)
+    assert sorted(sorted(rows[n]["id"] for n in g) for g in groups) == sorted(
+        sorted(t["id"] for t in members) for members in expected
+    )
+    assert compute_confidences(store, groups).tolist() == [
+        compute_confidence([rows[n] for n in g]) for g in groups
+    ]
+
+
+def test_store_is_an_order_of_magnitude_smaller_than_dicts(db_path):
+    write_tracks(*_library(5000))
+    # The columns analysis loads; unique file paths cost the same either way
+    query = f"SELECT {RANK_COLUMNS}, norm_artist, norm_title, norm_album FROM tracks"
+
+    def retained(load):
+        tracemalloc.start()
+        with get_db() as db:
+            loaded = load(db)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del loaded
+        return size
+
+    dict_bytes = retained(lambda db: [dict(r) for r in db.execute(query)])
+    store_bytes = retained(lambda db: TrackStore.from_cursor(db.execute(query)))
+    assert store_bytes * 10 < dict_bytes
@@ -0,0 +1,103 @@
+import os
+import time
+
+import trash_ledger
+import trash_purge
+from database import get_db
+from resolver import resolve_groups
+from trash_ledger import reconcile_trash, record_trashed, trash_totals
+from trash_purge import purge_trash
+from tests.conftest import library_with_groups
+
+
+def _statuses():
+    with get_db() as db:
+        rows = db.execute("SELECT status, COUNT(*) AS n FROM tracks GROUP BY status").fetchall()
+    return {r["status"]: r["n"] for r in rows}
+
+
+def test_purge_deletes_old_files_in_slices_then_everything(tmp_path, db_path, monkeypatch):
+    monkeypatch.setattr(trash_purge, "PURGE_CHUNK", 2)
+    music, groups = library_with_groups(tmp_path, 5)
+    trash = tmp_path / "trash"
+    resolve_groups(groups, trash, music)
+    with get_db() as db:
+        db.execute(
+            "UPDATE trash_items SET trashed_at = ? WHERE path IN (SELECT path FROM trash_items ORDER BY path LIMIT 3)",
+            (time.time() - 40 * 86400,)
+        )
+    status = {"total": 0, "deleted": 0, "failed": 0, "bytes": 0}
+
+    # Only the old files go, capped by the limit, and only the directories that emptied are removed
+    assert purge_trash(trash, older_than_days=30, limit=2, workers=4, status=status) == 2
+    assert status == {"total": 2, "deleted": 2, "failed": 0, "bytes": 10, "phase": "cleaning"}
+    assert sorted(p.name for p in trash.iterdir()) == ["artist2", "artist3", "artist4"]
+    assert _statuses() == {"active": 5, "deleted": 2, "trashed": 3}
+    # Age-based purges leave files the app didn't trash, however old they look
+    (trash / "stray").mkdir()
+    (trash / "stray" / "x.mp3").write_bytes(b"x")
+    with get_db() as db:
+        record_trashed(db, trash, [(str(trash / "stray" / "x.mp3"), 1)], trashed_at=0)
+    assert purge_trash(trash, older_than_days=30) == 1
+    assert (trash / "stray" / "x.mp3").exists()
+
+    # Emptying also picks up files the ledger never saw
+    (trash / "more").mkdir()
+    (trash / "more" / "y.mp3").write_bytes(b"y")
+    assert purge_trash(trash) == 4
+    assert list(trash.iterdir()) == []
+    assert _statuses() == {"active": 5, "deleted": 5}
+    with get_db() as db:
+        assert trash_totals(db) == {"files": 0, "bytes": 0}
+
+
+def test_reconcile_dates_files_the_app_trashed_by_their_action(tmp_path, db_path):
+    music, groups = library_with_groups(tmp_path, 1)
+    trash = tmp_path / "trash"
+    resolve_groups(groups, trash, music)
+    with get_db() as db:
+        db.execute("UPDATE file_actions SET performed_at = '2020-01-01 00:00:00'")
+        db.execute("DELETE FROM trash_items")
+        assert reconcile_trash(db, trash)["added"] == 1
+        assert db.execute("SELECT trashed_at FROM trash_items").fetchone()[0] == 1577836800
+
+
+def test_reconcile_keeps_entries_under_a_directory_it_could_not_scan(tmp_path, db_path, monkeypatch):
+    music, groups = library_with_groups(tmp_path, 2)
+    trash = tmp_path / "trash"
+    resolve_groups(groups, trash, music)
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if path == str(trash / "artist0"):
+            raise PermissionError(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    with get_db() as db:
+        assert reconcile_trash(db, trash) == {"added": 0, "removed": 0, "resized": 0, "unscanned": 1}
+        assert trash_totals(db)["files"] == 2
+
+    # A full purge deletes what it can see but doesn't write off the tracks it couldn't
+    monkeypatch.setattr(trash_purge, "_unlink", lambda path: "artist0" not in path)
+    assert purge_trash(trash) == 1
+    assert _statuses() == {"active": 2, "deleted": 1, "trashed": 1}
+
+
+def test_reconcile_tolerates_a_file_trashed_while_it_runs(tmp_path, db_path, monkeypatch):
+    trash = tmp_path / "trash"
+    trash.mkdir()
+    (trash / "new.mp3").write_bytes(b"new")
+    trashed_at = trash_ledger._trashed_at
+
+    def resolve_meanwhile(db, paths):
+        with get_db() as other:
+            record_trashed(other, trash, [(str(trash / "new.mp3"), 3)], trashed_at=5)
+        return trashed_at(db, paths)
+
+    monkeypatch.setattr(trash_ledger, "_trashed_at", resolve_meanwhile)
+    with get_db() as db:
+        assert reconcile_trash(db, trash)["added"] == 1
+        assert [tuple(r) for r in db.execute("SELECT path, trashed_at FROM trash_items")] == [
+            (str(trash / "new.mp3"), 5)
+        ]
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+import trash_restore
+from database import get_db
+from resolver import resolve_groups
+from trash_ledger import trash_totals
+from trash_restore import restore_actions, restore_candidates
+from tests.conftest import library_with_groups
+
+
+def _candidates(**filters):
+    with get_db() as db:
+        return restore_candidates(db, **filters)
+
+
+def test_bulk_restore_by_group_folder_and_time(tmp_path, db_path, monkeypatch):
+    monkeypatch.setattr(trash_restore, "RESTORE_CHUNK", 2)
+    music, groups = library_with_groups(tmp_path, 5)
+    trash = tmp_path / "trash"
+    resolve_groups(groups, trash, music)
+
+    [one] = _candidates(group_id=groups[0][0])
+    assert one["dest_path"] == str(trash / "artist0" / "song.mp3")
+    assert [a["source_path"] for a in _candidates(folder="artist3")] == [str(music / "artist3" / "song.mp3")]
+    assert _candidates(until=datetime.now(timezone.utc) - timedelta(hours=1)) == []
+
+    # The file at artist4's original path came back some other way, so it stays in the trash
+    (music / "artist4" / "song.mp3").write_bytes(b"new")
+    status = {"restored": 0, "failed": 0}
+    actions = _candidates(since=datetime.now(timezone.utc) - timedelta(hours=1))
+    assert restore_actions(actions, workers=4, status=status) == 4
+    assert status == {"restored": 4, "failed": 1}
+    assert sorted(p.name for p in music.rglob("song.mp3")) == ["song.mp3"] * 5
+    assert [p.name for p in trash.rglob("*.mp3")] == ["song.mp3"]
+    with get_db() as db:
+        assert db.execute("SELECT COUNT(*) FROM tracks WHERE status = 'trashed'").fetchone()[0] == 1
+        assert db.execute("SELECT COUNT(*) FROM file_actions").fetchone()[0] == 1
+        assert trash_totals(db) == {"files": 1, "bytes": 5}
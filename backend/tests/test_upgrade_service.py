@@ -1,4 +1,9 @@
 import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fingerprint import pack_fingerprint
+from routes import upgrades
+from tests.conftest import track_meta, write_tracks
 from upgrade_service import (
     build_search_query, classify_match,
     _extract_artist_name, _parse_album_result, _parse_track_result,
@@ -92,3 +97,16 @@ def test_parse_track_result_with_artist_dict():
     }
     parsed = _parse_track_result(raw)
     assert parsed["artist"] == "Solo Artist"
+
+
+def test_candidates_endpoint_returns_fingerprinted_tracks(db_path, monkeypatch):
+    monkeypatch.setenv("MUSIC_PATH", "/music")
+    write_tracks(track_meta("/music/a.mp3", fingerprint=pack_fingerprint([0xFFFFFFFF] * 200)))
+    app = FastAPI()
+    app.include_router(upgrades.router)
+
+    response = TestClient(app).get("/api/upgrades/candidates")
+    assert response.status_code == 200
+    [track] = response.json()
+    assert track["file_path"] == "/music/a.mp3"
+    assert "fingerprint" not in track
@@ -0,0 +1,56 @@
+import shutil
+from pathlib import Path
+from watchfiles import Change
+from database import get_db
+from routes.scan import index_paths
+from watcher import split_changes, resolve_mode
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_split_changes_expands_added_directories(tmp_path):
+    album = tmp_path / "album"
+    album.mkdir()
+    (album / "01.flac").write_bytes(b"x")
+    (album / "cover.jpg").write_bytes(b"x")
+    changed, removed = split_changes({(Change.added, str(album))})
+    assert changed == {str(album / "01.flac")}
+    assert removed == set()
+
+
+def test_split_changes_treats_recreated_files_as_changed(tmp_path):
+    song = tmp_path / "song.mp3"
+    song.write_bytes(b"x")
+    gone = str(tmp_path / "gone.mp3")
+    changed, removed = split_changes({(Change.deleted, str(song)), (Change.deleted, gone)})
+    assert changed == {str(song)}
+    assert removed == {gone}
+
+
+def test_resolve_mode_off_for_unknown_values(tmp_path):
+    assert resolve_mode("off", tmp_path) == "off"
+    assert resolve_mode("bogus", tmp_path) == "off"
+    assert resolve_mode("poll", tmp_path) == "poll"
+
+
+def test_index_paths_adds_and_removes_tracks(db_path, tmp_path):
+    song = tmp_path / "song.mp3"
+    shutil.copy(FIXTURES / "test_128.mp3", song)
+    assert index_paths({str(song)}, set())["inserted"] == 1
+    # An unchanged file is not re-read
+    assert index_paths({str(song)}, set()) == {"inserted": 0, "updated": 0, "removed": 0}
+
+    song.unlink()
+    assert index_paths(set(), {str(song)})["removed"] == 1
+    with get_db() as db:
+        assert db.execute("SELECT status FROM tracks").fetchone()["status"] == "deleted"
+
+
+def test_index_paths_removes_whole_directories(db_path, tmp_path):
+    album = tmp_path / "album"
+    album.mkdir()
+    shutil.copy(FIXTURES / "test_128.mp3", album / "01.mp3")
+    shutil.copy(FIXTURES / "test_320.mp3", album / "02.mp3")
+    index_paths({str(album / "01.mp3"), str(album / "02.mp3")}, set())
+    shutil.rmtree(album)
+    assert index_paths(set(), {str(album)})["removed"] == 2
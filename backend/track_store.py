@@ -0,0 +1,156 @@
+"""Compact columnar storage for track rows.
+
+A sqlite3.Row turned into a dict costs well over a kilobyte per track. A
+TrackStore keeps each numeric column as one NumPy array and each text column
+as int32 codes into a shared StringPool, so a whole library fits in a few tens
+of megabytes, artist and album strings are stored once, and grouping and
+scoring can run as array operations.
+"""
+from array import array
+from itertools import accumulate
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+
+# NumPy dtype per numeric tracks column; any other column is stored as text codes
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "file_size": np.int64,
+    "bitrate": np.int32,
+    "bit_depth": np.int16,
+    "sample_rate": np.int32,
+    "duration": np.float64,
+    "track_number": np.int32,
+    "disc_number": np.int32,
+    "mtime_ns": np.int64,
+    "inode": np.int64,
+    "quality_score": np.int32,
+}
+FETCH_SIZE = 10000  # rows converted per fetchmany batch
+
+
+class StringPool:
+    """Interned text values addressed by int32 code. Code 0 is the empty string, which NULL maps to.
+
+    While loading, values are kept in a dict. freeze() then packs them into one
+    UTF-8 buffer with an offsets array, a few bytes of overhead per value
+    instead of a Python str object each.
+    """
+
+    def __init__(self):
+        self._codes: Optional[dict[str, int]] = {"": 0}
+        self._buffer = b""
+        self._offsets = array("q", [0, 0])
+
+    def __len__(self) -> int:
+        return len(self._codes) if self._codes is not None else len(self._offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        return self._buffer[self._offsets[code]:self._offsets[code + 1]].decode("utf-8", "surrogatepass")
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        codes = self._codes
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def freeze(self):
+        """Pack the interned values; no new values can be added afterwards."""
+        encoded = [value.encode("utf-8", "surrogatepass") for value in self._codes]
+        self._offsets = array("q", [0])
+        self._offsets.extend(accumulate(len(e) for e in encoded))
+        self._buffer = b"".join(encoded)
+        self._codes = None
+
+
+class TrackStore:
+    """Track columns as parallel arrays, one row per track."""
+
+    def __init__(self, columns: dict[str, np.ndarray], pool: StringPool):
+        self.columns = columns
+        self.pool = pool
+        self._id_order = None
+
+    @classmethod
+    def from_cursor(cls, cursor) -> "TrackStore":
+        """Load every remaining row of a cursor, FETCH_SIZE rows at a time."""
+        names = [d[0] for d in cursor.description]
+        pool = StringPool()
+        chunks: dict[str, list[np.ndarray]] = {name: [] for name in names}
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for n, name in enumerate(names):
+                chunks[name].append(_column(name, [row[n] for row in rows], pool))
+        columns = {
+            name: np.concatenate(parts) if parts else _column(name, [], pool)
+            for name, parts in chunks.items()
+        }
+        pool.freeze()
+        return cls(columns, pool)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], names: Sequence[str]) -> "TrackStore":
+        """Build a store from dicts, keeping only the given columns."""
+        pool = StringPool()
+        records = list(records)
+        columns = {name: _column(name, [r.get(name) for r in records], pool) for name in names}
+        pool.freeze()
+        return cls(columns, pool)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def column(self, name: str) -> np.ndarray:
+        """A numeric column, or a text column's codes."""
+        return self.columns[name]
+
+    def text(self, name: str, row: int) -> str:
+        return self.pool[self.columns[name][row]]
+
+    def map_text(self, name: str, fn: Callable[[str], object], dtype=object) -> np.ndarray:
+        """Apply fn once per distinct value of a text column and spread the results over its rows."""
+        codes, inverse = np.unique(self.columns[name], return_inverse=True)
+        pool = self.pool
+        mapped = np.array([fn(pool[c]) for c in codes.tolist()], dtype=dtype)
+        return mapped[inverse]
+
+    def records(self, rows: Iterable[int]) -> list[dict]:
+        """Plain dicts for a few rows, for code that still works track by track."""
+        pool = self.pool
+        out = []
+        for row in rows:
+            record = {}
+            for name, column in self.columns.items():
+                value = column[row].item()
+                record[name] = value if name in NUMERIC_COLUMNS else pool[value]
+            out.append(record)
+        return out
+
+    def rows_of(self, ids: Sequence[int]) -> np.ndarray:
+        """Row indexes of the given track ids."""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.columns["id"], kind="stable")
+        id_column = self.columns["id"]
+        positions = np.searchsorted(id_column, ids, sorter=self._id_order)
+        return self._id_order[positions]
+
+    def nbytes(self) -> int:
+        """Column array memory, not counting the string pool."""
+        return sum(column.nbytes for column in self.columns.values())
+
+
+def _column(name: str, values: list, pool: StringPool) -> np.ndarray:
+    dtype = NUMERIC_COLUMNS.get(name)
+    if dtype is None:
+        code = pool.code
+        return np.fromiter((code(v) for v in values), dtype=np.int32, count=len(values))
+    # NULL numbers read as 0, as quality_score and compute_confidence treat missing values
+    return np.array([v or 0 for v in values], dtype=dtype)
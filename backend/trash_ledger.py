@@ -0,0 +1,162 @@
+"""Running account of the files in the trash.
+
+Walking and stat-ing the whole trash tree to size it takes seconds on a large
+or network-mounted trash. Instead every move into or out of the trash records
+the file in the trash_items table, whose triggers keep a single totals row
+(see database.TRASH_LEDGER_SQL). reconcile_trash() brings the ledger back in
+line with the disk after anything outside the app touches the trash.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Iterable
+
+SQL_CHUNK = 500
+
+# (upper bound on age in seconds, label) for the age breakdown, youngest first
+AGE_BUCKETS = (
+    (86400, "day"),
+    (7 * 86400, "week"),
+    (30 * 86400, "month"),
+    (None, "older"),
+)
+
+
+def trash_folder(path: str, trash_dir: Path) -> str:
+    """The top-level folder under the trash a file sits in ("" for files at the top)."""
+    try:
+        parts = Path(path).relative_to(trash_dir).parts
+    except ValueError:
+        return ""
+    return parts[0] if len(parts) > 1 else ""
+
+
+def record_trashed(db, trash_dir: Path, files: Iterable[tuple[str, int]], trashed_at: float = None):
+    """Add (trash path, size) pairs to the ledger."""
+    trashed_at = time.time() if trashed_at is None else trashed_at
+    db.executemany("""
+        INSERT INTO trash_items (path, size, folder, trashed_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET size = excluded.size, folder = excluded.folder,
+            trashed_at = excluded.trashed_at
+    """, [(str(path), size, trash_folder(path, trash_dir), trashed_at) for path, size in files])
+
+
+def record_removed(db, paths: Iterable[str]):
+    """Drop files that left the trash (restored or deleted) from the ledger."""
+    db.executemany("DELETE FROM trash_items WHERE path = ?", [(str(p),) for p in paths])
+
+
+def trash_totals(db) -> dict:
+    row = db.execute("SELECT files, bytes FROM trash_totals WHERE id = 1").fetchone()
+    return {"files": row["files"], "bytes": row["bytes"]} if row else {"files": 0, "bytes": 0}
+
+
+def trash_breakdown(db, by: str = "folder") -> list[dict]:
+    """Files and bytes per top-level trash folder, or per age bucket (see AGE_BUCKETS)."""
+    if by == "folder":
+        rows = db.execute("""
+            SELECT folder AS name, COUNT(*) AS files, SUM(size) AS bytes FROM trash_items
+            GROUP BY folder ORDER BY bytes DESC
+        """)
+        return [dict(r) for r in rows]
+    if by != "age":
+        raise ValueError(f"Unknown trash breakdown: {by}")
+
+    now = time.time()
+    cases = " ".join(
+        f"WHEN trashed_at >= {now - seconds} THEN {n}" for n, (seconds, _) in enumerate(AGE_BUCKETS) if seconds
+    )
+    rows = db.execute(f"""
+        SELECT CASE {cases} ELSE {len(AGE_BUCKETS) - 1} END AS bucket,
+            COUNT(*) AS files, SUM(size) AS bytes
+        FROM trash_items GROUP BY bucket
+    """)
+    counts = {r["bucket"]: r for r in rows}
+    return [
+        {"name": label, "files": counts[n]["files"] if n in counts else 0,
+         "bytes": counts[n]["bytes"] if n in counts else 0}
+        for n, (_, label) in enumerate(AGE_BUCKETS)
+    ]
+
+
+def scan_trash(trash_dir: Path, errors: list = None) -> dict[str, tuple[int, float]]:
+    """Map every file under the trash to (size, ctime) in one os.scandir pass.
+
+    A move into the trash updates a file's ctime, so it stands in for the
+    time a file the ledger never saw was trashed. Temporary copies of moves
+    still in progress (or abandoned) aren't trash. Directories and entries
+    that raise OSError are skipped and, if ``errors`` is given, appended to it.
+    """
+    from file_manager import is_partial_copy
+
+    files = {}
+    stack = [str(trash_dir)]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and not is_partial_copy(entry.name):
+                            stat = entry.stat(follow_symlinks=False)
+                            files[entry.path] = (stat.st_size, stat.st_ctime)
+                    except OSError:
+                        if errors is not None:
+                            errors.append(entry.path)
+        except OSError:
+            if errors is not None:
+                errors.append(path)
+    return files
+
+
+def _trashed_at(db, paths: list[str]) -> dict[str, float]:
+    """When the app moved each of paths into the trash, for those it has a file_actions row for."""
+    marks = ",".join("?" * len(paths))
+    rows = db.execute(f"""
+        SELECT dest_path, CAST(strftime('%s', MAX(performed_at)) AS REAL) AS trashed_at FROM file_actions
+        WHERE action = 'trash' AND dest_path IN ({marks}) GROUP BY dest_path
+    """, paths)
+    return {r["dest_path"]: r["trashed_at"] for r in rows}
+
+
+def reconcile_trash(db, trash_dir: Path) -> dict:
+    """Make the ledger match the files actually in the trash.
+
+    Files found on disk but not in the ledger are added, entries whose file
+    is gone are dropped and changed sizes are corrected. An added file the
+    app trashed is dated by its file_actions row; any other by its ctime.
+    Entries at or under a path that couldn't be scanned are kept as they are.
+    Returns the counts, including how many paths couldn't be scanned.
+    """
+    trash_dir = Path(trash_dir)
+    # Read the ledger before the disk, so an entry recorded during the scan
+    # isn't mistaken for a file that has gone
+    recorded = {r["path"]: r["size"] for r in db.execute("SELECT path, size FROM trash_items")}
+    errors = []
+    on_disk = scan_trash(trash_dir, errors) if trash_dir.is_dir() else {}
+
+    unscanned = set(errors)
+    under_unscanned = tuple(path + os.sep for path in errors)
+    missing = [
+        path for path in recorded
+        if path not in on_disk and path not in unscanned and not path.startswith(under_unscanned)
+    ]
+    added = [(path, on_disk[path]) for path in on_disk if path not in recorded]
+    resized = [(on_disk[path][0], path) for path in on_disk if path in recorded and recorded[path] != on_disk[path][0]]
+
+    for i in range(0, len(missing), SQL_CHUNK):
+        record_removed(db, missing[i:i + SQL_CHUNK])
+    for i in range(0, len(added), SQL_CHUNK):
+        chunk = added[i:i + SQL_CHUNK]
+        trashed = _trashed_at(db, [path for path, _ in chunk])
+        db.executemany(
+            # A move that recorded the file since the ledger was read knows better
+            "INSERT INTO trash_items (path, size, folder, trashed_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(path) DO NOTHING",
+            [(path, size, trash_folder(path, trash_dir), trashed.get(path, ctime)) for path, (size, ctime) in chunk]
+        )
+    db.executemany("UPDATE trash_items SET size = ? WHERE path = ?", resized)
+    db.commit()
+    return {"added": len(added), "removed": len(missing), "resized": len(resized), "unscanned": len(errors)}
@@ -0,0 +1,112 @@
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from database import get_db
+from file_manager import remove_empty_dirs, sweep_partial_copies
+from trash_ledger import reconcile_trash, record_removed
+
+logger = logging.getLogger(__name__)
+
+PURGE_WORKERS = 8   # concurrent unlinks
+PURGE_CHUNK = 500   # files deleted and committed together
+
+purge_status = {"running": False, "phase": "idle", "total": 0, "deleted": 0, "failed": 0, "bytes": 0}
+
+# One purge at a time, so two never race over the same files
+_purge_lock = threading.Lock()
+
+
+def purge_trash(
+    trash_dir: Path, older_than_days: float = None, limit: int = None,
+    workers: int = PURGE_WORKERS, status: dict = None,
+) -> int:
+    """Permanently delete trashed files, oldest first.
+
+    With ``older_than_days`` only files the app trashed (those with a
+    file_actions row) before that age go, and ``limit`` caps how many one call
+    deletes, so a retention policy can run in small slices. Without an age
+    everything goes, including files the ledger didn't know about and
+    abandoned partial copies. Files are unlinked on a bounded thread pool
+    PURGE_CHUNK at a time; each chunk's ledger entries and track statuses are
+    committed together. Emptied directories are then removed bottom-up.
+    Returns the number of files deleted.
+    """
+    trash_dir = Path(trash_dir)
+    cutoff = math.inf if older_than_days is None else time.time() - older_than_days * 86400
+    deleted_count = 0
+    touched: set[Path] = set()
+    with _purge_lock, get_db() as db, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        unscanned = 0
+        if older_than_days is None:
+            sweep_partial_copies(trash_dir)
+            unscanned = reconcile_trash(db, trash_dir)["unscanned"]
+        app_trashed = "" if older_than_days is None else (
+            " AND path IN (SELECT dest_path FROM file_actions WHERE action = 'trash')"
+        )
+        rows = db.execute(
+            f"SELECT path, size FROM trash_items WHERE trashed_at < ?{app_trashed} ORDER BY trashed_at, path LIMIT ?",
+            (cutoff, -1 if limit is None else limit)
+        ).fetchall()
+        if status is not None:
+            status["total"] = len(rows)
+
+        for start in range(0, len(rows), PURGE_CHUNK):
+            chunk = rows[start:start + PURGE_CHUNK]
+            outcomes = list(pool.map(_unlink, [r["path"] for r in chunk]))
+            deleted = [r for r, ok in zip(chunk, outcomes) if ok]
+            paths = [r["path"] for r in deleted]
+            record_removed(db, paths)
+            marks = ",".join("?" * len(paths))
+            db.execute(f"""
+                UPDATE tracks SET status = 'deleted' WHERE status = 'trashed' AND id IN (
+                    SELECT track_id FROM file_actions WHERE action = 'trash' AND dest_path IN ({marks})
+                )
+            """, paths)
+            db.commit()
+
+            touched.update(Path(p).parent for p in paths)
+            deleted_count += len(deleted)
+            if status is not None:
+                status["deleted"] += len(deleted)
+                status["failed"] += len(chunk) - len(deleted)
+                status["bytes"] += sum(r["size"] for r in deleted)
+
+        if older_than_days is None and limit is None and not unscanned and deleted_count == len(rows):
+            # Everything is gone, including files of tracks trashed without a recorded action
+            db.execute("UPDATE tracks SET status = 'deleted' WHERE status = 'trashed'")
+            db.commit()
+        if status is not None:
+            status["phase"] = "cleaning"
+        # A full purge sweeps every empty directory; a slice only the ones it emptied
+        remove_empty_dirs(trash_dir, None if older_than_days is None else touched)
+    return deleted_count
+
+
+def _unlink(path: str) -> bool:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Could not delete {path}: {e}")
+        return False
+    return True
+
+
+def run_purge(trash_dir: Path, older_than_days: float = None, limit: int = None):
+    """Background task: purge the trash, reporting progress in purge_status."""
+    purge_status.update(running=True, phase="deleting", total=0, deleted=0, failed=0, bytes=0)
+    try:
+        deleted = purge_trash(trash_dir, older_than_days, limit, status=purge_status)
+        logger.info(f"Purged {deleted} files ({purge_status['bytes'] / 1024 / 1024:.1f} MB) from the trash")
+        purge_status["phase"] = "complete"
+    except Exception as e:
+        logger.error(f"Trash purge failed: {e}")
+        purge_status["phase"] = "failed"
+    finally:
+        purge_status["running"] = False
@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from database import get_db
+from file_manager import move_many
+from trash_ledger import record_removed
+
+logger = logging.getLogger(__name__)
+
+RESTORE_WORKERS = 8   # concurrent file moves
+RESTORE_CHUNK = 500   # files moved and committed together
+
+restore_status = {"running": False, "phase": "idle", "total": 0, "restored": 0, "failed": 0}
+
+# One bulk restore at a time, so two never move the same files
+_restore_lock = threading.Lock()
+
+
+def restore_candidates(
+    db, since: datetime = None, until: datetime = None, group_id: int = None, folder: str = None,
+) -> list:
+    """Trash actions of still-trashed tracks matching every given filter, oldest first.
+
+    ``since``/``until`` bound when the file was trashed, ``group_id`` picks the
+    members of one duplicate group and ``folder`` a top-level trash folder.
+    """
+    conditions = ["fa.action = 'trash'", "t.status = 'trashed'"]
+    params = []
+    if since is not None:
+        conditions.append("fa.performed_at >= ?")
+        params.append(_timestamp(since))
+    if until is not None:
+        conditions.append("fa.performed_at < ?")
+        params.append(_timestamp(until))
+    if group_id is not None:
+        conditions.append("fa.track_id IN (SELECT track_id FROM dupe_group_members WHERE group_id = ?)")
+        params.append(group_id)
+    if folder is not None:
+        conditions.append("fa.dest_path IN (SELECT path FROM trash_items WHERE folder = ?)")
+        params.append(folder)
+    return db.execute(f"""
+        SELECT fa.id, fa.track_id, fa.source_path, fa.dest_path FROM file_actions fa
+        JOIN tracks t ON t.id = fa.track_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY fa.performed_at, fa.id
+    """, params).fetchall()
+
+
+def _timestamp(value: datetime) -> str:
+    """A datetime in the UTC "YYYY-MM-DD HH:MM:SS" form of SQLite's CURRENT_TIMESTAMP; naive means UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def restore_actions(actions: list, workers: int = RESTORE_WORKERS, status: dict = None) -> int:
+    """Move trashed files back to where they came from.
+
+    Actions are handled RESTORE_CHUNK at a time: the moves run on a bounded
+    thread pool, then the chunk's tracks, file_actions and ledger entries are
+    committed together. A file whose original path is taken again is left in
+    the trash. Returns the number of files restored.
+    """
+    restored = 0
+    with _restore_lock, get_db() as db:
+        for start in range(0, len(actions), RESTORE_CHUNK):
+            chunk = actions[start:start + RESTORE_CHUNK]
+            claimed = set()
+            moves = []
+            for a in chunk:
+                if a["source_path"] in claimed or os.path.exists(a["source_path"]):
+                    logger.error(f"Not restoring {a['dest_path']}: {a['source_path']} already exists")
+                    continue
+                claimed.add(a["source_path"])
+                moves.append(a)
+
+            errors = move_many([(Path(a["dest_path"]), Path(a["source_path"])) for a in moves], workers)
+            done = []
+            for a, error in zip(moves, errors):
+                if error is not None:
+                    logger.error(f"Could not restore {a['dest_path']}: {error}")
+                    continue
+                done.append(a)
+
+            db.executemany("UPDATE tracks SET status = 'active' WHERE id = ?", [(a["track_id"],) for a in done])
+            db.executemany("DELETE FROM file_actions WHERE id = ?", [(a["id"],) for a in done])
+            record_removed(db, [a["dest_path"] for a in done])
+            db.commit()
+
+            restored += len(done)
+            if status is not None:
+                status["restored"] += len(done)
+                status["failed"] += len(chunk) - len(done)
+    return restored
+
+
+def run_restore(since: datetime = None, until: datetime = None, group_id: int = None, folder: str = None):
+    """Background task: restore every matching trashed file, reporting progress in restore_status."""
+    restore_status.update(running=True, phase="restoring", total=0, restored=0, failed=0)
+    try:
+        with get_db() as db:
+            actions = restore_candidates(db, since, until, group_id, folder)
+        restore_status["total"] = len(actions)
+        restored = restore_actions(actions, status=restore_status)
+        logger.info(f"Restored {restored} of {len(actions)} trashed files")
+        restore_status["phase"] = "complete"
+    except Exception as e:
+        logger.error(f"Bulk restore failed: {e}")
+        restore_status["phase"] = "failed"
+    finally:
+        restore_status["running"] = False
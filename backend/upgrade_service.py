@@ -4,7 +4,7 @@ import base64
 import json
 import logging
 from pathlib import Path
-from dedup import normalize_text
+from dedup import normalize_many, normalize_text
 
 logger = logging.getLogger(__name__)
 
@@ -198,16 +198,17 @@ async def find_album_match(artist: str, album: str, rate_limit: float = 3.0) ->
 
     n_artist = normalize_text(artist)
     n_album = normalize_text(album)
+    normalized = list(zip(
+        normalize_many(r["artist"] for r in results), normalize_many(r["title"] for r in results)
+    ))
 
     # Try exact match first
-    for r in results:
-        if normalize_text(r["artist"]) == n_artist and normalize_text(r["title"]) == n_album:
+    for r, (r_artist, r_title) in zip(results, normalized):
+        if r_artist == n_artist and r_title == n_album:
             return r
 
     # Try fuzzy (artist matches, album is substring)
-    for r in results:
-        r_artist = normalize_text(r["artist"])
-        r_title = normalize_text(r["title"])
+    for r, (r_artist, r_title) in zip(results, normalized):
         if r_artist == n_artist and (n_album in r_title or r_title in n_album):
             return r
 
@@ -229,20 +230,21 @@ async def find_and_match_track(
 
     n_title = normalize_text(title)
 
+    titles = normalize_many(t["title"] for t in tracks)
+
     # Try track number match first (most reliable)
     if track_number > 0:
-        for t in tracks:
-            if t["track_number"] == track_number and normalize_text(t["title"]) == n_title:
+        for t, t_title in zip(tracks, titles):
+            if t["track_number"] == track_number and t_title == n_title:
                 return {**t, "match_type": "exact", "album_tidal_id": album_match["tidal_id"]}
 
     # Try exact title match
-    for t in tracks:
-        if normalize_text(t["title"]) == n_title:
+    for t, t_title in zip(tracks, titles):
+        if t_title == n_title:
             return {**t, "match_type": "exact", "album_tidal_id": album_match["tidal_id"]}
 
     # Try fuzzy title match (substring)
-    for t in tracks:
-        t_title = normalize_text(t["title"])
+    for t, t_title in zip(tracks, titles):
         if n_title in t_title or t_title in n_title:
             return {**t, "match_type": "fuzzy", "album_tidal_id": album_match["tidal_id"]}
 
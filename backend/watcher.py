@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from scanner import AUDIO_EXTENSIONS, walk_audio_files
+
+try:
+    import watchfiles
+except ImportError:  # installed with uvicorn[standard]; watch mode is optional
+    watchfiles = None
+
+logger = logging.getLogger(__name__)
+
+# Filesystems that don't reliably deliver inotify events for changes made by other hosts
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p"}
+
+# Wait for this much quiet before handing a batch over, so a folder copy arrives as one batch
+DEBOUNCE_MS = 5000
+
+watch_status = {"running": False, "mode": "off", "batches": 0, "pending": 0, "last_batch_at": None}
+
+
+def resolve_mode(mode: str, path: Path) -> str:
+    """Turn the watch_mode setting into "events", "poll" or "off".
+
+    "auto" polls on network mounts and uses inotify events everywhere else.
+    """
+    if mode not in ("auto", "events", "poll"):
+        return "off"
+    if watchfiles is None:
+        logger.warning("watchfiles is not installed; watch mode disabled")
+        return "off"
+    if mode == "auto":
+        return "poll" if _filesystem_type(path) in NETWORK_FILESYSTEMS else "events"
+    return mode
+
+
+def _filesystem_type(path: Path) -> str:
+    """Type of the filesystem mounted closest above path, from /proc/mounts."""
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1]
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(mount) > len(best):
+                    best, fstype = mount, fields[2]
+    except OSError:
+        pass
+    return fstype
+
+
+def split_changes(changes: set[tuple]) -> tuple[set[str], set[str]]:
+    """Sort a watchfiles batch into (changed audio files, removed paths).
+
+    Added directories (e.g. an album moved in) are expanded to the audio files
+    inside them. Removed paths may be files or whole directories. A path that
+    was removed and recreated within the batch counts as changed.
+    """
+    changed, removed = set(), set()
+    for change, path in changes:
+        if change == watchfiles.Change.deleted:
+            removed.add(path)
+        elif os.path.isdir(path):
+            changed.update(entry.path for entry in walk_audio_files(path))
+        elif os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS:
+            changed.add(path)
+    for path in list(removed):
+        if os.path.exists(path):
+            removed.discard(path)
+            if os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS:
+                changed.add(path)
+    return changed, removed
+
+
+def watch_library(music_path: Path, mode: str, stop_event: threading.Event, poll_seconds: int = 300):
+    """Index library changes as they happen until stop_event is set.
+
+    Batches that arrive while a full scan is running are held back and applied
+    once it finishes.
+    """
+    from routes.scan import index_paths, scan_status
+
+    watch_status["running"] = True
+    watch_status["mode"] = mode
+    pending_changed, pending_removed = set(), set()
+    logger.info(f"Watching {music_path} for changes ({mode})")
+    try:
+        for changes in watchfiles.watch(
+            music_path, watch_filter=None, debounce=DEBOUNCE_MS, stop_event=stop_event,
+            force_polling=mode == "poll", poll_delay_ms=poll_seconds * 1000,
+            yield_on_timeout=True, raise_interrupt=False,
+        ):
+            changed, removed = split_changes(changes)
+            pending_changed = (pending_changed - removed) | changed
+            pending_removed = (pending_removed - changed) | removed
+            watch_status["pending"] = len(pending_changed) + len(pending_removed)
+            if not watch_status["pending"] or scan_status["running"]:
+                continue
+            try:
+                index_paths(pending_changed, pending_removed)
+            except Exception as e:
+                logger.error(f"Incremental indexing failed: {e}")
+            pending_changed, pending_removed = set(), set()
+            watch_status["pending"] = 0
+            watch_status["batches"] += 1
+            watch_status["last_batch_at"] = time.time()
+    finally:
+        watch_status["running"] = False
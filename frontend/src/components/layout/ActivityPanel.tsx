@@ -3,7 +3,6 @@ import { useUpgradeStatus } from '../../hooks/useUpgradeStatus'
 import { Loader2, CheckCircle, Download, Search, AlertTriangle } from 'lucide-react'
 
 const SCAN_PHASE_LABELS: Record<string, string> = {
-  counting: 'Counting files...',
   scanning: 'Scanning',
   cleaning: 'Cleaning stale records...',
   analyzing: 'Analyzing duplicates...',
@@ -17,7 +17,6 @@ interface Stats {
 const COLORS = ['#10B981', '#3b82f6', '#8b5cf6', '#ec4899', '#f59e0b', '#06b6d4']
 
 const PHASE_LABELS: Record<string, string> = {
-  counting: 'Counting files...',
   scanning: 'Scanning library...',
   cleaning: 'Removing stale records...',
   analyzing: 'Analyzing duplicates...',
@@ -115,7 +114,6 @@ export default function Dashboard() {
               : scan.phase === 'cleaning' ? 'Checking for removed files...'
               : scan.phase === 'analyzing' ? 'Finding duplicate groups...'
               : scan.phase === 'upgrades' ? 'Checking Tidal for lossless versions...'
-              : scan.phase === 'counting' ? 'Counting audio files...'
               : 'Starting...'
             }
           />
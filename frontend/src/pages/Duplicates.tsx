@@ -25,6 +25,14 @@ interface DupeGroup {
   member_ids: string
 }
 
+interface ResolveStatus {
+  running: boolean
+  phase: string
+  total: number
+  resolved: number
+  failed: number
+}
+
 interface DupeResult {
   group: DupeGroup
   members: Track[]
@@ -110,6 +118,9 @@ export default function Duplicates() {
       if (data.auto_resolved > 0) {
         parts.push(`${data.auto_resolved} auto-resolved`)
       }
+      if (data.skipped > 0) {
+        parts.push(`${data.skipped} untagged tracks skipped`)
+      }
       if (parts.length > 0) {
         toast.success(`Analysis complete — ${parts.join(', ')}`)
       } else {
@@ -145,7 +156,20 @@ export default function Duplicates() {
     try {
       const res = await fetch('/api/dupes/resolve-all', { method: 'POST' })
       if (!res.ok) throw new Error(await res.text())
-      toast.success(`Resolved all duplicate groups`)
+      const started = await res.json()
+      if (started.error) throw new Error(started.error)
+      // Resolving runs as a background job; wait for it to finish
+      let status: ResolveStatus
+      do {
+        await new Promise(resolve => setTimeout(resolve, 2000))
+        status = await fetch('/api/dupes/resolve-status').then(r => r.json())
+      } while (status.running)
+      if (status.phase === 'failed') throw new Error('Resolve failed')
+      if (status.failed > 0) {
+        toast.error(`Resolved ${status.resolved} groups, ${status.failed} failed`)
+      } else {
+        toast.success(`Resolved ${status.resolved} duplicate groups`)
+      }
       await fetchDupes()
     } catch {
       toast.error('Failed to resolve all')
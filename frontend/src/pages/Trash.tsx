@@ -20,12 +20,22 @@ interface TrashSize {
   size_mb: number
 }
 
+interface PurgeStatus {
+  running: boolean
+  phase: string
+  total: number
+  deleted: number
+  failed: number
+  bytes: number
+}
+
 export default function Trash() {
   const [items, setItems] = useState<TrashItem[]>([])
   const [size, setSize] = useState<TrashSize | null>(null)
   const [loading, setLoading] = useState(true)
   const [restoring, setRestoring] = useState<number | null>(null)
   const [showConfirm, setShowConfirm] = useState(false)
+  const [emptying, setEmptying] = useState(false)
 
   const fetchData = async () => {
     setLoading(true)
@@ -60,6 +70,7 @@ export default function Trash() {
 
   const handleEmpty = async () => {
     setShowConfirm(false)
+    setEmptying(true)
     try {
       const res = await fetch('/api/trash/empty', { method: 'POST' })
       if (!res.ok) {
@@ -67,11 +78,24 @@ export default function Trash() {
         toast.error(err?.detail || `Failed to empty trash (${res.status})`)
         return
       }
-      const data = await res.json()
-      toast.success(`Trash emptied — ${data.deleted} file${data.deleted !== 1 ? 's' : ''} deleted`)
+      // Deleting runs as a background job; wait for it to finish
+      let status: PurgeStatus
+      do {
+        await new Promise(resolve => setTimeout(resolve, 2000))
+        status = await fetch('/api/trash/purge-status').then(r => r.json())
+      } while (status.running)
+      if (status.phase === 'failed') {
+        toast.error('Failed to empty trash')
+      } else if (status.failed > 0) {
+        toast.error(`Deleted ${status.deleted} files, ${status.failed} could not be deleted`)
+      } else {
+        toast.success(`Trash emptied — ${status.deleted} file${status.deleted !== 1 ? 's' : ''} deleted`)
+      }
       fetchData()
     } catch {
       toast.error('Failed to empty trash — network error')
+    } finally {
+      setEmptying(false)
     }
   }
 
@@ -95,9 +119,9 @@ export default function Trash() {
     <div className="space-y-6">
       <div className="flex items-center justify-between">
         <h2 className="text-2xl font-bold font-[family-name:var(--font-family-display)]">Trash</h2>
-        <Button variant="danger" onClick={() => setShowConfirm(true)} disabled={items.length === 0}>
+        <Button variant="danger" onClick={() => setShowConfirm(true)} disabled={items.length === 0 || emptying}>
           <Trash2 className="w-4 h-4" />
-          Empty Trash
+          {emptying ? 'Emptying...' : 'Empty Trash'}
         </Button>
       </div>
 